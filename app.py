@@ -6,15 +6,26 @@ Excel 翻译器 Web 应用
 """
 
 import os
+import re
+import json
 import time
 import uuid
+import hashlib
+import threading
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, \
+    Response, stream_with_context
 from werkzeug.utils import secure_filename
-from google import genai
-from excel_translator import ExcelTranslator
+from excel_translator import ExcelTranslator, CellScope, TranslationMemory, TranslationCancelled, \
+    chinese_content_from_analysis, notify_progress, call_model, create_process_pool, DEFAULT_MODEL, \
+    DEFAULT_TERMINOLOGY_FILE, PERFORMANCE_REPORT_SUFFIX
+from job_manager import JobManager, Job
+from client_registry import ClientRegistry
+import metrics
 import logging
 import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -27,16 +38,75 @@ app.secret_key = 'excel-translator-secret-key-2024'  # 用于session和flash消
 # 配置文件上传
 UPLOAD_FOLDER = 'uploads'
 DOWNLOAD_FOLDER = 'downloads'
+MANIFEST_FOLDER = 'manifests'
+CHECKPOINT_FOLDER = 'checkpoints'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+TRANSLATION_WORKERS = int(os.environ.get('TRANSLATION_WORKERS', '2'))  # 同时执行的翻译任务数
+CPU_WORKERS = int(os.environ.get('CPU_WORKERS', str(os.cpu_count() or 1)))  # 解析和写回的进程数
+MAX_JOBS_PER_KEY = int(os.environ.get('MAX_JOBS_PER_KEY', '1'))  # 同一 API 密钥同时执行的任务数
+MAX_REQUESTS_PER_KEY = int(os.environ.get('MAX_REQUESTS_PER_KEY', '4'))  # 同一 API 密钥的在途请求数
+PACKING_LINGER_SECONDS = float(os.environ.get('PACKING_LINGER_MS', '50')) / 1000  # 未满额请求等待合并的时间
+MAX_CLIENTS = int(os.environ.get('MAX_CLIENTS', '32'))  # 保留的 API 客户端（连接池）数上限
+CLIENT_IDLE_SECONDS = int(os.environ.get('CLIENT_IDLE_SECONDS', '600'))  # API 客户端空闲多久后关闭
+REQUESTS_PER_MINUTE_PER_KEY = int(os.environ.get('REQUESTS_PER_MINUTE_PER_KEY', '0'))  # 每个密钥每分钟的请求配额，0 表示不限制
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '0'))  # 请求耗时超过该延迟百分位时发出对冲请求，0（默认）表示关闭
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', '0.05'))  # 对冲请求数占总请求数的比例上限
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))  # 翻译接口连续失败多少次后熔断
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '30'))  # 熔断后多久放行试探请求
+CELL_AUDIT = os.environ.get('CELL_AUDIT', '0') == '1'  # 是否在输出文件旁记录每个被修改单元格的审计文件
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', str(256 * 1024 * 1024)))  # 批量翻译请求的大小上限
+BATCH_FILE_WORKERS = int(os.environ.get('BATCH_FILE_WORKERS', '4'))  # 批量任务中同时翻译的文件数
+STORAGE_MAX_AGE_SECONDS = int(os.environ.get('STORAGE_MAX_AGE_SECONDS', str(7 * 24 * 3600)))  # 文件最长保留时间
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_BYTES', str(1024 * 1024 * 1024)))  # 上传、下载、任务日志和清单目录合计的容量上限
+EVICTION_INTERVAL_SECONDS = 300  # 两次清理之间的最短间隔
+MAX_REPORTED_UNTRANSLATED = 100  # 部分翻译的任务结果中列出的未翻译单元格数上限
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['DOWNLOAD_FOLDER'] = DOWNLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['MANIFEST_FOLDER'] = MANIFEST_FOLDER
+app.config['CHECKPOINT_FOLDER'] = CHECKPOINT_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_BATCH_SIZE  # 单文件上传在接口中按 MAX_FILE_SIZE 限制
 
 # 确保文件夹存在
 Path(UPLOAD_FOLDER).mkdir(exist_ok=True)
 Path(DOWNLOAD_FOLDER).mkdir(exist_ok=True)
+Path(MANIFEST_FOLDER).mkdir(exist_ok=True)
+Path(CHECKPOINT_FOLDER).mkdir(exist_ok=True)
+
+# 后台翻译任务
+job_manager = JobManager(max_workers=TRANSLATION_WORKERS,
+                         max_jobs_per_tenant=MAX_JOBS_PER_KEY)
+# 解析、提取和写回在进程池中执行，工作线程只负责等待 API 请求；子进程不从已启动任务线程的进程 fork
+cpu_pool = create_process_pool(CPU_WORKERS)
+
+# 每个 API 密钥一个长连接客户端和限流状态；可填写多个密钥组成密钥池，同一组密钥的任务共享密钥池和请求打包器
+client_registry = ClientRegistry(max_clients=MAX_CLIENTS,
+                                 idle_seconds=CLIENT_IDLE_SECONDS,
+                                 max_requests=MAX_REQUESTS_PER_KEY,
+                                 requests_per_minute=REQUESTS_PER_MINUTE_PER_KEY,
+                                 packing_linger=PACKING_LINGER_SECONDS,
+                                 hedge_percentile=HEDGE_PERCENTILE,
+                                 hedge_budget=HEDGE_BUDGET,
+                                 breaker_failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                                 breaker_reset_seconds=BREAKER_RESET_SECONDS)
+SSE_KEEPALIVE_SECONDS = 15  # 事件流无新事件时发送心跳的间隔
+
+# 上传文件名形如 name_内容哈希.xlsx（旧版本为 name_时间戳_uuid.xlsx），
+# 术语库匹配后追加 _terminology_matched_术语库版本
+UPLOAD_SUFFIX_PATTERN = re.compile(r'(_[0-9a-f]{16}|_\d+_[0-9a-f]{8})?(_terminology_matched(_[0-9a-f]{8})?)?$')
+
+# 单元格审计文件：<输出文件>.audit.jsonl
+AUDIT_SUFFIX = '.audit.jsonl'
+# 与主文件一起清理的附属文件：上传文件的分析结果、输出文件的任务结果、性能报告、单元格审计和未完成的输出
+COMPANION_SUFFIXES = ('.analysis.json', '.result.json', PERFORMANCE_REPORT_SUFFIX, AUDIT_SUFFIX, '.part')
+# 任务未完成的输出：<输出文件>.<随机 ID>.part，同一输出的并发任务各写各的临时文件
+PARTIAL_SUFFIX_PATTERN = re.compile(r'\.[0-9a-f]{32}\.part$')
+# 由上传文件派生的文件名后缀：术语库匹配结果（_terminology_matched_术语库版本）和译文（_translated_参数哈希）
+DERIVED_SUFFIX_PATTERN = re.compile(r'(_terminology_matched(_[0-9a-f]{8})?)?(_translated(_[0-9a-f]{8})?)?$')
+last_eviction = 0
+# 发布输出文件时持有，部分翻译的输出不会覆盖其他任务刚发布的完整结果
+publish_lock = threading.Lock()
 
 
 def allowed_file(filename):
@@ -45,24 +115,465 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def manifest_path_for(filename, tenant):
+    """
+    获取上传文件对应的增量翻译清单路径：manifests/<租户>/<工作簿>.json
+
+    同一租户（API 密钥）上传的同一工作簿的不同版本（内容哈希不同）共用一个清单；
+    不同租户的同名工作簿互不影响，也不会复用彼此的译文
+    """
+    return os.path.join(app.config['MANIFEST_FOLDER'], tenant, f"{workbook_key(filename)}.json")
+
+
+def file_digest(file_path):
+    """文件内容的 SHA-256 摘要"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def glossary_version():
+    """术语库版本：术语库文件内容的哈希，术语库更新后之前的匹配结果不再复用"""
+    if not os.path.exists(DEFAULT_TERMINOLOGY_FILE):
+        return '0' * 8
+    return file_digest(DEFAULT_TERMINOLOGY_FILE)[:8]
+
+
+def result_path_for(output_path):
+    """输出文件对应的任务结果路径"""
+    return f"{output_path}.result.json"
+
+
+def audit_path_for(output_path):
+    """开启 CELL_AUDIT 时输出文件对应的单元格审计文件路径（先删除上次执行留下的记录），否则为 None"""
+    if not CELL_AUDIT:
+        return None
+    audit_path = f"{output_path}{AUDIT_SUFFIX}"
+    if os.path.exists(audit_path):
+        os.remove(audit_path)
+    return audit_path
+
+
+def load_reusable_result(output_path):
+    """
+    查找可复用的输出：输出文件及其任务结果都存在时返回任务结果，否则返回 None
+    """
+    result_path = result_path_for(output_path)
+    result = None
+    if os.path.exists(output_path) and os.path.exists(result_path):
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            pass
+    metrics.CACHE_LOOKUPS.inc(cache='result', result='miss' if result is None else 'hit')
+    if result is not None:
+        mark_used(output_path)
+    return result
+
+
+def partial_path_for(output_path):
+    """本次执行的临时输出路径，完成后再替换为正式输出"""
+    return f"{output_path}.{uuid.uuid4().hex}.part"
+
+
+def publish_output(partial_path, output_path, result=None):
+    """
+    用临时输出替换正式输出；result 不为 None 时同时保存为可复用的任务结果
+
+    部分翻译的输出（result 为 None）在其他任务已经发布完整结果时直接丢弃
+
+    Returns:
+        bool: 是否已替换正式输出
+    """
+    with publish_lock:
+        if result is None and os.path.exists(result_path_for(output_path)):
+            os.remove(partial_path)
+            return False
+        os.replace(partial_path, output_path)
+        if result is not None:
+            save_result(output_path, result)
+        return True
+
+
+def save_result(output_path, result):
+    """保存任务结果，相同输入和参数再次提交时直接复用"""
+    temp_path = f"{result_path_for(output_path)}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(temp_path, result_path_for(output_path))
+
+
+def mark_used(file_path):
+    """更新文件的访问时间（不改变修改时间，分析结果仍然有效），清理时按最近使用时间计算"""
+    file_stat = os.stat(file_path)
+    os.utime(file_path, (time.time(), file_stat.st_mtime))
+
+
+def last_used(file_path):
+    """文件最近一次被写入或复用的时间"""
+    file_stat = os.stat(file_path)
+    return max(file_stat.st_mtime, file_stat.st_atime)
+
+
+def storage_group(filename):
+    """
+    文件所属的清理分组：上传文件名（不含扩展名）；由它派生的术语库匹配文件、译文和各自的附属文件
+    属于同一组，批量任务的压缩包自成一组
+    """
+    filename = PARTIAL_SUFFIX_PATTERN.sub('.part', filename, count=1)
+    for suffix in COMPANION_SUFFIXES:
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+            break
+    name = os.path.splitext(filename)[0]
+    return DERIVED_SUFFIX_PATTERN.sub('', name, count=1) or name
+
+
+def checkpoint_dir_for(filename):
+    """上传文件的任务日志目录：每个清理分组一个子目录，随分组一起清理"""
+    return os.path.join(app.config['CHECKPOINT_FOLDER'], storage_group(filename))
+
+
+def workbook_key(filename):
+    """工作簿标识：上传文件名去掉内容哈希和派生后缀，同一工作簿的不同版本相同"""
+    name = os.path.splitext(filename)[0]
+    return UPLOAD_SUFFIX_PATTERN.sub('', name, count=1) or name
+
+
+def remove_paths(paths):
+    """删除文件和目录，忽略已不存在的"""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def path_size(path):
+    """文件或目录（递归）的字节数"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+
+def path_last_used(path):
+    """文件或目录中文件最近一次被写入或复用的时间（空目录按目录的修改时间）"""
+    if not os.path.isdir(path):
+        return last_used(path)
+    return max([last_used(os.path.join(directory, name)) for directory, _, names in os.walk(path)
+                for name in names] or [os.stat(path).st_mtime])
+
+
+def storage_entries():
+    """
+    可清理的条目：每个上传分组（上传文件、派生的文件、输出、附属文件和任务日志目录）一个条目，
+    每个增量翻译清单和旧版本留下的任务日志文件各一个条目
+
+    Returns:
+        Dict: {条目名: 路径列表}；上传分组以分组名为键，清单以 manifest:<路径> 为键
+    """
+    entries = {}
+    for folder in (app.config['UPLOAD_FOLDER'], app.config['DOWNLOAD_FOLDER'], app.config['CHECKPOINT_FOLDER']):
+        for entry in os.scandir(folder):
+            if folder == app.config['CHECKPOINT_FOLDER'] and not entry.is_dir():
+                entries[f"checkpoint:{entry.path}"] = [entry.path]
+            elif entry.is_file() or entry.is_dir():
+                entries.setdefault(storage_group(entry.name), []).append(entry.path)
+    for directory, _, names in os.walk(app.config['MANIFEST_FOLDER']):
+        for name in names:
+            path = os.path.join(directory, name)
+            entries[f"manifest:{path}"] = [path]
+    return entries
+
+
+def evict_storage(force=False):
+    """
+    清理上传、下载、任务日志和清单目录：按分组整体删除（上传文件连同其派生文件、输出、附属文件和任务日志），
+    删除超过保留时间未使用的分组，合计超过容量上限时从最久未使用的开始删除；清单单独按最近使用时间清理，
+    工作簿的所有上传都已删除时清单随之删除。排队或执行中任务的分组和清单不会被删除
+    """
+    global last_eviction
+    now = time.time()
+    if not force and now - last_eviction < EVICTION_INTERVAL_SECONDS:
+        return
+    last_eviction = now
+    
+    filenames = [filename for job in job_manager.active_jobs()
+                 for filename in [job.params.get('filename', '')] + job.params.get('uploads', []) if filename]
+    groups_in_use = {storage_group(filename) for filename in filenames}
+    workbooks_in_use = {workbook_key(filename) for filename in filenames}
+    
+    entries = []
+    total_size = 0
+    for key, paths in storage_entries().items():
+        size = sum(path_size(path) for path in paths)
+        total_size += size
+        workbook = os.path.splitext(os.path.basename(key))[0] if key.startswith('manifest:') else None
+        if key in groups_in_use or workbook in workbooks_in_use:
+            continue
+        entries.append((max(path_last_used(path) for path in paths), key, paths, size))
+    
+    entries.sort()
+    removed = 0
+    for used_at, key, paths, size in entries:
+        if now - used_at <= STORAGE_MAX_AGE_SECONDS and total_size <= STORAGE_MAX_BYTES:
+            break
+        remove_paths(paths)
+        total_size -= size
+        removed += 1
+    
+    # 工作簿已没有任何上传版本时，其清单不再有用
+    workbooks = {workbook_key(entry.name) for entry in os.scandir(app.config['UPLOAD_FOLDER'])}
+    for _, key, paths, _ in entries:
+        if key.startswith('manifest:') and os.path.splitext(os.path.basename(key))[0] not in workbooks:
+            remove_paths(paths)
+    
+    if removed:
+        logger.info(f"已清理 {removed} 组文件，剩余 {total_size} 字节")
+
+
+def normalize_api_keys(value):
+    """
+    规范化 API 密钥字段：可填写多个密钥（逗号、分号或换行分隔）组成密钥池，去重后以逗号连接
+
+    Returns:
+        str: 规范化后的密钥串，未填写时为空字符串
+    """
+    return ','.join(dict.fromkeys(key for key in re.split(r'[\s,;]+', value or '') if key))
+
+
+def api_key_tenant(api_key):
+    """API 密钥的标识（哈希），用于按密钥限流，避免在内存中以明文区分密钥"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def create_job_translator(client_entry, translation_memory=None):
+    """
+    创建任务用的翻译器：共享进程池和该组 API 密钥的密钥池（客户端、限流状态）与请求打包器，
+    批量任务还共享译文缓存
+
+    Args:
+        client_entry: client_registry.lease 返回的客户端，任务执行期间保持占用
+    """
+    return client_registry.create_translator(client_entry,
+                                             scan_workers=1,
+                                             cpu_executor=cpu_pool,
+                                             translation_memory=translation_memory)
+
+
+def store_upload(source, original_filename):
+    """
+    按内容哈希保存上传的工作簿，相同内容只保存一份
+
+    Args:
+        source: 可读取的文件对象
+        original_filename: 原始文件名
+
+    Returns:
+        str: 保存后的文件名（原文件名_内容哈希.扩展名）
+    """
+    filename = secure_filename(original_filename)
+    name, ext = os.path.splitext(filename)
+    
+    # 先写入临时文件，再按内容哈希命名
+    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f".{uuid.uuid4().hex}.upload")
+    with metrics.STAGE_SECONDS.time(stage='upload'):
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        unique_filename = f"{name}_{file_digest(temp_path)[:16]}{ext}"
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    if os.path.exists(filepath):
+        os.remove(temp_path)
+        mark_used(filepath)
+        logger.info(f"文件已存在，复用已上传的文件: {unique_filename}")
+    else:
+        os.replace(temp_path, filepath)
+    return unique_filename
+
+
+def output_variant(parts, incremental=False, tenant=''):
+    """
+    输出文件名中的参数哈希；增量翻译复用所属租户清单中的译文，输出因租户而异，因此同时包含租户
+    """
+    if incremental:
+        parts = parts + ['incremental', tenant]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def translation_output_filename(filename, keywords, scope_options, incremental=False, tenant=''):
+    """
+    翻译输出文件名：由输入内容（已包含在上传文件名中）、关键词、模型和处理范围决定；
+    增量翻译还由租户决定，不同租户的增量翻译不会写入同一输出
+    """
+    name, ext = os.path.splitext(filename)
+    variant = output_variant([keywords, DEFAULT_MODEL, scope_options], incremental, tenant)[:8]
+    return f"{name}_translated_{variant}{ext}"
+
+
+def translate_upload(translator, filename, keywords, incremental, scope, scope_options, progress_callback,
+                     deadline=None, tenant=''):
+    """
+    翻译一个上传文件并保存可复用的任务结果（在任务线程中执行）；到达截止时间或部分单元格翻译失败时
+    输出部分翻译的文件，不保存为可复用的结果；增量翻译使用 tenant（api_key_tenant）的清单
+
+    Returns:
+        Dict: 任务结果（download_filename、output_size、本次执行的 performance；部分翻译时还有 partial、
+              untranslated_cells、untranslated）；性能报告同时保存在输出文件旁的 .perf.json 中
+    """
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    output_filename = translation_output_filename(filename, keywords, scope_options, incremental, tenant)
+    output_path = os.path.join(app.config['DOWNLOAD_FOLDER'], output_filename)
+    
+    # 从上传时的分析结果还原中文内容，不再重新解析工作簿
+    chinese_content = chinese_content_from_analysis(load_upload_analysis(filename), scope)
+    
+    reusable = load_reusable_result(output_path)
+    if reusable is not None:
+        notify_progress(progress_callback, 'reused', cells=sum(len(content) for content in chinese_content.values()))
+        return reusable
+    
+    # 进程重启后重新提交相同文件会从任务日志断点继续；先写入本次执行的临时文件，完成后再替换
+    partial_path = partial_path_for(output_path)
+    report = translator.translate_excel(
+        input_file=input_path,
+        output_file=partial_path,
+        keywords=keywords,
+        manifest_file=manifest_path_for(filename, tenant) if incremental else None,
+        checkpoint_dir=checkpoint_dir_for(filename),
+        scope=scope,
+        progress_callback=progress_callback,
+        chinese_content=chinese_content,
+        deadline=deadline,
+        report_file=f"{output_path}{PERFORMANCE_REPORT_SUFFIX}",
+        audit_file=audit_path_for(output_path)
+    )
+    
+    if not os.path.exists(partial_path):
+        raise RuntimeError('翻译完成但未生成输出文件')
+    
+    result = {
+        'download_filename': output_filename,
+        'output_size': os.path.getsize(partial_path)
+    }
+    if report['untranslated_cells']:
+        # 部分翻译的输出不复用；相同文件再次提交时从任务日志继续翻译其余单元格
+        if not publish_output(partial_path, output_path):
+            # 同一输出的另一个任务已经完成翻译
+            return dict(load_reusable_result(output_path), performance=report['performance'])
+        return dict(result, partial=True, deadline_reached=report['deadline_reached'],
+                    untranslated_cells=report['untranslated_cells'],
+                    untranslated=report['untranslated'][:MAX_REPORTED_UNTRANSLATED],
+                    performance=report['performance'])
+    publish_output(partial_path, output_path, result)
+    # 性能报告只属于本次执行，不写入可复用的结果
+    return dict(result, performance=report['performance'])
+
+
+def analysis_path_for(filename):
+    """上传文件的分析结果路径，与上传文件放在一起"""
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}.analysis.json")
+
+
+def load_upload_analysis(filename):
+    """
+    获取上传文件的分析结果（工作表、中文单元格记录、规模估算）
+
+    上传时已生成分析结果；不存在或已失效时（如术语库匹配生成的新文件）在进程池中重新分析并保存
+    """
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    analysis_file = analysis_path_for(filename)
+    translator = ExcelTranslator(api_key=None, cpu_executor=cpu_pool)
+    analysis = translator.load_analysis(analysis_file, file_path)
+    if analysis is None:
+        with metrics.STAGE_SECONDS.time(stage='parse'):
+            analysis = translator.run_cpu_stage('analyze_workbook', file_path, analysis_file)
+    return analysis
+
+
+def stored_upload_analysis(filename):
+    """已保存的上传文件分析结果，不存在或已失效时为 None（不重新分析）"""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(file_path):
+        return None
+    return ExcelTranslator(api_key=None).load_analysis(analysis_path_for(filename), file_path)
+
+
+def job_cost(filename):
+    """
+    任务调度用的规模：预计 token 数；在请求线程中调用，只读取上传时保存的分析结果（术语库匹配生成的文件
+    还没有分析结果，用其原上传文件的），不解析工作簿；都没有时按文件大小计
+    """
+    ext = os.path.splitext(filename)[1]
+    for candidate in dict.fromkeys([filename, f"{storage_group(filename)}{ext}"]):
+        analysis = stored_upload_analysis(candidate)
+        if analysis is not None:
+            return analysis['estimate']['estimated_tokens']
+    logger.warning(f"没有可用的分析结果，按文件大小估算任务规模: {filename}")
+    return os.path.getsize(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+
+def parse_deadline(value):
+    """
+    解析请求中的时间限制（秒），返回截止时间戳；未提供时返回 None
+
+    Raises:
+        ValueError: 时间限制不是正数
+    """
+    if value in (None, ''):
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('时间限制必须是秒数')
+    if seconds <= 0:
+        raise ValueError('时间限制必须大于 0')
+    return time.time() + seconds
+
+
+def job_dedupe_key(api_key, *parts):
+    """
+    计算任务去重键：同一 API 密钥对同一文件以相同参数重复提交时复用正在执行的任务
+    """
+    digest = hashlib.sha256(api_key.encode('utf-8'))
+    digest.update(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
 def test_gemini_api(api_key):
-    """测试 Gemini API 连接"""
+    """测试 Gemini API 连接；填写了多个密钥时逐个测试，并指出哪个密钥失败或响应异常"""
+    api_keys = api_key.split(',')
+    key_number = 1
+    
+    def key_label(number):
+        return f"第 {number} 个密钥" if len(api_keys) > 1 else ""
+    
     try:
-        client = genai.Client(api_key=api_key)
+        unexpected = []
+        # 使用密钥的共享客户端，测试通过后翻译任务直接复用已建立的连接
+        with client_registry.lease(api_keys) as client_entry:
+            for key_number, key in enumerate(client_entry.key_pool.keys, 1):
+                # 发送简单的测试请求，每个密钥的响应都要检查
+                response = call_model(key.client, "gemini-2.0-flash", "请回复'API连接成功'")
+                if not (response.text and "成功" in response.text):
+                    unexpected.append(f"{key_label(key_number)}API 响应: {(response.text or '')[:50]}...")
         
-        # 发送简单的测试请求
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents="请回复'API连接成功'"
-        )
-        
-        if response.text and "成功" in response.text:
-            return True, "API 连接成功"
-        else:
-            return True, f"API 响应: {response.text[:50]}..."
+        if unexpected:
+            return True, '；'.join(unexpected)
+        prefix = f"{len(api_keys)} 个密钥均" if len(api_keys) > 1 else ""
+        return True, f"{prefix}API 连接成功"
             
     except Exception as e:
-        return False, f"API 连接失败: {str(e)}"
+        # 无效的密钥不保留客户端
+        client_registry.discard(api_keys)
+        return False, f"{key_label(key_number)}API 连接失败: {str(e)}"
 
 
 @app.route('/')
@@ -76,7 +587,7 @@ def test_connection():
     """测试 API 连接"""
     try:
         data = request.get_json()
-        api_key = data.get('api_key', '').strip()
+        api_key = normalize_api_keys(data.get('api_key', ''))
         
         if not api_key:
             return jsonify({
@@ -118,25 +629,33 @@ def upload_file():
             })
         
         if file and allowed_file(file.filename):
-            # 生成唯一文件名
-            timestamp = int(time.time())
-            unique_id = str(uuid.uuid4())[:8]
-            filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            unique_filename = f"{name}_{timestamp}_{unique_id}{ext}"
+            if request.content_length and request.content_length > MAX_FILE_SIZE:
+                return too_large(None)
+            
+            evict_storage()
             
+            # 相同内容重复上传只保存一份
+            filename = secure_filename(file.filename)
+            unique_filename = store_upload(file.stream, file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
             
             # 获取文件信息
             file_size = os.path.getsize(filepath)
             
+            # 流式扫描一次并保存分析结果，文件信息、任务调度和翻译都复用它
+            try:
+                estimate = load_upload_analysis(unique_filename)['estimate']
+            except Exception as e:
+                logger.warning(f"无法分析上传文件: {unique_filename}: {str(e)}")
+                estimate = None
+            
             return jsonify({
                 'success': True,
                 'message': '文件上传成功',
                 'filename': unique_filename,
                 'original_name': filename,
-                'size': file_size
+                'size': file_size,
+                'estimate': estimate
             })
         else:
             return jsonify({
@@ -154,11 +673,11 @@ def upload_file():
 
 @app.route('/api/terminology-match', methods=['POST'])
 def terminology_match():
-    """术语库匹配接口"""
+    """术语库匹配接口：提交后台任务，立即返回任务 ID"""
     try:
         data = request.get_json()
         
-        api_key = data.get('api_key', '').strip()
+        api_key = normalize_api_keys(data.get('api_key', ''))
         filename = data.get('filename', '').strip()
         
         # 验证参数
@@ -182,33 +701,68 @@ def terminology_match():
                 'message': '文件不存在，请重新上传'
             })
         
-        # 生成输出文件名
+        # 输出文件名由输入内容（已包含在上传文件名中）和术语库版本决定
         name, ext = os.path.splitext(filename)
-        output_filename = f"{name}_terminology_matched{ext}"
+        output_filename = f"{name}_terminology_matched_{glossary_version()}{ext}"
         output_path = os.path.join(app.config['DOWNLOAD_FOLDER'], output_filename)
         
-        # 执行术语库匹配
-        logger.info(f"开始术语库匹配: {filename}")
-        translator = ExcelTranslator(api_key=api_key)
+        reusable = load_reusable_result(output_path)
+        if reusable is not None:
+            job = job_manager.add_completed('terminology', {'filename': filename}, reusable,
+                                            '已复用相同文件和术语库的匹配结果')
+            return jsonify({
+                'success': True,
+                'message': '已复用之前的术语库匹配结果',
+                'job_id': job.id
+            })
         
-        # 应用术语库匹配
-        replacement_count = translator.apply_terminology_matching(
-            input_file=input_path,
-            output_file=output_path
-        )
+        def run_terminology_match(job):
+            logger.info(f"开始术语库匹配: {filename}")
+            with client_registry.lease(api_key.split(',')) as client_entry:
+                translator = create_job_translator(client_entry)
+                
+                # 应用术语库匹配；先写入本次执行的临时文件，避免中断时留下不完整的输出被复用
+                partial_path = partial_path_for(output_path)
+                replacement_count = translator.apply_terminology_matching(
+                    input_file=input_path,
+                    output_file=partial_path,
+                    progress_callback=job.handle_event,
+                    terminology_dict=client_registry.terminology(DEFAULT_TERMINOLOGY_FILE),
+                    audit_file=audit_path_for(output_path)
+                )
+            file_size = os.path.getsize(partial_path)
+            
+            # 术语库命中率：替换的单元格占中文单元格的比例
+            chinese_cells = load_upload_analysis(filename)['chinese_cells']
+            metrics.GLOSSARY_CELLS.inc(replacement_count, result='hit')
+            metrics.GLOSSARY_CELLS.inc(max(0, chinese_cells - replacement_count), result='miss')
+            
+            # 同时将匹配后的文件复制到uploads文件夹以供后续翻译使用（同样先复制到临时文件再替换）
+            matched_upload_filename = output_filename
+            matched_upload_path = os.path.join(app.config['UPLOAD_FOLDER'], matched_upload_filename)
+            matched_partial_path = partial_path_for(matched_upload_path)
+            shutil.copy2(partial_path, matched_partial_path)
+            os.replace(matched_partial_path, matched_upload_path)
+            
+            result = {
+                'message': f'术语库匹配完成，共替换 {replacement_count} 个术语',
+                'download_filename': output_filename,
+                'matched_filename': matched_upload_filename,  # 用于后续翻译的文件名
+                'replacement_count': replacement_count,
+                'file_size': file_size
+            }
+            publish_output(partial_path, output_path, result)
+            return result
         
-        # 同时将匹配后的文件复制到uploads文件夹以供后续翻译使用
-        matched_upload_filename = f"{name}_terminology_matched{ext}"
-        matched_upload_path = os.path.join(app.config['UPLOAD_FOLDER'], matched_upload_filename)
-        shutil.copy2(output_path, matched_upload_path)
+        job = job_manager.submit('terminology', {'filename': filename}, run_terminology_match,
+                                 dedupe_key=job_dedupe_key(api_key, 'terminology', output_filename),
+                                 tenant=api_key_tenant(api_key),
+                                 cost=job_cost(filename))
         
         return jsonify({
             'success': True,
-            'message': f'术语库匹配完成，共替换 {replacement_count} 个术语',
-            'download_filename': output_filename,
-            'matched_filename': matched_upload_filename,  # 用于后续翻译的文件名
-            'replacement_count': replacement_count,
-            'file_size': os.path.getsize(output_path)
+            'message': '术语库匹配任务已提交',
+            'job_id': job.id
         })
         
     except Exception as e:
@@ -221,13 +775,24 @@ def terminology_match():
 
 @app.route('/api/translate', methods=['POST'])
 def translate_excel():
-    """Excel 翻译接口"""
+    """Excel 翻译接口：提交后台翻译任务，立即返回任务 ID"""
     try:
         data = request.get_json()
         
-        api_key = data.get('api_key', '').strip()
+        api_key = normalize_api_keys(data.get('api_key', ''))
         filename = data.get('filename', '').strip()
         keywords = data.get('keywords', '').strip()
+        incremental = bool(data.get('incremental', False))
+        
+        # 处理范围：工作表、单元格区域、隐藏内容与公式；时间限制从提交时开始计算（含排队时间）
+        try:
+            scope = CellScope.from_dict(data.get('scope'))
+            deadline = parse_deadline(data.get('deadline'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            })
         
         # 验证参数
         if not api_key:
@@ -250,45 +815,354 @@ def translate_excel():
                 'message': '文件不存在，请重新上传'
             })
         
-        # 生成输出文件名
-        name, ext = os.path.splitext(filename)
-        output_filename = f"{name}_translated{ext}"
+        # 输出文件名由输入内容（已包含在上传文件名中）、关键词、模型和处理范围（增量翻译还有租户）决定
+        output_filename = translation_output_filename(filename, keywords, data.get('scope'), incremental,
+                                                      api_key_tenant(api_key))
         output_path = os.path.join(app.config['DOWNLOAD_FOLDER'], output_filename)
+        params = {
+            'filename': filename,
+            'keywords': keywords,
+            'incremental': incremental
+        }
         
-        # 执行翻译
-        logger.info(f"开始翻译文件: {filename}")
-        translator = ExcelTranslator(api_key=api_key)
+        reusable = load_reusable_result(output_path)
+        if reusable is not None:
+            job = job_manager.add_completed('translate', params, reusable, '已复用相同文件和参数的翻译结果')
+            return jsonify({
+                'success': True,
+                'message': '已复用之前的翻译结果',
+                'job_id': job.id
+            })
         
-        # 这里我们需要在后台执行翻译，返回任务ID
-        # 为了简化，这里直接执行翻译
-        translator.translate_excel(
-            input_file=input_path,
-            output_file=output_path,
-            keywords=keywords
-        )
+        def run_translation(job):
+            logger.info(f"开始翻译文件: {filename}")
+            with client_registry.lease(api_key.split(',')) as client_entry:
+                translator = create_job_translator(client_entry)
+                result = translate_upload(translator, filename, keywords, incremental, scope, data.get('scope'),
+                                          job.handle_event, deadline, api_key_tenant(api_key))
+            # 各密钥的用量只属于本次执行，不写入可复用的结果
+            return dict(result, key_usage=translator.key_usage)
         
-        # 检查输出文件是否生成
-        if os.path.exists(output_path):
-            file_size = os.path.getsize(output_path)
+        # 同一密钥写入同一输出的任务只执行一个（时间限制不同也复用正在执行的任务）
+        job = job_manager.submit('translate', params, run_translation,
+                                 dedupe_key=job_dedupe_key(api_key, 'translate', output_filename),
+                                 tenant=api_key_tenant(api_key), cost=job_cost(filename))
+        
+        return jsonify({
+            'success': True,
+            'message': '翻译任务已提交',
+            'job_id': job.id
+        })
             
+    except Exception as e:
+        logger.error(f"提交翻译任务时出错: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'翻译失败: {str(e)}'
+        })
+
+
+def collect_batch_uploads(files):
+    """
+    保存批量请求中的工作簿：直接上传的 Excel 文件和 zip 包内的 Excel 文件
+
+    Returns:
+        Tuple: ([(原文件名, 保存后的文件名)]，按内容去重), [跳过的文件说明]
+    """
+    uploads = {}
+    skipped = []
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                skipped.append(f'{file.filename}: 无效的 zip 文件')
+                continue
+            with archive:
+                for member in archive.infolist():
+                    # 只取文件名，忽略压缩包内的目录结构和系统生成的文件
+                    member_name = os.path.basename(member.filename)
+                    if member.is_dir() or not member_name or member_name.startswith('.') \
+                            or member.filename.startswith('__MACOSX'):
+                        continue
+                    if not allowed_file(member_name):
+                        skipped.append(f'{member.filename}: 文件类型不支持')
+                    elif member.file_size > MAX_FILE_SIZE:
+                        skipped.append(f'{member.filename}: 文件过大')
+                    else:
+                        with archive.open(member) as source:
+                            uploads.setdefault(store_upload(source, member_name), member_name)
+        elif allowed_file(file.filename):
+            uploads.setdefault(store_upload(file.stream, file.filename), file.filename)
+        else:
+            skipped.append(f'{file.filename}: 文件类型不支持')
+    return [(original_name, filename) for filename, original_name in uploads.items()], skipped
+
+
+def batch_archive_names(uploads, results):
+    """批量结果压缩包内的文件名：原文件名加 _translated，重名时追加序号"""
+    names = []
+    used = set()
+    for (original_name, _), result in zip(uploads, results):
+        if 'download_filename' not in result:
+            continue
+        name, ext = os.path.splitext(secure_filename(original_name) or 'workbook.xlsx')
+        archive_name = f"{name}_translated{ext}"
+        counter = 2
+        while archive_name in used:
+            archive_name = f"{name}_translated_{counter}{ext}"
+            counter += 1
+        used.add(archive_name)
+        names.append((archive_name, result['download_filename']))
+    return names
+
+
+@app.route('/api/batch', methods=['POST'])
+def translate_batch():
+    """
+    批量翻译接口：上传多个 Excel 文件或 zip 包，提交一个批量任务，完成后下载包含所有译文的 zip
+
+    表单字段: api_key, keywords, scope（JSON 字符串）, incremental, deadline（秒，可选）, files（可重复）
+    """
+    try:
+        api_key = normalize_api_keys(request.form.get('api_key', ''))
+        keywords = request.form.get('keywords', '').strip()
+        incremental = request.form.get('incremental', '').lower() in ('1', 'true', 'on')
+        
+        if not api_key:
             return jsonify({
-                'success': True,
-                'message': '翻译完成',
-                'download_filename': output_filename,
-                'output_size': file_size
+                'success': False,
+                'message': 'API 密钥不能为空'
             })
-        else:
+        
+        try:
+            scope_options = json.loads(request.form['scope']) if request.form.get('scope') else None
+            scope = CellScope.from_dict(scope_options)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'无效的翻译范围: {str(e)}'
+            })
+        
+        try:
+            deadline = parse_deadline(request.form.get('deadline'))
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': '翻译完成但未生成输出文件'
+                'message': str(e)
             })
+        
+        evict_storage()
+        uploads, skipped = collect_batch_uploads(request.files.getlist('files'))
+        if not uploads:
+            return jsonify({
+                'success': False,
+                'message': '没有可翻译的 Excel 文件',
+                'skipped': skipped
+            })
+        
+        # 批量结果由所有输入文件的内容和翻译参数决定，相同批次再次提交时直接复用
+        filenames = sorted(filename for _, filename in uploads)
+        batch_key = output_variant([filenames, keywords, DEFAULT_MODEL, scope_options], incremental,
+                                   api_key_tenant(api_key))[:16]
+        output_filename = f"batch_{batch_key}.zip"
+        output_path = os.path.join(app.config['DOWNLOAD_FOLDER'], output_filename)
+        params = {
+            'filename': output_filename,
+            'files': [original_name for original_name, _ in uploads],
+            'uploads': [filename for _, filename in uploads],
+            'keywords': keywords,
+            'incremental': incremental
+        }
+        
+        reusable = load_reusable_result(output_path)
+        if reusable is not None:
+            job = job_manager.add_completed('batch', params, reusable, '已复用相同批次的翻译结果')
+            return jsonify({
+                'success': True,
+                'message': '已复用之前的批量翻译结果',
+                'job_id': job.id,
+                'skipped': skipped
+            })
+        
+        def run_batch(job):
+            logger.info(f"开始批量翻译 {len(uploads)} 个文件")
+            
+            # 同一批次的所有文件共享译文缓存，相同文本只翻译一次
+            translation_memory = TranslationMemory()
+            key_usage = {}  # 所有文件按密钥累计的用量
+            total_cells = sum(sum(len(content) for content in
+                                  chinese_content_from_analysis(load_upload_analysis(filename), scope).values())
+                              for _, filename in uploads)
+            job.handle_event({'type': 'stage', 'stage': 'translate', 'total': total_cells})
             
+            def file_progress(event):
+                # 各文件自己的阶段切换不改变批次的阶段和总量
+                if event['type'] != 'stage':
+                    job.handle_event(event)
+                elif job.cancel_event.is_set():
+                    raise TranslationCancelled("任务已取消")
+            
+            def run_file(client_entry, original_name, filename):
+                translator = create_job_translator(client_entry, translation_memory)
+                translator.key_usage = key_usage
+                try:
+                    result = translate_upload(translator, filename, keywords, incremental, scope, scope_options,
+                                              file_progress, deadline, api_key_tenant(api_key))
+                    job.handle_event({'type': 'file', 'file': original_name, 'status': Job.COMPLETED})
+                    return result
+                except TranslationCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"批量任务中的文件翻译失败: {original_name}: {str(e)}")
+                    job.handle_event({'type': 'file', 'file': original_name, 'status': Job.FAILED,
+                                      'message': str(e)})
+                    return {'error': str(e)}
+            
+            with client_registry.lease(api_key.split(',')) as client_entry, \
+                    ThreadPoolExecutor(max_workers=BATCH_FILE_WORKERS, thread_name_prefix='batch') as executor:
+                futures = [executor.submit(run_file, client_entry, original_name, filename)
+                           for original_name, filename in uploads]
+                results = []
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except TranslationCancelled:
+                        results.append(None)
+            if job.cancel_event.is_set():
+                raise TranslationCancelled("任务已取消")
+            
+            job.handle_event({'type': 'stage', 'stage': 'write'})
+            partial_path = partial_path_for(output_path)
+            with zipfile.ZipFile(partial_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for archive_name, download_filename in batch_archive_names(uploads, results):
+                    archive.write(os.path.join(app.config['DOWNLOAD_FOLDER'], download_filename), archive_name)
+            
+            files = [dict({name: value for name, value in result.items() if name != 'performance'}, file=original_name)
+                     for (original_name, _), result in zip(uploads, results)]
+            failed = sum(1 for result in results if 'error' in result)
+            partial = sum(1 for result in results if result.get('partial'))
+            message = f'批量翻译完成，成功 {len(results) - failed} 个，失败 {failed} 个'
+            if partial:
+                message += f'，其中 {partial} 个只翻译了部分内容'
+            result = {
+                'message': message,
+                'download_filename': output_filename,
+                'output_size': os.path.getsize(partial_path),
+                'files': files,
+                'cached_texts': len(translation_memory)
+            }
+            # 有文件失败或只部分翻译时不保存结果，重新提交会继续翻译这些文件（已完成的文件直接复用）
+            if failed or partial:
+                if not publish_output(partial_path, output_path):
+                    # 同一批次的另一个任务已经全部完成
+                    result = load_reusable_result(output_path)
+            else:
+                publish_output(partial_path, output_path, result)
+            performance = {original_name: result['performance'] for (original_name, _), result in zip(uploads, results)
+                           if 'performance' in result}
+            return dict(result, key_usage=key_usage, performance=performance)
+        
+        job = job_manager.submit('batch', params, run_batch,
+                                 dedupe_key=job_dedupe_key(api_key, 'batch', output_filename),
+                                 tenant=api_key_tenant(api_key),
+                                 cost=sum(job_cost(filename) for _, filename in uploads))
+        
+        return jsonify({
+            'success': True,
+            'message': f'批量翻译任务已提交，共 {len(uploads)} 个文件',
+            'job_id': job.id,
+            'skipped': skipped
+        })
+        
     except Exception as e:
-        logger.error(f"翻译时出错: {str(e)}")
+        logger.error(f"提交批量翻译任务时出错: {str(e)}")
         return jsonify({
             'success': False,
-            'message': f'翻译失败: {str(e)}'
+            'message': f'批量翻译失败: {str(e)}'
+        })
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """查询任务状态和进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': '任务不存在或已过期'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """
+    以 Server-Sent Events 推送任务事件：阶段切换、块完成、缓存命中、预计剩余时间、错误和结束状态
+    
+    断线重连时浏览器会携带 Last-Event-ID，从该事件之后继续推送
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': '任务不存在或已过期'
+        }), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('after', '0')
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+    
+    def generate():
+        seq = after
+        while True:
+            events, finished = job.wait_events(seq, timeout=SSE_KEEPALIVE_SECONDS)
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished and not events:
+                break
+            if not events:
+                # 保持连接，避免被代理判定为空闲超时
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务"""
+    if not job_manager.cancel(job_id):
+        return jsonify({
+            'success': False,
+            'message': '任务不存在或已结束'
         })
+    
+    return jsonify({
+        'success': True,
+        'message': '已请求取消任务'
+    })
+
+
+@app.route('/api/jobs/<job_id>/download')
+def download_job_result(job_id):
+    """下载已完成任务的结果文件"""
+    job = job_manager.get(job_id)
+    if job is None or job.status != Job.COMPLETED or not job.result:
+        return jsonify({
+            'success': False,
+            'message': '任务不存在或尚未完成'
+        }), 404
+    
+    return download_file(job.result['download_filename'])
 
 
 @app.route('/api/download/<filename>')
@@ -325,33 +1199,17 @@ def get_file_info(filename):
                 'message': '文件不存在'
             })
         
-        # 简单分析文件（提取中文单元格数量等）
+        # 读取上传时保存的分析结果，不再加载工作簿
         try:
-            from openpyxl import load_workbook
-            import re
-            
-            workbook = load_workbook(file_path)
-            chinese_pattern = re.compile(r'[\u4e00-\u9fff]+')
-            
-            total_sheets = len(workbook.sheetnames)
-            chinese_cells = 0
-            
-            for sheet_name in workbook.sheetnames:
-                worksheet = workbook[sheet_name]
-                for row in worksheet.iter_rows():
-                    for cell in row:
-                        if cell.value and isinstance(cell.value, str):
-                            if chinese_pattern.search(cell.value):
-                                chinese_cells += 1
-            
-            workbook.close()
+            analysis = load_upload_analysis(filename)
             
             return jsonify({
                 'success': True,
                 'info': {
-                    'total_sheets': total_sheets,
-                    'chinese_cells': chinese_cells,
-                    'sheets': workbook.sheetnames if 'workbook' in locals() else []
+                    'total_sheets': len(analysis['sheets']),
+                    'chinese_cells': analysis['chinese_cells'],
+                    'sheets': [sheet['name'] for sheet in analysis['sheets']],
+                    'estimate': analysis['estimate']
                 }
             })
             
@@ -371,12 +1229,32 @@ def get_file_info(filename):
         })
 
 
+def folder_size(folder):
+    """目录中文件（含子目录）的总字节数"""
+    return path_size(folder)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文本格式的运行指标：任务、各阶段耗时、API 调用、token、缓存和术语库命中、存储占用"""
+    job_stats = job_manager.stats()
+    for state, count in job_stats['states'].items():
+        metrics.JOBS.set(count, state=state)
+    metrics.QUEUE_DEPTH.set(job_stats['queued'])
+    metrics.STORAGE_BYTES.set(folder_size(app.config['UPLOAD_FOLDER']), folder='uploads')
+    metrics.STORAGE_BYTES.set(folder_size(app.config['DOWNLOAD_FOLDER']), folder='downloads')
+    metrics.STORAGE_BYTES.set(folder_size(app.config['CHECKPOINT_FOLDER']), folder='checkpoints')
+    metrics.STORAGE_BYTES.set(folder_size(app.config['MANIFEST_FOLDER']), folder='manifests')
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/health')
 def health_check():
     """健康检查接口"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': time.time()
+        'timestamp': time.time(),
+        'api_clients': client_registry.stats()
     })
 
 
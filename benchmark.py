@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准
+用 create_synthetic_excel 生成不同规模的合成工作簿，分别计时提取、术语库匹配、翻译（本地模拟接口，不访问网络）
+和写回；结果输出为 JSON，可与之前版本的结果比较，发现性能回退
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import openpyxl
+
+from create_sample_excel import create_synthetic_excel
+from excel_translator import ExcelTranslator, DEFAULT_REQUEST_CONCURRENCY, create_process_pool, format_table
+from instrumentation import write_report
+
+logger = logging.getLogger(__name__)
+
+# 结果格式版本
+BENCHMARK_VERSION = 1
+
+# 预设场景：create_synthetic_excel 的参数
+SCENARIOS = {
+    'small': {'sheets': 2, 'rows': 200, 'columns': 6, 'glossary_size': 50},
+    'medium': {'sheets': 4, 'rows': 2000, 'columns': 8, 'glossary_size': 200},
+    'large': {'sheets': 8, 'rows': 10000, 'columns': 10, 'glossary_size': 2000},
+    'repetitive': {'sheets': 4, 'rows': 2000, 'columns': 8, 'repetition': 0.9, 'glossary_size': 200},
+    'long-text': {'sheets': 2, 'rows': 1000, 'columns': 6, 'long_text_ratio': 0.5, 'glossary_size': 200},
+    'merged': {'sheets': 4, 'rows': 2000, 'columns': 8, 'merged_density': 0.3, 'glossary_size': 200},
+}
+DEFAULT_SCENARIOS = ('small', 'medium')
+
+# 计时的阶段，按执行顺序
+BENCHMARK_STAGES = ('terminology', 'extract', 'translate', 'write')
+
+# 比较结果时，阶段耗时超过基准的该倍数且差值超过 REGRESSION_MIN_SECONDS 视为回退
+REGRESSION_THRESHOLD = 1.2
+REGRESSION_MIN_SECONDS = 0.05
+
+
+class FakeResponse:
+    """模拟接口的响应"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModels:
+    """按提示词逐行返回确定的 ASCII 译文（每个汉字的码点），可设置每次请求的延迟模拟网络耗时"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def generate_content(self, model: str, contents: str, **kwargs) -> FakeResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        lines = contents.split('\n')
+        if '待翻译文本:' in lines:
+            # 批量翻译：去掉每行的编号
+            texts = [line.split('. ', 1)[1] for line in lines[lines.index('待翻译文本:') + 1:] if '. ' in line]
+        else:
+            texts = [lines[-1]]
+        return FakeResponse('\n'.join(fake_translation(text) for text in texts))
+
+
+class FakeClient:
+    """本地模拟的 Gemini 客户端，不访问网络"""
+
+    def __init__(self, latency: float = 0.0):
+        self.models = FakeModels(latency)
+
+
+def fake_translation(text: str) -> str:
+    """确定的模拟译文，长度与原文成比例"""
+    return ''.join(f"{ord(char):x}" if ord(char) > 127 else char for char in text)
+
+
+def git_revision() -> Optional[str]:
+    """当前代码的 git 提交，不在仓库中时为 None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict:
+    """运行环境，比较结果时应在相同环境下运行"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'openpyxl': openpyxl.__version__,
+        'git_revision': git_revision()
+    }
+
+
+def summarize(values: List[float]) -> Dict:
+    """多次运行的中位数、最小值和最大值"""
+    return {'median': round(statistics.median(values), 4), 'min': round(min(values), 4),
+            'max': round(max(values), 4)}
+
+
+def run_scenario(name: str, params: Dict, work_dir: str, repeat: int = 3, latency: float = 0.0,
+                 request_concurrency: int = DEFAULT_REQUEST_CONCURRENCY, scan_workers: Optional[int] = None,
+                 cpu_executor: Optional[ProcessPoolExecutor] = None) -> Dict:
+    """
+    生成一个场景的工作簿并重复运行完整流程：术语库匹配（有术语库时）、提取、翻译、写回
+
+    Args:
+        name: 场景名
+        params: create_synthetic_excel 的参数
+        work_dir: 存放生成文件和输出的目录
+        repeat: 重复次数，各阶段取中位数
+        latency: 模拟接口每次请求的延迟（秒）
+        request_concurrency: 同时发出的请求数
+        scan_workers: 扫描工作表的进程数，None 表示翻译器默认值
+        cpu_executor: 提取和写回使用的进程池，None 表示在当前进程执行
+
+    Returns:
+        Dict: 场景参数、工作簿统计、各阶段的墙钟和 CPU 时间、请求数、峰值内存和吞吐量
+    """
+    input_file = os.path.join(work_dir, f"{name}.xlsx")
+    glossary_file = os.path.join(work_dir, f"{name}_glossary.xlsx")
+    matched_file = os.path.join(work_dir, f"{name}_matched.xlsx")
+    output_file = os.path.join(work_dir, f"{name}_translated.xlsx")
+
+    started = time.perf_counter()
+    workbook = create_synthetic_excel(input_file, glossary_file=glossary_file, **params)
+    generate_seconds = time.perf_counter() - started
+    terminology_dict = {}
+    if params.get('glossary_size'):
+        terminology_dict = ExcelTranslator(api_key=None).load_terminology(glossary_file)
+
+    runs = []
+    for _ in range(repeat):
+        translator = ExcelTranslator(api_key=None, client=FakeClient(latency), request_concurrency=request_concurrency,
+                                     scan_workers=scan_workers, cpu_executor=cpu_executor)
+        stages = {}
+        source_file = input_file
+        if terminology_dict:
+            translator.apply_terminology_matching(input_file, matched_file, terminology_dict=terminology_dict)
+            stages.update(translator.instrumentation.report()['stages'])
+            source_file = matched_file
+        result = translator.translate_excel(source_file, output_file)
+        performance = result['performance']
+        stages.update(performance['stages'])
+        runs.append({'stages': stages,
+                     'requests': performance['requests']['count'],
+                     'translated_cells': result['translated_cells'],
+                     'peak_rss_mb': performance['process_peak_rss_mb'],
+                     'worker_peak_rss_mb': performance['worker_process_peak_rss_mb']})
+
+    stage_results = {}
+    for stage in BENCHMARK_STAGES:
+        if stage not in runs[0]['stages']:
+            continue
+        stage_results[stage] = {'wall_seconds': summarize([run['stages'][stage]['wall_seconds'] for run in runs]),
+                                'cpu_seconds': summarize([run['stages'][stage]['cpu_seconds'] for run in runs])}
+    total_seconds = [sum(stage['wall_seconds'] for stage in run['stages'].values()) for run in runs]
+    peaks = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    worker_peaks = [run['worker_peak_rss_mb'] for run in runs if run['worker_peak_rss_mb'] is not None]
+    return {
+        'params': params,
+        'workbook': dict(workbook, generate_seconds=round(generate_seconds, 4)),
+        'stages': stage_results,
+        'total_seconds': summarize(total_seconds),
+        'cells_per_second': round(workbook['chinese_cells'] / statistics.median(total_seconds), 1),
+        'requests': runs[-1]['requests'],
+        'translated_cells': runs[-1]['translated_cells'],
+        'peak_rss_mb': max(peaks) if peaks else None,
+        'worker_peak_rss_mb': max(worker_peaks) if worker_peaks else None
+    }
+
+
+def run_benchmark(scenarios: Dict[str, Dict], repeat: int = 3, latency: float = 0.0,
+                  request_concurrency: int = DEFAULT_REQUEST_CONCURRENCY, scan_workers: Optional[int] = None,
+                  cpu_workers: int = 0, label: str = '', work_dir: Optional[str] = None) -> Dict:
+    """
+    依次运行各场景
+
+    Args:
+        scenarios: {场景名: create_synthetic_excel 的参数}
+        cpu_workers: 提取和写回的进程池大小，0 表示在当前进程执行
+        label: 结果的标签（如版本号）
+        work_dir: 存放生成文件的目录；None 表示使用临时目录，结束后删除
+        其他参数见 run_scenario
+
+    Returns:
+        Dict: 可序列化为 JSON 的结果
+    """
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix='excel-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+    cpu_executor = create_process_pool(cpu_workers) if cpu_workers else None
+    try:
+        results = {}
+        for name, params in scenarios.items():
+            print(f"运行场景 {name}: {params}", file=sys.stderr, flush=True)
+            results[name] = run_scenario(name, params, work_dir, repeat, latency, request_concurrency,
+                                         scan_workers, cpu_executor)
+    finally:
+        if cpu_executor is not None:
+            cpu_executor.shutdown()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return {
+        'version': BENCHMARK_VERSION,
+        'label': label,
+        'created_at': time.time(),
+        'environment': environment(),
+        'settings': {'repeat': repeat, 'latency': latency, 'request_concurrency': request_concurrency,
+                     'scan_workers': scan_workers, 'cpu_workers': cpu_workers},
+        'scenarios': results
+    }
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD,
+                    min_seconds: float = REGRESSION_MIN_SECONDS) -> List[Dict]:
+    """
+    逐场景、逐阶段比较墙钟时间的中位数
+
+    Args:
+        baseline: 基准结果
+        current: 当前结果
+        threshold: 超过基准的该倍数视为回退
+        min_seconds: 差值小于该值时不视为回退（避免短阶段的测量噪声）
+
+    Returns:
+        List[Dict]: 两边都有的每个场景和阶段一项：scenario、stage、baseline、current、ratio、regression
+    """
+    comparisons = []
+    for name, scenario in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        if base['params'] != scenario['params']:
+            logger.warning(f"场景 {name} 的参数与基准不同，跳过比较")
+            continue
+        stages = [(stage, base['stages'][stage]['wall_seconds']['median'],
+                   scenario['stages'][stage]['wall_seconds']['median'])
+                  for stage in BENCHMARK_STAGES if stage in base['stages'] and stage in scenario['stages']]
+        stages.append(('total', base['total_seconds']['median'], scenario['total_seconds']['median']))
+        for stage, before, after in stages:
+            ratio = after / before if before else None
+            comparisons.append({'scenario': name, 'stage': stage, 'baseline': before, 'current': after,
+                                'ratio': round(ratio, 3) if ratio is not None else None,
+                                'regression': (ratio is not None and ratio > threshold
+                                               and after - before > min_seconds)})
+    return comparisons
+
+
+def print_results(result: Dict):
+    """输出各场景各阶段耗时的汇总表"""
+    rows = []
+    for name, scenario in result['scenarios'].items():
+        stages = scenario['stages']
+        rows.append([name, scenario['workbook']['chinese_cells'], scenario['requests']]
+                    + [f"{stages[stage]['wall_seconds']['median']:.3f}" if stage in stages else '-'
+                       for stage in BENCHMARK_STAGES]
+                    + [f"{scenario['total_seconds']['median']:.3f}", scenario['cells_per_second'],
+                       scenario['peak_rss_mb'] if scenario['peak_rss_mb'] is not None else '-'])
+    print(format_table(['场景', '中文单元格', '请求'] + list(BENCHMARK_STAGES) + ['合计(s)', '单元格/秒', '峰值内存(MB)'],
+                       rows))
+
+
+def print_comparison(comparisons: List[Dict]) -> bool:
+    """输出比较结果，返回是否有回退"""
+    rows = [[item['scenario'], item['stage'], f"{item['baseline']:.3f}", f"{item['current']:.3f}",
+             f"{item['ratio']:.2f}x" if item['ratio'] is not None else '-', '回退' if item['regression'] else '']
+            for item in comparisons]
+    print(format_table(['场景', '阶段', '基准(s)', '当前(s)', '比值', ''], rows))
+    return any(item['regression'] for item in comparisons)
+
+
+def load_results(path: str) -> Dict:
+    """读取结果文件，格式版本不同时报错"""
+    with open(path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    if result.get('version') != BENCHMARK_VERSION:
+        raise ValueError(f"{path} 的结果格式版本为 {result.get('version')}，当前为 {BENCHMARK_VERSION}")
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    命令行入口
+
+    Returns:
+        int: 退出码：0 正常，1 有阶段相对基准回退，2 参数错误
+    """
+    parser = argparse.ArgumentParser(description='Excel 翻译器性能基准（使用本地模拟接口，不访问网络）')
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS),
+                        help=f"运行的场景（逗号分隔）：{'、'.join(SCENARIOS)}，custom 表示只用下列参数；"
+                             f"默认 {','.join(DEFAULT_SCENARIOS)}")
+    parser.add_argument('--sheets', type=int, help='工作表数')
+    parser.add_argument('--rows', type=int, help='每个工作表的行数')
+    parser.add_argument('--columns', type=int, help='列数')
+    parser.add_argument('--chinese-ratio', type=float, help='含中文的单元格比例')
+    parser.add_argument('--repetition', type=float, help='中文单元格重复已出现文本的比例')
+    parser.add_argument('--merged-density', type=float, help='每行含合并区域的概率')
+    parser.add_argument('--long-text-ratio', type=float, help='长文本单元格的比例')
+    parser.add_argument('--glossary-size', type=int, help='术语数，0 表示不计时术语库匹配')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的重复次数，取中位数（默认 3）')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟接口每次请求的延迟（秒，默认 0）')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUEST_CONCURRENCY,
+                        help=f'同时发出的请求数（默认 {DEFAULT_REQUEST_CONCURRENCY}）')
+    parser.add_argument('--scan-workers', type=int, help='扫描工作表的进程数（默认为 CPU 核数）')
+    parser.add_argument('--cpu-workers', type=int, default=0, help='提取和写回的进程池大小，0 表示在当前进程执行')
+    parser.add_argument('--label', default='', help='结果的标签，如版本号')
+    parser.add_argument('-o', '--output', help='结果 JSON 的输出路径')
+    parser.add_argument('--baseline', help='与该结果文件比较，有阶段回退时退出码为 1')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='只比较两个已有的结果文件')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f'耗时超过基准的该倍数视为回退（默认 {REGRESSION_THRESHOLD}）')
+    parser.add_argument('--work-dir', help='保留生成的工作簿和输出的目录（默认使用临时目录）')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出翻译器的日志')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.compare:
+            return 1 if print_comparison(compare_results(load_results(args.compare[0]), load_results(args.compare[1]),
+                                                         args.threshold)) else 0
+        baseline = load_results(args.baseline) if args.baseline else None
+    except (OSError, ValueError) as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return 2
+
+    overrides = {name: getattr(args, name) for name in ('sheets', 'rows', 'columns', 'chinese_ratio', 'repetition',
+                                                        'merged_density', 'long_text_ratio', 'glossary_size', 'seed')
+                 if getattr(args, name) is not None}
+    scenarios = {}
+    for name in [name.strip() for name in args.scenarios.split(',') if name.strip()]:
+        if name != 'custom' and name not in SCENARIOS:
+            print(f"错误: 未知场景 {name}", file=sys.stderr)
+            return 2
+        scenarios[name] = dict(SCENARIOS.get(name, {}), **overrides)
+    if not args.verbose:
+        # 每个单元格批次的日志会影响计时
+        logging.getLogger().setLevel(logging.WARNING)
+
+    result = run_benchmark(scenarios, repeat=max(1, args.repeat), latency=args.latency,
+                           request_concurrency=args.requests, scan_workers=args.scan_workers,
+                           cpu_workers=args.cpu_workers, label=args.label, work_dir=args.work_dir)
+    if args.output:
+        write_report(result, args.output)
+        print(f"结果已保存到: {args.output}", file=sys.stderr)
+    print_results(result)
+
+    if baseline is not None:
+        print()
+        return 1 if print_comparison(compare_results(baseline, result, args.threshold)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
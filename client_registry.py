@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 客户端注册表
+每个 API 密钥复用一个长连接的 Gemini 客户端及其限流状态；提交同一组密钥的任务共享密钥池、请求打包和术语库缓存
+"""
+
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import types
+
+from excel_translator import (ExcelTranslator, RequestPacker, RequestHedger, KeyPool, ApiKeyState, CircuitBreaker,
+                              content_hash)
+
+logger = logging.getLogger(__name__)
+
+# 空闲连接的保持时间（秒）
+KEEPALIVE_SECONDS = 60
+
+
+class ClientEntry:
+    """一组 API 密钥的密钥池及与之共享的请求打包器、请求对冲器和熔断器"""
+
+    def __init__(self, api_keys: Tuple[str, ...], keys: List[ApiKeyState], packing_linger: float,
+                 hedger: Optional[RequestHedger] = None, circuit_breaker: Optional[CircuitBreaker] = None):
+        """
+        Args:
+            api_keys: 密钥（去重后）
+            keys: 各密钥的共享状态
+            packing_linger: 请求打包时未满额请求等待合并的时间（秒）
+            hedger: 请求对冲器，None 表示不对冲
+            circuit_breaker: 熔断器，None 表示使用默认参数
+        """
+        self.api_keys = api_keys
+        self.key_id = content_hash('\n'.join(api_keys))
+        self.key_pool = KeyPool(keys)
+        self.request_packer = RequestPacker(linger=packing_linger)
+        self.hedger = hedger
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.leases = 0
+        self.last_used = time.time()
+
+
+class ClientRegistry:
+    """
+    进程内按 API 密钥复用客户端的注册表：每个密钥一个带连接池的客户端和限流状态（冷却、配额），
+    被多组密钥共用时状态也共用；空闲的条目会被回收，总数有上限
+    """
+
+    def __init__(self, max_clients: int = 32, idle_seconds: float = 600, max_requests: int = 4,
+                 requests_per_minute: int = 0, packing_linger: float = 0.05,
+                 hedge_percentile: float = 0, hedge_budget: float = 0.05,
+                 breaker_failure_threshold: int = 5, breaker_reset_seconds: float = 30):
+        """
+        Args:
+            max_clients: 保留的条目（密钥组）数上限，超出时回收最久未使用且未被占用的条目
+            idle_seconds: 条目空闲超过该时间后回收
+            max_requests: 每个密钥同时发出的 API 请求数，也是每个客户端的连接池大小
+            requests_per_minute: 每个密钥每分钟的请求配额，0 表示不限制
+            packing_linger: 请求打包时未满额请求等待合并的时间（秒）
+            hedge_percentile: 翻译块请求耗时超过该延迟百分位时发出对冲请求，0 表示不对冲
+            hedge_budget: 对冲请求数占总请求数的比例上限
+            breaker_failure_threshold: 同一组密钥连续失败多少次后熔断，之后的任务直接失败
+            breaker_reset_seconds: 熔断后多久放行试探请求（秒）
+        """
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.max_requests = max_requests
+        self.requests_per_minute = requests_per_minute
+        self.packing_linger = packing_linger
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.entries = {}
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.terminology_cache = {}
+
+    @contextmanager
+    def lease(self, api_keys: List[str]):
+        """
+        占用一组密钥的条目，占用期间不会被回收
+
+        Args:
+            api_keys: 一个或多个 API 密钥
+
+        Yields:
+            ClientEntry: 该组密钥的密钥池及共享状态
+        """
+        api_keys = tuple(dict.fromkeys(api_keys))
+        if not api_keys:
+            raise ValueError("至少需要一个 API 密钥")
+        with self.lock:
+            entry = self.entries.get(api_keys)
+            if entry is None:
+                hedger = None
+                if self.hedge_percentile:
+                    hedger = RequestHedger(percentile=self.hedge_percentile, budget=self.hedge_budget)
+                breaker = CircuitBreaker(failure_threshold=self.breaker_failure_threshold,
+                                         reset_seconds=self.breaker_reset_seconds)
+                entry = ClientEntry(api_keys, [self._key_state(api_key) for api_key in api_keys],
+                                    self.packing_linger, hedger, breaker)
+                self.entries[api_keys] = entry
+                logger.info(f"已创建 API 密钥池: {entry.key_id}（{len(api_keys)} 个密钥）")
+            entry.leases += 1
+            entry.last_used = time.time()
+            expired = self._collect_expired()
+        self._close(expired)
+
+        try:
+            yield entry
+        finally:
+            with self.lock:
+                entry.leases -= 1
+                entry.last_used = time.time()
+
+    def create_translator(self, entry: ClientEntry, **kwargs) -> ExcelTranslator:
+        """
+        创建使用共享密钥池、请求打包和熔断器的翻译器
+
+        Args:
+            entry: lease 返回的条目
+            **kwargs: 其他 ExcelTranslator 参数
+        """
+        return ExcelTranslator(api_key=None,
+                               key_pool=entry.key_pool,
+                               request_concurrency=self.max_requests,
+                               request_packer=entry.request_packer,
+                               hedger=entry.hedger,
+                               circuit_breaker=entry.circuit_breaker,
+                               **kwargs)
+
+    def discard(self, api_keys: List[str]):
+        """丢弃一组密钥的条目（如密钥无效），正在占用的条目不受影响"""
+        with self.lock:
+            entry = self.entries.get(tuple(dict.fromkeys(api_keys)))
+            if entry is None or entry.leases:
+                return
+            del self.entries[entry.api_keys]
+            if entry.hedger is not None:
+                entry.hedger.close()
+            unused = self._collect_unused_keys()
+        self._close(unused)
+
+    def terminology(self, terminology_file: str) -> Dict:
+        """
+        获取术语库字典，文件未变化时复用已加载的结果
+
+        Args:
+            terminology_file: 术语库文件路径
+
+        Returns:
+            Dict: 术语库字典 {中文: 英文}
+        """
+        if not os.path.exists(terminology_file):
+            return {}
+        mtime = os.path.getmtime(terminology_file)
+        with self.lock:
+            cached = self.terminology_cache.get(terminology_file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        terminology_dict = ExcelTranslator(api_key=None).load_terminology(terminology_file)
+        with self.lock:
+            self.terminology_cache[terminology_file] = (mtime, terminology_dict)
+        return terminology_dict
+
+    def stats(self) -> Dict:
+        """条目数量、占用情况、各密钥的用量、请求对冲情况和熔断的密钥组"""
+        with self.lock:
+            entries = list(self.entries.values())
+            keys = list(self.keys.values())
+        with KeyPool.condition:
+            now = time.time()
+            key_usage = [key.usage(now) for key in keys]
+        hedging = {'requests': 0, 'hedges': 0, 'hedge_wins': 0}
+        for entry in entries:
+            if entry.hedger is not None:
+                for name, value in entry.hedger.stats().items():
+                    if name in hedging:
+                        hedging[name] += value
+        return {
+            'clients': len(entries),
+            'leased': sum(1 for entry in entries if entry.leases),
+            'keys': key_usage,
+            'hedging': hedging,
+            'open_breakers': [entry.key_id for entry in entries
+                              if entry.circuit_breaker.stats()['state'] != CircuitBreaker.CLOSED]
+        }
+
+    def _key_state(self, api_key: str) -> ApiKeyState:
+        """获取或创建密钥的共享状态（调用方需持有锁）"""
+        key = self.keys.get(api_key)
+        if key is None:
+            limits = httpx.Limits(max_connections=self.max_requests,
+                                  max_keepalive_connections=self.max_requests,
+                                  keepalive_expiry=KEEPALIVE_SECONDS)
+            client = genai.Client(api_key=api_key,
+                                  http_options=types.HttpOptions(client_args={'limits': limits}))
+            key = self.keys[api_key] = ApiKeyState(api_key, client, max_requests=self.max_requests,
+                                                   requests_per_minute=self.requests_per_minute)
+        return key
+
+    def _collect_expired(self) -> List[ApiKeyState]:
+        """移出空闲超时或超出数量上限的条目，返回不再被使用、待关闭的密钥（调用方需持有锁）"""
+        now = time.time()
+        idle = [entry for entry in self.entries.values() if not entry.leases]
+        idle.sort(key=lambda entry: entry.last_used)
+        excess = len(self.entries) - self.max_clients
+        expired = 0
+        for entry in idle:
+            if now - entry.last_used > self.idle_seconds or excess > 0:
+                del self.entries[entry.api_keys]
+                if entry.hedger is not None:
+                    entry.hedger.close()
+                expired += 1
+                excess -= 1
+        if expired:
+            logger.info(f"回收 {expired} 个空闲的 API 密钥池")
+        return self._collect_unused_keys()
+
+    def _collect_unused_keys(self) -> List[ApiKeyState]:
+        """移出不再被任何条目使用的密钥（调用方需持有锁）"""
+        in_use = {api_key for entry in self.entries.values() for api_key in entry.api_keys}
+        unused = [api_key for api_key in self.keys if api_key not in in_use]
+        return [self.keys.pop(api_key) for api_key in unused]
+
+    def _close(self, keys: List[ApiKeyState]):
+        """关闭密钥客户端的连接池"""
+        for key in keys:
+            try:
+                key.client.close()
+            except Exception as e:
+                logger.warning(f"关闭客户端时出错: {str(e)}")
+
+    def close_all(self):
+        """关闭所有客户端"""
+        with self.lock:
+            keys = list(self.keys.values())
+            for entry in self.entries.values():
+                if entry.hedger is not None:
+                    entry.hedger.close()
+            self.entries.clear()
+            self.keys.clear()
+        self._close(keys)
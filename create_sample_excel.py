@@ -2,13 +2,27 @@
 # -*- coding: utf-8 -*-
 """
 创建示例 Excel 文件用于测试翻译功能
-包含中文内容、合并单元格等情况
+包含中文内容、合并单元格等情况；create_synthetic_excel 按参数生成任意规模的合成工作簿，用于性能基准
 """
 
+import os
+import random
+
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 
+# 合成文本使用的常用汉字
+COMMON_CHINESE = ("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种"
+                  "面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去"
+                  "把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但"
+                  "质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式"
+                  "活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回")
+
+# 合成文本长度（字数）：普通单元格和长文本单元格
+SHORT_TEXT_LENGTH = (2, 12)
+LONG_TEXT_LENGTH = (100, 400)
+
 def create_sample_excel():
     """创建包含中文内容的示例 Excel 文件"""
     
@@ -123,5 +137,111 @@ def create_sample_excel():
     
     return filename
 
+def random_chinese_text(rng: random.Random, min_length: int, max_length: int) -> str:
+    """随机中文文本，长文本每隔十几个字插入标点"""
+    length = rng.randint(min_length, max_length)
+    chars = []
+    for index in range(length):
+        chars.append(rng.choice(COMMON_CHINESE))
+        if length > 20 and index % 15 == 14:
+            chars.append(rng.choice("，。"))
+    return ''.join(chars)
+
+
+def create_synthetic_excel(filename="synthetic_chinese_excel.xlsx", sheets=3, rows=1000, columns=8,
+                           chinese_ratio=0.5, repetition=0.3, merged_density=0.01, long_text_ratio=0.05,
+                           glossary_size=0, glossary_ratio=0.1, glossary_file=None, seed=0):
+    """
+    按参数生成合成工作簿（结果只由参数和 seed 决定），可同时生成与之匹配的术语库
+    
+    Args:
+        filename: 输出文件路径
+        sheets: 工作表数
+        rows: 每个工作表的数据行数（另有一行中文表头）
+        columns: 列数
+        chinese_ratio: 含中文的单元格比例，其余为数字和英文编号
+        repetition: 中文单元格重复使用已出现文本的比例
+        merged_density: 每行含一个横向合并区域（两列）的概率
+        long_text_ratio: 中文单元格中长文本（100-400 字）的比例
+        glossary_size: 术语数，0 表示不使用术语库
+        glossary_ratio: 中文单元格恰好是某个术语的比例（glossary_size 大于 0 时）
+        glossary_file: 术语库输出路径（第一列中文，第二列英文）；None 表示不写术语库文件
+        seed: 随机种子
+        
+    Returns:
+        dict: 生成结果的统计（单元格数、中文单元格数、不同中文文本数、合并区域数、术语单元格数、文件大小）
+    """
+    rng = random.Random(seed)
+    glossary_terms = []
+    while len(glossary_terms) < glossary_size:
+        term = random_chinese_text(rng, 2, 6)
+        if term not in glossary_terms:
+            glossary_terms.append(term)
+    
+    # 只写模式逐行写入，大规模工作簿也不会占用大量内存
+    wb = Workbook(write_only=True)
+    used_texts = []
+    unique_texts = set()
+    stats = {'cells': 0, 'chinese_cells': 0, 'merged_ranges': 0, 'glossary_cells': 0, 'long_text_cells': 0}
+    
+    def chinese_cell():
+        if glossary_terms and rng.random() < glossary_ratio:
+            stats['glossary_cells'] += 1
+            return rng.choice(glossary_terms)
+        if used_texts and rng.random() < repetition:
+            return rng.choice(used_texts)
+        if rng.random() < long_text_ratio:
+            stats['long_text_cells'] += 1
+            text = random_chinese_text(rng, *LONG_TEXT_LENGTH)
+        else:
+            text = random_chinese_text(rng, *SHORT_TEXT_LENGTH)
+        used_texts.append(text)
+        return text
+    
+    for sheet_index in range(sheets):
+        ws = wb.create_sheet(f"数据{sheet_index + 1}")
+        headers = [f"字段{column + 1}" for column in range(columns)]
+        ws.append(headers)
+        unique_texts.update(headers)
+        stats['cells'] += columns
+        stats['chinese_cells'] += columns
+        for row in range(2, rows + 2):
+            merged_column = None
+            if columns > 1 and rng.random() < merged_density:
+                merged_column = rng.randint(1, columns - 1)
+                ws.merged_cells.add(f"{get_column_letter(merged_column)}{row}:"
+                                    f"{get_column_letter(merged_column + 1)}{row}")
+                stats['merged_ranges'] += 1
+            values = []
+            for column in range(1, columns + 1):
+                if merged_column is not None and column == merged_column + 1:
+                    # 合并区域的从属单元格为空
+                    values.append(None)
+                    continue
+                if rng.random() < chinese_ratio:
+                    values.append(chinese_cell())
+                    unique_texts.add(values[-1])
+                    stats['chinese_cells'] += 1
+                elif rng.random() < 0.5:
+                    values.append(rng.randint(0, 1000000))
+                else:
+                    values.append(f"SKU-{rng.randint(0, 99999):05d}")
+                stats['cells'] += 1
+            ws.append(values)
+    
+    wb.save(filename)
+    stats['unique_chinese'] = len(unique_texts)
+    stats['bytes'] = os.path.getsize(filename)
+    
+    if glossary_file and glossary_terms:
+        glossary = Workbook(write_only=True)
+        ws = glossary.create_sheet("术语库")
+        ws.append(["中文", "英文"])
+        for index, term in enumerate(glossary_terms):
+            ws.append([term, f"Term {index + 1}"])
+        glossary.save(glossary_file)
+    
+    return stats
+
 if __name__ == "__main__":
     create_sample_excel() 
\ No newline at end of file
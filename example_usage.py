@@ -5,8 +5,9 @@ Excel 翻译器使用示例
 演示如何以编程方式使用 ExcelTranslator 类
 """
 
-from excel_translator import ExcelTranslator
+from excel_translator import ExcelTranslator, TranslationMemory
 from create_sample_excel import create_sample_excel
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 def example_usage():
@@ -83,20 +84,31 @@ def batch_translation_example():
         print("错误: 需要提供 API 密钥")
         return
     
-    translator = ExcelTranslator(api_key=api_key)
+    # 所有文件共享译文缓存，相同文本只翻译一次；多个文件同时翻译
+    translation_memory = TranslationMemory()
     
+    def translate_file(input_file, keyword):
+        translator = ExcelTranslator(api_key=api_key, translation_memory=translation_memory)
+        output_file = input_file.replace('.xlsx', '_translated.xlsx')
+        print(f"正在翻译: {input_file} (领域: {keyword})")
+        translator.translate_excel(input_file, output_file, keyword)
+        return output_file
+    
+    existing_files = []
     for input_file, keyword in files_to_translate:
         if os.path.exists(input_file):
-            output_file = input_file.replace('.xlsx', '_translated.xlsx')
-            print(f"正在翻译: {input_file} (领域: {keyword})")
-            
-            try:
-                translator.translate_excel(input_file, output_file, keyword)
-                print(f"✓ 完成: {output_file}")
-            except Exception as e:
-                print(f"✗ 失败: {e}")
+            existing_files.append((input_file, keyword))
         else:
             print(f"⚠ 文件不存在: {input_file}")
+    
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [(input_file, executor.submit(translate_file, input_file, keyword))
+                   for input_file, keyword in existing_files]
+        for input_file, future in futures:
+            try:
+                print(f"✓ 完成: {future.result()}")
+            except Exception as e:
+                print(f"✗ 失败 {input_file}: {e}")
 
 def main():
     """主函数 - 提供交互式菜单"""
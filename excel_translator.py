@@ -5,33 +5,1365 @@ Excel 翻译器 - 使用 Gemini AI API
 自动检测并翻译 Excel 表格中的中文内容
 """
 
+import os
 import re
+import sys
+import glob
 import json
+import argparse
 import time
+import hashlib
+import shutil
+import threading
+import statistics
+import unicodedata
+import multiprocessing
+import numpy as np
 import pandas as pd
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, \
+    FIRST_COMPLETED, as_completed, wait
 from openpyxl import load_workbook, Workbook
 from openpyxl.utils import get_column_letter
-from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string, range_boundaries
+from openpyxl.worksheet._reader import WorkSheetParser, FORMULA_TAG
+from openpyxl.worksheet.cell_range import CellRange
 from google import genai
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional, Union
 import logging
+from collections import OrderedDict
+
+import metrics
+from instrumentation import Instrumentation, record_stage_metrics, peak_rss_bytes, write_report
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# 默认术语库文件
+DEFAULT_TERMINOLOGY_FILE = "terminology_sample.xlsx"
+
+# 译文的目标语言（提示词要求翻译成英文）
+TARGET_LANGUAGE = "en"
+
+# 每次 API 调用翻译的文本数量上限，也是任务日志的检查点粒度
+DEFAULT_CHUNK_SIZE = 100
+
+# 单个任务同时发出的 API 请求数
+DEFAULT_REQUEST_CONCURRENCY = 4
+
+# 每次 API 调用翻译的中文字符数上限，避免长文本单元格撑爆单次请求
+DEFAULT_CHUNK_CHARS = 4000
+
+# 旧版本翻译失败时写入单元格的占位前缀（现在翻译失败的单元格保持原文），用于识别旧的任务日志和清单
+FAILED_TRANSLATION_PREFIX = "[翻译失败"
+
+# 增量翻译清单格式版本
+MANIFEST_VERSION = 1
+
+# 中文（CJK 表意文字）码位范围：基本区、扩展 A-G 区、兼容表意文字及其补充
+CJK_RANGES = (
+    (0x3400, 0x4DBF),    # 扩展 A
+    (0x4E00, 0x9FFF),    # 基本区
+    (0xF900, 0xFAFF),    # 兼容表意文字
+    (0x20000, 0x2A6DF),  # 扩展 B
+    (0x2A700, 0x2EBEF),  # 扩展 C-F
+    (0x2F800, 0x2FA1F),  # 兼容表意文字补充
+    (0x30000, 0x3134F),  # 扩展 G
+)
+
+CHINESE_PATTERN = re.compile('[' + ''.join(f'{chr(low)}-{chr(high)}' for low, high in CJK_RANGES) + ']+')
+
+# 任务规模估算：每个中文字符（原文 + 译文）约 2 个 token，每个文本的编号和换行约 6 个 token，
+# 每次 API 调用的提示词说明约 150 个 token
+ESTIMATED_TOKENS_PER_CHAR = 2
+ESTIMATED_TOKENS_PER_TEXT = 6
+ESTIMATED_TOKENS_PER_CHUNK = 150
+
+# 上传分析文件格式版本，格式变化时旧的分析文件作废
+ANALYSIS_VERSION = 1
+
+# 性能报告与输出文件放在一起：<输出文件>.perf.json
+PERFORMANCE_REPORT_SUFFIX = '.perf.json'
+
+# 小于该大小的文件直接串行扫描，进程启动开销比并行收益更大
+PARALLEL_SCAN_MIN_BYTES = 2 * 1024 * 1024
+
+# 进程池子进程的启动方式：进程池在已有工作线程（任务、请求、文件线程）时才启动子进程，直接 fork
+# 会把其他线程持有的锁带进子进程而死锁，因此由单线程的 forkserver（不支持时为 spawn）启动
+PROCESS_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# API 密钥收到 429（配额耗尽）后的冷却时间，连续被限流时翻倍，最长 MAX_RATE_LIMIT_COOLDOWN_SECONDS
+RATE_LIMIT_COOLDOWN_SECONDS = 30
+MAX_RATE_LIMIT_COOLDOWN_SECONDS = 300
+
+# 按每分钟请求数统计密钥剩余配额的时间窗口
+QUOTA_WINDOW_SECONDS = 60
+
+# 一次请求被限流后换用其他密钥重试的次数（按密钥数计）
+RATE_LIMIT_RETRIES_PER_KEY = 2
+
+# 有截止时间时为写回工作簿预留的时间：按近期写回的速率（秒/字节）和工作簿大小估算，乘以安全系数，
+# 再加上固定开销；进程内还没有写回记录时按每 MB 的默认耗时估算
+DEADLINE_WRITE_SECONDS_PER_MB = 2.0
+DEADLINE_WRITE_SAFETY_FACTOR = 1.5
+DEADLINE_WRITE_OVERHEAD_SECONDS = 0.2
+# 估算写回和翻译块耗时保留的最近记录数
+TIMING_HISTORY_WINDOW = 50
+
+# 请求对冲：统计延迟的滑动窗口大小、开始对冲前需要的最少样本数、同时执行的请求线程数上限
+HEDGE_LATENCY_WINDOW = 500
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_WORKERS = 32
+
+# 熔断：连续失败多少次后停止调用翻译接口，停止多久后放行一次试探请求
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+# 逐单元格处理（写回译文、替换术语）时每个工作表在 INFO 日志中列出的示例数
+LOG_SAMPLE_SIZE = 3
+
+
+class TranslationCancelled(Exception):
+    """翻译任务被取消（由进度回调抛出，在块与块之间中止任务）"""
+
+
+class BackendUnavailable(Exception):
+    """翻译接口连续调用失败，熔断器已打开，任务直接失败而不再逐个重试"""
+
+
+def notify_progress(progress_callback, event_type: str, **fields):
+    """
+    向进度回调发送事件
+    
+    事件类型:
+        stage: 阶段切换，翻译任务为 extract / translate / write / done，术语库匹配为
+               scan / write / done；进入 translate（或术语库的 write）阶段时 total 为待处理的单元格总数
+        reused: cells 个单元格复用了增量清单中的译文
+        restored: cells 个单元格从任务日志恢复
+        chunk: 完成第 chunk/chunks 块，包含 cells 个单元格
+    """
+    if progress_callback is not None:
+        progress_callback({'type': event_type, **fields})
+
+
+class CellLog:
+    """
+    逐单元格循环的日志：循环中只收集单元格，不格式化也不写日志；结束时每个工作表输出一条
+    汇总（单元格数和前几个示例）。提供 audit_file 时所有单元格的记录在结束时一次性追加到
+    审计文件（JSON Lines，每行 action / sheet / cell / original / value）
+    """
+    
+    def __init__(self, action: str, audit_file: Optional[str] = None, sample_size: int = LOG_SAMPLE_SIZE):
+        """
+        Args:
+            action: 操作名称，用于日志和审计记录，如 translate / terminology
+            audit_file: 审计文件路径，None 表示不记录每个单元格
+            sample_size: 每个工作表在日志中列出的示例数
+        """
+        self.action = action
+        self.audit_file = audit_file
+        self.sample_size = sample_size
+        self.counts = {}
+        self.samples = {}
+        self.records = []
+    
+    def record(self, sheet_name: str, coord: str, original, value):
+        """记录一个被修改的单元格"""
+        count = self.counts.get(sheet_name, 0)
+        self.counts[sheet_name] = count + 1
+        if count < self.sample_size:
+            self.samples.setdefault(sheet_name, []).append((coord, original, value))
+        if self.audit_file is not None:
+            self.records.append((sheet_name, coord, original, value))
+    
+    def flush(self):
+        """输出各工作表的汇总日志，并把单元格记录写入审计文件"""
+        for sheet_name, count in self.counts.items():
+            examples = '；'.join(f"{coord}: '{original}' -> '{value}'"
+                                 for coord, original, value in self.samples.get(sheet_name, []))
+            logger.info(f"[{self.action}] 工作表 '{sheet_name}' 更新 {count} 个单元格，例如 {examples}")
+        if self.audit_file is not None and self.records:
+            lines = [json.dumps({'action': self.action, 'sheet': sheet_name, 'cell': coord,
+                                 'original': original, 'value': value}, ensure_ascii=False)
+                     for sheet_name, coord, original, value in self.records]
+            with open(self.audit_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            logger.info(f"已写入 {len(lines)} 条单元格审计记录: {self.audit_file}")
+        self.counts.clear()
+        self.samples.clear()
+        self.records = []
+
+
+def is_failed_translation(translation: Optional[str]) -> bool:
+    """判断是否没有可用的译文：翻译失败（None）或旧版本写入的失败占位"""
+    return translation is None or translation.startswith(FAILED_TRANSLATION_PREFIX)
+
+
+def content_hash(text: str) -> str:
+    """计算单元格内容的哈希，用于增量翻译时判断内容是否变化"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def detect_chinese(values) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批量检测一组单元格值（整列或整个共享字符串表）是否包含中文
+    
+    非字符串和纯 ASCII 字符串直接判为不含中文；其余字符串去重后拼接为一个
+    UTF-32 码位数组，按 CJK_RANGES 向量化比较，再按字符串分段求和。
+    
+    Args:
+        values: 单元格值序列
+        
+    Returns:
+        Tuple: (是否包含中文的布尔掩码, 每个值的中文字符数)
+    """
+    positions = np.full(len(values), -1, dtype=np.int64)
+    unique_index = {}
+    unique_texts = []
+    for i, value in enumerate(values):
+        if isinstance(value, str) and not value.isascii():
+            j = unique_index.get(value)
+            if j is None:
+                j = unique_index[value] = len(unique_texts)
+                unique_texts.append(value)
+            positions[i] = j
+    
+    counts = np.zeros(len(values), dtype=np.int64)
+    if unique_texts:
+        codepoints = np.frombuffer(''.join(unique_texts).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        is_chinese = np.zeros(len(codepoints), dtype=bool)
+        for low, high in CJK_RANGES:
+            is_chinese |= (codepoints >= low) & (codepoints <= high)
+        
+        lengths = np.fromiter(map(len, unique_texts), dtype=np.int64, count=len(unique_texts))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        unique_counts = np.add.reduceat(is_chinese.astype(np.int64), offsets)
+        
+        has_text = positions >= 0
+        counts[has_text] = unique_counts[positions[has_text]]
+    
+    return counts > 0, counts
+
+
+def build_chinese_content(scan_results: Dict, sheet_states: Optional[Dict] = None) -> Dict:
+    """
+    将中文扫描结果整理为 {工作表名: {单元格坐标: 单元格信息}}，不含中文的工作表不出现
+    
+    Args:
+        scan_results: {工作表名: (匹配单元格列表, 合并区域引用列表)}，见 scan_worksheet
+        sheet_states: {工作表名: 可见状态}，提供时标记隐藏工作表中的单元格
+        
+    Returns:
+        Dict: 单元格信息包含 content、row、column、chinese_chars、hidden、formula、
+              is_merged、merged_info、sheet_hidden
+    """
+    chinese_content = {}
+    for sheet_name, (matches, merged_refs) in scan_results.items():
+        if not matches:
+            continue
+        
+        # 获取合并单元格信息
+        merged_cells_info = build_merged_cells_info(CellRange(ref) for ref in merged_refs)
+        
+        sheet_hidden = sheet_states is not None and sheet_states.get(sheet_name, 'visible') != 'visible'
+        sheet_chinese_content = {}
+        for row, column, content, chinese_chars, hidden, formula in matches:
+            cell_coord = f"{get_column_letter(column)}{row}"
+            
+            sheet_chinese_content[cell_coord] = {
+                'content': content,
+                'row': row,
+                'column': column,
+                'chinese_chars': chinese_chars,
+                'hidden': hidden,
+                'formula': formula,
+                'is_merged': cell_coord in merged_cells_info,
+                'merged_info': merged_cells_info.get(cell_coord, None),
+                'sheet_hidden': sheet_hidden
+            }
+        
+        chinese_content[sheet_name] = sheet_chinese_content
+    return chinese_content
+
+
+def estimate_job_size(chinese_content: Dict, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+    """
+    根据提取的中文内容估算翻译任务规模，用于任务调度
+    
+    Args:
+        chinese_content: extract_chinese_content 的返回值
+        chunk_size: 每次 API 调用翻译的文本数量上限
+        
+    Returns:
+        Dict: chinese_cells（中文单元格数）、unique_strings（不同文本数）、
+              chinese_chars（中文字符数）、estimated_tokens（预计 token 数）
+    """
+    chinese_cells = 0
+    chinese_chars = 0
+    unique_strings = set()
+    for content in chinese_content.values():
+        for cell_info in content.values():
+            chinese_cells += 1
+            chinese_chars += cell_info.get('chinese_chars') or len(cell_info['content'])
+            unique_strings.add(cell_info['content'])
+    
+    chunks = -(-chinese_cells // chunk_size)
+    return {
+        'chinese_cells': chinese_cells,
+        'unique_strings': len(unique_strings),
+        'chinese_chars': chinese_chars,
+        'estimated_tokens': (chinese_chars * ESTIMATED_TOKENS_PER_CHAR
+                             + chinese_cells * ESTIMATED_TOKENS_PER_TEXT
+                             + chunks * ESTIMATED_TOKENS_PER_CHUNK)
+    }
+
+
+def build_merged_cells_info(merged_ranges) -> Dict:
+    """
+    根据合并区域列表构建 {单元格坐标: 合并信息} 映射
+
+    Args:
+        merged_ranges: 合并区域（openpyxl CellRange 对象）列表
+
+    Returns:
+        Dict: 合并单元格信息
+    """
+    merged_cells_info = {}
+    for merged_range in merged_ranges:
+        master_cell = f"{get_column_letter(merged_range.min_col)}{merged_range.min_row}"
+        for row in range(merged_range.min_row, merged_range.max_row + 1):
+            for col in range(merged_range.min_col, merged_range.max_col + 1):
+                cell_coord = f"{get_column_letter(col)}{row}"
+                merged_cells_info[cell_coord] = {
+                    'master_cell': master_cell,
+                    'range': str(merged_range)
+                }
+    return merged_cells_info
+
+
+class CellScope:
+    """
+    单元格处理范围：限定参与处理的工作表和区域，并可跳过隐藏内容与公式单元格
+    
+    过滤在流式扫描时完成，被排除的工作表不会被解析，被排除的行和单元格不会被解码。
+    """
+    
+    def __init__(self, include_sheets: Optional[List[str]] = None, exclude_sheets: Optional[List[str]] = None,
+                 ranges: Optional[List[str]] = None, skip_hidden: bool = False, skip_formulas: bool = False):
+        """
+        Args:
+            include_sheets: 只处理这些工作表，None 表示全部
+            exclude_sheets: 不处理这些工作表
+            ranges: A1 样式的区域或列字母，如 ['A:C', 'B2:D100', '5:10']；
+                    可用 '工作表名!A1:B5' 限定只作用于某个工作表，None 表示整个工作表
+            skip_hidden: 跳过隐藏的工作表、行和列
+            skip_formulas: 跳过公式单元格
+        """
+        self.include_sheets = set(include_sheets) if include_sheets else None
+        self.exclude_sheets = set(exclude_sheets or [])
+        self.skip_hidden = skip_hidden
+        self.skip_formulas = skip_formulas
+        
+        # [(工作表名或 None, (min_col, min_row, max_col, max_row))]，边界为 None 表示不限
+        self.ranges = []
+        for range_string in ranges or []:
+            sheet_name = None
+            if '!' in range_string:
+                sheet_name, range_string = range_string.rsplit('!', 1)
+                sheet_name = sheet_name.strip("'")
+            try:
+                bounds = range_boundaries(range_string.strip().replace('$', '').upper())
+            except ValueError:
+                raise ValueError(f"无效的单元格范围: {range_string}")
+            self.ranges.append((sheet_name, bounds))
+    
+    @classmethod
+    def from_dict(cls, options: Optional[Dict]) -> Optional['CellScope']:
+        """
+        从请求参数构建处理范围，列表参数也接受逗号分隔的字符串
+        
+        Args:
+            options: 包含 include_sheets / exclude_sheets / ranges / skip_hidden / skip_formulas 的字典
+            
+        Returns:
+            Optional[CellScope]: 未指定任何限制时返回 None
+        """
+        if not options:
+            return None
+        
+        def as_list(value):
+            if isinstance(value, str):
+                value = value.split(',')
+            return [item.strip() for item in value or [] if item and item.strip()]
+        
+        scope = cls(include_sheets=as_list(options.get('include_sheets')),
+                    exclude_sheets=as_list(options.get('exclude_sheets')),
+                    ranges=as_list(options.get('ranges')),
+                    skip_hidden=bool(options.get('skip_hidden', False)),
+                    skip_formulas=bool(options.get('skip_formulas', False)))
+        return None if scope.is_unrestricted() else scope
+    
+    def is_unrestricted(self) -> bool:
+        """是否未设置任何限制"""
+        return (self.include_sheets is None and not self.exclude_sheets and not self.ranges
+                and not self.skip_hidden and not self.skip_formulas)
+    
+    def includes_sheet(self, sheet_name: str, sheet_state: str = 'visible') -> bool:
+        """判断工作表是否在处理范围内"""
+        if self.include_sheets is not None and sheet_name not in self.include_sheets:
+            return False
+        if sheet_name in self.exclude_sheets:
+            return False
+        if self.skip_hidden and sheet_state != 'visible':
+            return False
+        return True
+    
+    def sheet_ranges(self, sheet_name: str) -> List[Tuple]:
+        """获取作用于指定工作表的区域边界列表，空列表表示整个工作表"""
+        return [bounds for range_sheet, bounds in self.ranges if range_sheet in (None, sheet_name)]
+    
+    def filter_content(self, chinese_content: Dict, sheet_states: Dict) -> Dict:
+        """
+        对已提取的中文内容应用处理范围，与扫描时过滤的结果一致
+        
+        Args:
+            chinese_content: 未限定范围提取的中文内容（单元格信息需包含 hidden、formula）
+            sheet_states: {工作表名: 可见状态}
+            
+        Returns:
+            Dict: 范围内的中文内容
+        """
+        filtered = {}
+        for sheet_name, content in chinese_content.items():
+            if not self.includes_sheet(sheet_name, sheet_states.get(sheet_name, 'visible')):
+                continue
+            ranges = self.sheet_ranges(sheet_name)
+            sheet_content = {
+                cell_coord: cell_info for cell_coord, cell_info in content.items()
+                if not (self.skip_hidden and cell_info['hidden'])
+                and not (self.skip_formulas and cell_info['formula'])
+                and (not ranges or any(_in_bounds(bounds, cell_info['row'], cell_info['column'])
+                                       for bounds in ranges))
+            }
+            if sheet_content:
+                filtered[sheet_name] = sheet_content
+        return filtered
+
+
+def _in_bounds(bounds: Tuple, row: int, column: Optional[int] = None) -> bool:
+    """判断行（及列）是否落在 range_boundaries 返回的边界内"""
+    min_col, min_row, max_col, max_row = bounds
+    if (min_row is not None and row < min_row) or (max_row is not None and row > max_row):
+        return False
+    if column is None:
+        return True
+    return not ((min_col is not None and column < min_col) or (max_col is not None and column > max_col))
+
+
+def _hidden_column_indexes(column_dimensions: Dict) -> set:
+    """从解析器的列信息中取出隐藏列的序号"""
+    hidden_columns = set()
+    for attrs in column_dimensions.values():
+        if attrs.get('hidden') in ('1', 'true'):
+            hidden_columns.update(range(int(attrs['min']), int(attrs.get('max', attrs['min'])) + 1))
+    return hidden_columns
+
+
+class _ScopedSheetParser(WorkSheetParser):
+    """在解码单元格之前按 CellScope 丢弃范围外的行和单元格"""
+    
+    def __init__(self, *args, scope: CellScope, ranges: List[Tuple], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scope = scope
+        self.ranges = ranges
+        self.hidden_columns = None
+    
+    def parse_row(self, row):
+        # <cols> 位于 <sheetData> 之前，解析第一行时列信息已经就绪
+        if self.hidden_columns is None:
+            self.hidden_columns = _hidden_column_indexes(self.column_dimensions) if self.scope.skip_hidden else set()
+        
+        row_index = int(row.get('r')) if row.get('r') else self.row_counter + 1
+        row_hidden = self.scope.skip_hidden and row.get('hidden') in ('1', 'true')
+        row_ranges = [bounds for bounds in self.ranges if _in_bounds(bounds, row_index)]
+        
+        for element in list(row):
+            keep = not row_hidden and (not self.ranges or bool(row_ranges))
+            if keep and self.scope.skip_formulas and element.find(FORMULA_TAG) is not None:
+                keep = False
+            coordinate = element.get('r')
+            if keep and coordinate and (row_ranges or self.hidden_columns):
+                column = column_index_from_string(coordinate_from_string(coordinate)[0])
+                if column in self.hidden_columns:
+                    keep = False
+                elif row_ranges and not any(_in_bounds(bounds, row_index, column) for bounds in row_ranges):
+                    keep = False
+            if not keep:
+                row.remove(element)
+        
+        return super().parse_row(row)
+
+
+def scan_worksheet(worksheet, terms=None, scope: Optional[CellScope] = None) -> Tuple[List[Tuple], List]:
+    """
+    流式扫描只读工作表的 XML，不创建单元格对象
+    
+    Args:
+        worksheet: 以 read_only=True 打开的 openpyxl 工作表
+        terms: 术语集合；为 None 时匹配包含中文的单元格，否则匹配去除首尾空白后
+               与术语完全一致的单元格
+        scope: 处理范围，范围外的单元格在解码前丢弃
+    
+    Returns:
+        Tuple: (匹配单元格列表, 合并区域引用列表 如 ['A1:D1'])；匹配中文时元素为
+               (行, 列, 内容, 中文字符数, 是否位于隐藏行列, 是否公式)，匹配术语时元素为 (行, 列, 术语)
+    """
+    workbook = worksheet.parent
+    matches = []
+    candidates = []
+    with worksheet._get_source() as source:
+        parser_options = dict(data_only=workbook.data_only,
+                              epoch=workbook.epoch,
+                              date_formats=workbook._date_formats,
+                              timedelta_formats=workbook._timedelta_formats)
+        if scope is not None:
+            parser = _ScopedSheetParser(source, worksheet._shared_strings,
+                                        scope=scope, ranges=scope.sheet_ranges(worksheet.title),
+                                        **parser_options)
+        else:
+            parser = WorkSheetParser(source, worksheet._shared_strings, **parser_options)
+        
+        for _, cells in parser.parse():
+            for cell in cells:
+                value = cell['value']
+                if not value:
+                    continue
+                if terms is None:
+                    # 只有非 ASCII 字符串可能包含中文，扫描结束后统一批量检测
+                    if isinstance(value, str) and not value.isascii():
+                        candidates.append((cell['row'], cell['column'], value, cell['data_type'] == 'f'))
+                else:
+                    text = str(value).strip()
+                    if text in terms:
+                        matches.append((cell['row'], cell['column'], text))
+        
+        if candidates:
+            mask, counts = detect_chinese([text for _, _, text, _ in candidates])
+            hidden_rows = {int(row) for row, attrs in parser.row_dimensions.items()
+                           if attrs.get('hidden') in ('1', 'true')}
+            hidden_columns = _hidden_column_indexes(parser.column_dimensions)
+            matches = [(row, column, text, int(count), row in hidden_rows or column in hidden_columns, formula)
+                       for (row, column, text, formula), found, count in zip(candidates, mask, counts) if found]
+        
+        merged_ranges = list(parser.merged_cells.mergeCell) if parser.merged_cells else []
+    return matches, [merged.ref for merged in merged_ranges]
+
+
+def chinese_content_from_analysis(analysis: Dict, scope: Optional[CellScope] = None) -> Dict:
+    """
+    从 analyze_workbook 的分析结果还原中文内容，不需要重新解析工作簿
+    
+    Args:
+        analysis: 分析结果
+        scope: 处理范围，在还原的记录上过滤
+        
+    Returns:
+        Dict: 与 extract_chinese_content 的返回值相同
+    """
+    strings = analysis['strings']
+    scan_results = {
+        sheet_name: ([(row, column, strings[index], chinese_chars, bool(hidden), bool(formula))
+                      for row, column, index, chinese_chars, hidden, formula in records],
+                     analysis['merged'].get(sheet_name, []))
+        for sheet_name, records in analysis['cells'].items()
+    }
+    sheet_states = {sheet['name']: sheet['state'] for sheet in analysis['sheets']}
+    chinese_content = build_chinese_content(scan_results, sheet_states)
+    if scope is not None:
+        chinese_content = scope.filter_content(chinese_content, sheet_states)
+    return chinese_content
+
+
+# 扫描子进程内缓存的只读工作簿，每个进程只解析一次共享字符串表
+_scan_workbook = None
+_scan_terms = None
+_scan_scope = None
+
+
+def _init_scan_worker(file_path: str, terms=None, scope: Optional[CellScope] = None):
+    """扫描子进程初始化：打开只读工作簿"""
+    global _scan_workbook, _scan_terms, _scan_scope
+    _scan_workbook = load_workbook(file_path, read_only=True)
+    _scan_terms = terms
+    _scan_scope = scope
+
+
+def _scan_sheet_in_worker(sheet_name: str) -> Tuple:
+    """
+    在子进程中扫描一个工作表
+
+    Returns:
+        Tuple: (紧凑的匹配结果, 扫描该工作表的 CPU 时间, 子进程峰值内存字节数)
+    """
+    started_cpu = time.process_time()
+    result = scan_worksheet(_scan_workbook[sheet_name], _scan_terms, _scan_scope)
+    return result, time.process_time() - started_cpu, peak_rss_bytes()
+
+
+class TranslationMemory:
+    """
+    线程安全的译文缓存，按 (原文, 关键词, 模型) 记录成功的译文
+    
+    多个翻译器共享同一实例时（如同一批次的多个文件），已翻译过的文本不再请求。
+    """
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: 缓存的译文数上限，超出时淘汰最久未命中的译文；None 表示不限制（长期运行的进程应设置）
+        """
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def lookup(self, texts: List[str], keywords: str, model: str) -> Dict[str, str]:
+        """
+        查找已有译文
+        
+        Returns:
+            Dict: {原文: 译文}，只包含命中的文本
+        """
+        with self.lock:
+            found = {text: self.entries[(text, keywords, model)] for text in texts
+                     if (text, keywords, model) in self.entries}
+            if self.max_entries is not None:
+                for text in found:
+                    self.entries.move_to_end((text, keywords, model))
+        metrics.CACHE_LOOKUPS.inc(len(found), cache='translation_memory', result='hit')
+        metrics.CACHE_LOOKUPS.inc(len(texts) - len(found), cache='translation_memory', result='miss')
+        return found
+    
+    def store(self, texts: List[str], translations: List[str], keywords: str, model: str):
+        """记录译文，翻译失败的占位不记录"""
+        with self.lock:
+            for text, translation in zip(texts, translations):
+                if not is_failed_translation(translation):
+                    self.entries[(text, keywords, model)] = translation
+            if self.max_entries is not None:
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+
+def normalize_text(text: str) -> str:
+    """在途请求合并使用的规范化文本：统一 Unicode 组合形式并去除首尾空白"""
+    return unicodedata.normalize('NFC', text).strip()
+
+
+class SingleFlight:
+    """
+    进程内在途请求合并：同一时刻相同的文本（按 规范化文本、关键词、模型、目标语言）只有
+    一个请求在翻译，之后的请求方等待同一结果，不再重复调用 API
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+    
+    def translate(self, texts: List[str], keywords: str, model: str,
+                  request: Callable[[List[str]], List[str]]) -> List[str]:
+        """
+        翻译一组文本，正在被其他请求方翻译的文本等待其结果
+        
+        Args:
+            texts: 待翻译文本列表
+            keywords: 专业领域关键词
+            model: 模型名称
+            request: 实际发出请求的函数，接收由当前调用方负责的文本列表，返回对应译文
+            
+        Returns:
+            List[str]: 与 texts 一一对应的译文
+        """
+        results = {}
+        remaining = texts
+        while remaining:
+            owned, waiting = [], {}
+            with self.lock:
+                for text in remaining:
+                    key = (normalize_text(text), keywords, model, TARGET_LANGUAGE)
+                    future = self.in_flight.get(key)
+                    if future is None:
+                        self.in_flight[key] = Future()
+                        owned.append(text)
+                    else:
+                        waiting[text] = future
+            
+            # 先翻译并交出自己负责的文本，再等待其他请求方，避免相互等待
+            if owned:
+                try:
+                    translated = request(owned)
+                except BaseException:
+                    self._complete(owned, [None] * len(owned), keywords, model)
+                    raise
+                results.update(zip(owned, translated))
+                self._complete(owned, translated, keywords, model)
+            
+            # 其他请求方出错或翻译失败的文本，下一轮由自己重新请求
+            remaining = []
+            for text, future in waiting.items():
+                translation = future.result()
+                if translation is None or is_failed_translation(translation):
+                    remaining.append(text)
+                else:
+                    results[text] = translation
+        
+        return [results[text] for text in texts]
+    
+    def _complete(self, texts: List[str], translations: List[Optional[str]], keywords: str, model: str):
+        """交出结果并唤醒等待方；出错时结果为 None"""
+        with self.lock:
+            futures = [self.in_flight.pop((normalize_text(text), keywords, model, TARGET_LANGUAGE), None)
+                       for text in texts]
+        for future, translation in zip(futures, translations):
+            if future is not None and not future.done():
+                future.set_result(translation)
+
+
+# 进程内所有翻译器共用的在途请求合并表
+SINGLE_FLIGHT = SingleFlight()
+
+
+class TimingHistory:
+    """
+    进程内最近的写回和翻译块耗时，用于截止时间规划：按工作簿大小估算写回需要预留的时间，
+    按翻译块的耗时判断截止前是否还来得及发出下一块
+    """
+    
+    def __init__(self, window: int = TIMING_HISTORY_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.write_rates = []  # 写回耗时 / 工作簿字节数
+        self.chunk_seconds = []
+    
+    def record_write(self, file_size: int, seconds: float):
+        """记录一次写回的耗时"""
+        with self.lock:
+            self.write_rates.append(seconds / max(1, file_size))
+            del self.write_rates[:-self.window]
+    
+    def record_chunk(self, seconds: float):
+        """记录一个翻译块从发出到完成的耗时"""
+        with self.lock:
+            self.chunk_seconds.append(seconds)
+            del self.chunk_seconds[:-self.window]
+    
+    def write_seconds(self, file_size: int) -> float:
+        """
+        写回 file_size 字节的工作簿需要预留的时间（秒）：按近期最慢的写回速率估算，没有记录时按
+        DEADLINE_WRITE_SECONDS_PER_MB 估算
+        """
+        with self.lock:
+            rate = max(self.write_rates) if self.write_rates else DEADLINE_WRITE_SECONDS_PER_MB / 1024 / 1024
+        return DEADLINE_WRITE_OVERHEAD_SECONDS + file_size * rate * DEADLINE_WRITE_SAFETY_FACTOR
+    
+    def expected_chunk_seconds(self) -> Optional[float]:
+        """近期翻译块耗时的中位数，没有记录时为 None"""
+        with self.lock:
+            return statistics.median(self.chunk_seconds) if self.chunk_seconds else None
+
+
+# 进程内所有翻译器共用的耗时记录
+TIMING_HISTORY = TimingHistory()
+
+
+class _PackBucket:
+    """RequestPacker 中等待发送的一组文本"""
+    
+    def __init__(self, translator: 'ExcelTranslator'):
+        self.translator = translator
+        self.units = []
+        self.chars = 0
+        self.timer = None
+
+
+class RequestPacker:
+    """
+    跨任务请求打包：把多个翻译器（如同时执行的多个小文件任务）的待翻译文本按
+    (关键词, 模型) 合并成满额的 API 请求，再把每条译文交回各自的调用方
+    
+    未满额的请求最多等待 linger 秒以凑满，随后照常发送。所有共享同一实例的翻译器
+    必须使用同一个 API 密钥；目标语言固定为英文，因此不参与分组。
+    """
+    
+    def __init__(self, max_texts: int = DEFAULT_CHUNK_SIZE, max_chars: int = DEFAULT_CHUNK_CHARS,
+                 linger: float = 0.05):
+        """
+        Args:
+            max_texts: 每个请求的文本数量上限
+            max_chars: 每个请求的字符数上限
+            linger: 未满额请求等待合并的最长时间（秒）
+        """
+        self.max_texts = max_texts
+        self.max_chars = max_chars
+        self.linger = linger
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.requests = 0
+        self.texts = 0
+    
+    def translate(self, translator: 'ExcelTranslator', texts: List[str], keywords: str = "") -> List[str]:
+        """
+        提交一组文本并等待译文
+        
+        Args:
+            translator: 调用方的翻译器，合并后的请求可能由任一调用方的翻译器发出
+            texts: 待翻译文本列表
+            keywords: 专业领域关键词
+            
+        Returns:
+            List[str]: 与 texts 一一对应的译文
+        """
+        key = (keywords, translator.model)
+        units = [(text, Future()) for text in texts]
+        ready = []
+        with self.lock:
+            for unit in units:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = _PackBucket(translator)
+                elif len(bucket.units) >= self.max_texts or bucket.chars + len(unit[0]) > self.max_chars:
+                    ready.append(self._take(key))
+                    bucket = self.buckets[key] = _PackBucket(translator)
+                bucket.units.append(unit)
+                bucket.chars += len(unit[0])
+            
+            bucket = self.buckets[key]
+            if len(bucket.units) >= self.max_texts or bucket.chars >= self.max_chars:
+                ready.append(self._take(key))
+            elif bucket.timer is None:
+                bucket.timer = threading.Timer(self.linger, self._flush, (key, bucket))
+                bucket.timer.daemon = True
+                bucket.timer.start()
+        
+        # 满额的请求由当前线程直接发送
+        for bucket in ready:
+            self._send(bucket, keywords)
+        return [future.result() for _, future in units]
+    
+    def _take(self, key: Tuple) -> _PackBucket:
+        """取出待发送的一组文本（调用方需持有锁）"""
+        bucket = self.buckets.pop(key)
+        if bucket.timer is not None:
+            bucket.timer.cancel()
+        return bucket
+    
+    def _flush(self, key: Tuple, bucket: _PackBucket):
+        """等待时间已到，发送未满额的请求"""
+        with self.lock:
+            if self.buckets.get(key) is not bucket:
+                return
+            self._take(key)
+        self._send(bucket, key[0])
+    
+    def _send(self, bucket: _PackBucket, keywords: str):
+        """发送合并后的请求，并把译文或异常交回每个调用方"""
+        unique_texts = list(dict.fromkeys(text for text, _ in bucket.units))
+        with self.lock:
+            self.requests += 1
+            self.texts += len(unique_texts)
+        
+        try:
+            translations = dict(zip(unique_texts, bucket.translator.translate_chunk(unique_texts, keywords)))
+            for text, future in bucket.units:
+                if text not in translations:
+                    raise RuntimeError(f"合并请求缺少译文: {text[:50]}")
+                future.set_result(translations[text])
+        except BaseException as e:
+            # 包括中断（KeyboardInterrupt 等）：还没有结果的调用方都收到异常，不会一直等待
+            for _, future in bucket.units:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """判断 API 异常是否为配额耗尽（HTTP 429 / RESOURCE_EXHAUSTED）"""
+    return getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+def call_model(client: genai.Client, model: str, prompt: str):
+    """调用一次模型并记录调用结果和 token 用量指标"""
+    try:
+        response = client.models.generate_content(model=model, contents=prompt)
+    except Exception as e:
+        metrics.API_CALLS.inc(outcome='rate_limited' if is_rate_limited(e) else 'error')
+        raise
+    metrics.API_CALLS.inc(outcome='success')
+    usage_metadata = getattr(response, 'usage_metadata', None)
+    if usage_metadata is not None:
+        metrics.API_TOKENS.inc(usage_metadata.prompt_token_count or 0, direction='input')
+        metrics.API_TOKENS.inc(usage_metadata.candidates_token_count or 0, direction='output')
+    return response
+
+
+class ApiKeyState:
+    """
+    单个 API 密钥的客户端和限流状态：在途请求数、时间窗口内的请求数、被限流后的冷却时间及累计用量
+
+    同一密钥的所有 KeyPool 应共用同一个 ApiKeyState，限流状态才能在任务之间共享
+    """
+
+    def __init__(self, api_key: str, client: Optional[genai.Client] = None,
+                 max_requests: int = DEFAULT_REQUEST_CONCURRENCY, requests_per_minute: int = 0):
+        """
+        Args:
+            api_key: Gemini API 密钥
+            client: 已创建的客户端，None 时按 api_key 新建
+            max_requests: 该密钥同时发出的请求数
+            requests_per_minute: 该密钥每分钟的请求配额，0 表示不限制（只按在途请求数分配）
+        """
+        self.key_id = content_hash(api_key)
+        self.client = client or genai.Client(api_key=api_key)
+        self.max_requests = max(1, max_requests)
+        self.requests_per_minute = requests_per_minute
+        self.in_flight = 0
+        self.recent = []
+        self.cooldown_until = 0.0
+        self.consecutive_rate_limits = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def remaining_quota(self, now: float) -> int:
+        """当前可以再发出的请求数（调用方需持有 KeyPool.condition）"""
+        if now < self.cooldown_until:
+            return 0
+        free = self.max_requests - self.in_flight
+        if not self.requests_per_minute:
+            return free
+        window_start = now - QUOTA_WINDOW_SECONDS
+        while self.recent and self.recent[0] <= window_start:
+            self.recent.pop(0)
+        return min(free, self.requests_per_minute - len(self.recent))
+
+    def ready_at(self, now: float) -> float:
+        """密钥预计恢复可用的时间（调用方需持有 KeyPool.condition）"""
+        if now < self.cooldown_until:
+            return self.cooldown_until
+        if self.requests_per_minute and len(self.recent) >= self.requests_per_minute:
+            return self.recent[0] + QUOTA_WINDOW_SECONDS
+        return now
+
+    def usage(self, now: Optional[float] = None) -> Dict:
+        """累计用量和当前状态（调用方需持有 KeyPool.condition）"""
+        now = now or time.time()
+        return {
+            'key_id': self.key_id,
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'remaining_quota': self.remaining_quota(now),
+            'cooldown_seconds': round(max(0.0, self.cooldown_until - now), 1)
+        }
+
+
+class KeyPool:
+    """
+    多个 API 密钥组成的密钥池：每个请求发给剩余配额最多的密钥，收到 429 的密钥进入冷却，
+    请求换用其他密钥重试；所有密钥都不可用时等待最早恢复的密钥
+    """
+
+    # 所有密钥池共用，保护 ApiKeyState 的计数，并在密钥释放时唤醒等待的请求
+    condition = threading.Condition()
+
+    def __init__(self, keys: List[ApiKeyState]):
+        """
+        Args:
+            keys: 密钥状态列表（不能为空）
+        """
+        if not keys:
+            raise ValueError("密钥池至少需要一个 API 密钥")
+        self.keys = keys
+        self.waiting = 0  # 等待可用密钥的请求数
+
+    @classmethod
+    def from_api_keys(cls, api_keys: List[str], max_requests: int = DEFAULT_REQUEST_CONCURRENCY,
+                      requests_per_minute: int = 0) -> 'KeyPool':
+        """按密钥列表创建密钥池（重复的密钥只保留一个）"""
+        return cls([ApiKeyState(api_key, max_requests=max_requests, requests_per_minute=requests_per_minute)
+                    for api_key in dict.fromkeys(api_keys)])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def generate(self, model: str, prompt: str, usage: Optional[Dict] = None,
+                 on_retry: Optional[Callable[[], None]] = None, on_latency: Optional[Callable[[float], None]] = None):
+        """
+        用剩余配额最多的密钥调用模型；被限流时换用其他密钥重试
+
+        Args:
+            model: 模型名称
+            prompt: 提示词
+            usage: 按 key_id 累计本次调用方用量的字典（requests / rate_limited / errors）
+            on_retry: 每次被限流后重试前调用
+            on_latency: 成功时以模型调用本身的耗时（秒，不含等待密钥的时间）调用
+
+        Returns:
+            模型的响应
+        """
+        attempts = 0
+        while True:
+            key = self._acquire()
+            started = time.time()
+            try:
+                response = call_model(key.client, model, prompt)
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                self._release(key, 'rate_limited' if rate_limited else 'errors', usage)
+                attempts += 1
+                if not rate_limited or attempts >= RATE_LIMIT_RETRIES_PER_KEY * len(self.keys):
+                    raise
+                logger.warning(f"API 密钥 {key.key_id} 被限流，换用其他密钥重试")
+                if on_retry is not None:
+                    on_retry()
+                continue
+            self._release(key, 'requests', usage)
+            if on_latency is not None:
+                on_latency(time.time() - started)
+            return response
+
+    def usage(self) -> List[Dict]:
+        """各密钥的累计用量和当前状态"""
+        with self.condition:
+            now = time.time()
+            return [key.usage(now) for key in self.keys]
+
+    def congested(self) -> bool:
+        """是否有请求在等待密钥，或有密钥被限流冷却（此时额外的请求只会加剧排队和限流）"""
+        with self.condition:
+            now = time.time()
+            return self.waiting > 0 or any(now < key.cooldown_until for key in self.keys)
+
+    def _acquire(self) -> ApiKeyState:
+        """占用剩余配额最多的密钥，全部不可用时等待"""
+        with self.condition:
+            while True:
+                now = time.time()
+                # 剩余配额相同时选在途和累计请求更少的密钥，使请求均匀分布
+                quotas = [(key.remaining_quota(now), -key.in_flight, -key.requests, -index)
+                          for index, key in enumerate(self.keys)]
+                remaining, _, _, index = max(quotas)
+                index = -index
+                if remaining > 0:
+                    key = self.keys[index]
+                    key.in_flight += 1
+                    if key.requests_per_minute:
+                        key.recent.append(now)
+                    return key
+                # 冷却或配额窗口到期时不会有通知，按最早恢复时间超时等待
+                wait = min(key.ready_at(now) for key in self.keys) - now
+                self.waiting += 1
+                try:
+                    self.condition.wait(timeout=max(0.01, wait) if wait > 0 else None)
+                finally:
+                    self.waiting -= 1
+
+    def _release(self, key: ApiKeyState, outcome: str, usage: Optional[Dict]):
+        """释放密钥并记录结果：requests（成功）/ rate_limited / errors"""
+        with self.condition:
+            key.in_flight -= 1
+            setattr(key, outcome, getattr(key, outcome) + 1)
+            if outcome == 'rate_limited':
+                cooldown = min(RATE_LIMIT_COOLDOWN_SECONDS * 2 ** key.consecutive_rate_limits,
+                               MAX_RATE_LIMIT_COOLDOWN_SECONDS)
+                key.consecutive_rate_limits += 1
+                key.cooldown_until = time.time() + cooldown
+                logger.warning(f"API 密钥 {key.key_id} 冷却 {cooldown} 秒")
+            elif outcome == 'requests':
+                key.consecutive_rate_limits = 0
+            if usage is not None:
+                key_usage = usage.setdefault(key.key_id, {'requests': 0, 'rate_limited': 0, 'errors': 0})
+                key_usage[outcome] += 1
+            self.condition.notify_all()
+
+
+class RequestHedger:
+    """
+    请求对冲：请求耗时超过近期延迟的指定百分位时再发出一个相同的请求，先返回有效结果的请求胜出；
+    对冲请求数不超过总请求数的 budget 比例。延迟统计只包含模型调用本身（不含排队等待密钥的时间）；
+    请求还在排队、或调用方报告拥塞（如密钥池有等待的请求或密钥在冷却）时不对冲
+
+    多个翻译器可共用同一个对冲器，共享延迟统计和对冲预算
+    """
+
+    def __init__(self, percentile: float = 95, budget: float = 0.05, min_delay: float = 0.5):
+        """
+        Args:
+            percentile: 触发对冲的延迟百分位（0-100）
+            budget: 对冲请求数占总请求数的比例上限
+            min_delay: 触发对冲的最短等待时间（秒），避免对本来就很快的请求对冲
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.latencies = []
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix='hedge')
+
+    def delay(self) -> Optional[float]:
+        """触发对冲的等待时间；样本不足时返回 None（不对冲）"""
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    def call(self, request: Callable[[Callable[[float], None]], Optional[str]],
+             is_valid: Callable[[Optional[str]], bool],
+             congested: Optional[Callable[[], bool]] = None) -> Optional[str]:
+        """
+        执行请求，超过对冲延迟仍未返回时发出对冲请求
+
+        Args:
+            request: 发出一次请求并返回结果的函数（可重复调用），参数是记录延迟的回调，
+                     请求应以模型调用本身的耗时（秒）调用它
+            is_valid: 判断结果是否有效；无效结果只在另一个请求也失败时才返回
+            congested: 返回 True 时不发出对冲请求
+
+        Returns:
+            Optional[str]: 先返回的有效结果；都无效时返回最后完成的结果，都出错时抛出最后的异常
+        """
+        delay = self.delay()
+        with self.lock:
+            self.requests += 1
+        primary = self._submit(request)
+        futures = [primary]
+        try:
+            # 主请求在对冲延迟内完成，或预算已用完时，直接等待主请求
+            primary.result(timeout=delay)
+        except TimeoutError:
+            # 主请求还在对冲线程池中排队或后端已拥塞时，对冲请求只会继续排队
+            hedge = primary.running() and not (congested is not None and congested())
+            with self.lock:
+                hedge = hedge and self.hedges + 1 <= self.budget * self.requests
+                if hedge:
+                    self.hedges += 1
+            if hedge:
+                logger.info(f"请求超过 {delay:.1f} 秒未返回，发出对冲请求")
+                futures.append(self._submit(request))
+        except Exception:
+            pass
+        
+        result = None
+        error = None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if is_valid(result):
+                if future is not primary:
+                    with self.lock:
+                        self.hedge_wins += 1
+                return result
+            error = None
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self) -> Dict:
+        """请求数、对冲请求数、对冲胜出数和当前对冲延迟"""
+        delay = self.delay()
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_delay': round(delay, 2) if delay is not None else None
+            }
+
+    def close(self):
+        """停止对冲线程池（不等待进行中的请求）"""
+        self.executor.shutdown(wait=False)
+
+    def record_latency(self, seconds: float):
+        """记录一次成功的模型调用的耗时"""
+        with self.lock:
+            self.latencies.append(seconds)
+            del self.latencies[:-HEDGE_LATENCY_WINDOW]
+
+    def _submit(self, request: Callable[[Callable[[float], None]], Optional[str]]) -> Future:
+        """在线程池中发出请求"""
+        return self.executor.submit(request, self.record_latency)
+
+
+class CircuitBreaker:
+    """
+    翻译接口熔断器：连续失败 failure_threshold 次后打开，打开期间的调用直接抛出 BackendUnavailable；
+    reset_seconds 后进入半开状态，只放行一次试探请求，成功则关闭，失败则重新打开
+
+    多个翻译器可共用同一个熔断器（如同一组 API 密钥的所有任务）
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        """
+        Args:
+            failure_threshold: 打开熔断器所需的连续失败次数
+            reset_seconds: 打开后多久放行试探请求（秒）
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = ''
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """
+        调用接口前检查熔断状态
+
+        Raises:
+            BackendUnavailable: 熔断器打开，或半开状态下已有试探请求在进行
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                logger.info("熔断器半开，放行一次试探请求")
+                return
+            raise BackendUnavailable(f"翻译接口连续 {self.failures} 次调用失败，已暂停调用"
+                                     f"（{self.reset_seconds:g} 秒后重试）: {self.last_error}")
+
+    def record_success(self):
+        """记录一次成功的调用，关闭熔断器"""
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("试探请求成功，熔断器关闭")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error: Exception):
+        """记录一次失败的调用，连续失败达到阈值或试探失败时打开熔断器"""
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"翻译接口连续 {self.failures} 次调用失败，熔断器打开: {self.last_error}")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+                self.probing = False
+
+    def stats(self) -> Dict:
+        """熔断器状态"""
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+def create_process_pool(max_workers: Optional[int] = None, **kwargs) -> ProcessPoolExecutor:
+    """
+    创建进程池，子进程按 PROCESS_START_METHOD 启动，不从带有工作线程的进程 fork
+    
+    Args:
+        max_workers: 进程数，None 表示 CPU 核数
+        **kwargs: 其他 ProcessPoolExecutor 参数（如 initializer）
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+                               **kwargs)
+
+
+def _run_cpu_stage_in_worker(method_name: str, args: Tuple) -> Tuple:
+    """
+    在进程池子进程中执行不需要 API 的翻译器方法（子进程内不再嵌套并行扫描）
+
+    Returns:
+        Tuple: (方法返回值, 子进程执行该方法的 CPU 时间, 子进程峰值内存字节数)
+    """
+    started_cpu = time.process_time()
+    result = getattr(ExcelTranslator(api_key=None, scan_workers=1), method_name)(*args)
+    return result, time.process_time() - started_cpu, peak_rss_bytes()
+
 
 class ExcelTranslator:
-    def __init__(self, api_key: str):
+    # 所有翻译器共用：同一进程中的任务同时保存清单时依次写入
+    manifest_lock = threading.Lock()
+    # 所有翻译器共用：正在被任务使用的任务日志，同一日志同时只属于一个任务
+    journal_lock = threading.Lock()
+    journals_in_use = set()
+
+    def __init__(self, api_key: Union[str, List[str], None], scan_workers: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 request_concurrency: int = DEFAULT_REQUEST_CONCURRENCY, request_limiter=None,
+                 cpu_executor: Optional[Executor] = None,
+                 translation_memory: Optional['TranslationMemory'] = None,
+                 request_packer: Optional['RequestPacker'] = None, client: Optional[genai.Client] = None,
+                 key_pool: Optional[KeyPool] = None, hedger: Optional[RequestHedger] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 instrumentation_hooks: Optional[List[Callable[[Dict], None]]] = None):
         """
         初始化翻译器
         
         Args:
-            api_key: Gemini API 密钥
+            api_key: Gemini API 密钥，或多个密钥的列表（组成密钥池，按剩余配额分配请求）；
+                     为 None 时只能使用提取、术语库匹配、写回等本地功能
+            scan_workers: 并行扫描工作表的进程数，None 表示使用 CPU 核数，1 表示串行
+            chunk_size: 每次 API 调用翻译的文本数量上限
+            chunk_chars: 每次 API 调用翻译的中文字符数上限
+            request_concurrency: 单个任务在每个 API 密钥上同时发出的 API 请求数
+            request_limiter: 限制在途请求数的信号量，多个翻译器共用同一 API 密钥时应共享同一个
+            cpu_executor: 进程池；提供时提取和写回等 CPU 密集阶段在其中执行，不占用当前进程的 GIL
+            translation_memory: 共享译文缓存；多个翻译器共用时相同文本只翻译一次
+            request_packer: 跨任务请求打包器；同一 API 密钥的多个翻译器共用时，小任务的文本合并成满额请求
+            client: 已创建的 Gemini 客户端；提供时复用其连接池，不再按 api_key 新建
+            key_pool: 已创建的密钥池；提供时请求经由密钥池发出，忽略 api_key、client 和 request_limiter
+            hedger: 请求对冲器；提供时耗时过长的翻译块请求会再发一份，先返回有效结果的胜出
+            circuit_breaker: 熔断器，默认每个翻译器一个；接口连续失败时任务直接失败，不再逐个重试
+            instrumentation_hooks: 埋点钩子，每个阶段（extract / translate / write / terminology）和
+                                   每次接口调用（api_call）结束时以 span 字典调用（见 Instrumentation）
         """
-        self.client = genai.Client(api_key=api_key)
-        self.chinese_pattern = re.compile(r'[\u4e00-\u9fff]+')
+        if key_pool is None and isinstance(api_key, (list, tuple)):
+            key_pool = KeyPool.from_api_keys(api_key, max_requests=request_concurrency)
+        if key_pool is None and client is None and api_key:
+            client = genai.Client(api_key=api_key)
+        self.client = client
+        self.key_pool = key_pool
+        self.key_usage = {}  # 本翻译器按 key_id 统计的请求数、被限流数和出错数
+        self.model = DEFAULT_MODEL
+        self.chinese_pattern = CHINESE_PATTERN
         self.terminology_dict = {}  # 术语库字典
+        self.scan_workers = scan_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunk_chars = chunk_chars
+        self.request_concurrency = max(1, request_concurrency) * (len(key_pool) if key_pool else 1)
+        self.request_limiter = request_limiter or threading.BoundedSemaphore(self.request_concurrency)
+        self.cpu_executor = cpu_executor
+        self.translation_memory = translation_memory
+        self.request_packer = request_packer
+        self.hedger = hedger
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.instrumentation = Instrumentation([record_stage_metrics] + list(instrumentation_hooks or []))
         
     def load_terminology(self, terminology_file: str) -> Dict:
         """
@@ -74,7 +1406,9 @@ class ExcelTranslator:
             logger.error(f"加载术语库失败: {str(e)}")
             return {}
     
-    def apply_terminology_matching(self, input_file: str, output_file: str, terminology_file: str = None) -> int:
+    def apply_terminology_matching(self, input_file: str, output_file: str, terminology_file: str = None,
+                                   progress_callback=None, terminology_dict: Optional[Dict] = None,
+                                   audit_file: Optional[str] = None) -> int:
         """
         应用术语库匹配，替换精确匹配的术语
         
@@ -82,65 +1416,79 @@ class ExcelTranslator:
             input_file: 输入Excel文件路径
             output_file: 输出Excel文件路径
             terminology_file: 术语库文件路径，如果为None则使用默认的terminology_sample.xlsx
+            progress_callback: 进度回调（见 notify_progress），阶段为 scan / write / done
+            terminology_dict: 已加载的术语库字典；提供时不再读取 terminology_file
+            audit_file: 单元格审计文件路径；提供时每个替换的单元格追加一条记录（见 CellLog）
             
         Returns:
             int: 替换的术语数量
         """
         try:
-            # 加载术语库
-            if terminology_file is None:
-                terminology_file = "terminology_sample.xlsx"
-            
-            terminology_dict = self.load_terminology(terminology_file)
-            if not terminology_dict:
-                logger.warning("术语库为空或加载失败")
-                return 0
-            
-            logger.info(f"开始术语库匹配处理: {input_file}")
-            
-            # 加载Excel文件
-            workbook = load_workbook(input_file)
-            replacement_count = 0
-            
-            # 遍历所有工作表
-            for sheet_name in workbook.sheetnames:
-                logger.info(f"处理工作表: {sheet_name}")
-                worksheet = workbook[sheet_name]
-                
-                # 获取合并单元格信息
-                merged_cells_info = self.extract_merged_cells_info(worksheet)
-                
-                # 遍历所有单元格
-                for row in worksheet.iter_rows():
-                    for cell in row:
-                        if cell.value:
-                            cell_value = str(cell.value).strip()
-                            
-                            # 检查是否在术语库中有精确匹配
-                            if cell_value in terminology_dict:
-                                old_value = cell_value
-                                new_value = terminology_dict[cell_value]
-                                
-                                # 检查是否为合并单元格
-                                cell_coord = cell.coordinate
-                                if cell_coord in merged_cells_info:
-                                    merged_info = merged_cells_info[cell_coord]
-                                    # 只在主单元格更新
-                                    if cell_coord == merged_info['master_cell']:
-                                        cell.value = new_value
-                                        replacement_count += 1
-                                        logger.info(f"替换术语 [{sheet_name}]{cell_coord}: '{old_value}' -> '{new_value}'")
-                                else:
-                                    cell.value = new_value
-                                    replacement_count += 1
-                                    logger.info(f"替换术语 [{sheet_name}]{cell_coord}: '{old_value}' -> '{new_value}'")
-            
-            # 保存文件
-            workbook.save(output_file)
-            workbook.close()
-            
-            logger.info(f"术语库匹配完成，共替换 {replacement_count} 个术语，结果保存到: {output_file}")
-            return replacement_count
+            with self.instrumentation.span('terminology'):
+                # 加载术语库
+                if terminology_file is None:
+                    terminology_file = DEFAULT_TERMINOLOGY_FILE
+                
+                if terminology_dict is None:
+                    terminology_dict = self.load_terminology(terminology_file)
+                else:
+                    self.terminology_dict = terminology_dict
+                if not terminology_dict:
+                    logger.warning("术语库为空或加载失败，输出文件与原文件相同")
+                    shutil.copyfile(input_file, output_file)
+                    notify_progress(progress_callback, 'stage', stage='done')
+                    return 0
+                
+                logger.info(f"开始术语库匹配处理: {input_file}")
+                
+                # 扫描阶段只定位需要替换的单元格，可按工作表并行
+                notify_progress(progress_callback, 'stage', stage='scan')
+                scan_results = self.scan_workbook(input_file, terms=frozenset(terminology_dict))
+                
+                match_count = sum(len(matches) for matches, _ in scan_results.values())
+                if not match_count:
+                    # 没有可替换的术语，无需加载和重写整个工作簿
+                    shutil.copyfile(input_file, output_file)
+                    logger.info(f"术语库匹配完成，共替换 0 个术语，结果保存到: {output_file}")
+                    notify_progress(progress_callback, 'stage', stage='done')
+                    return 0
+                
+                notify_progress(progress_callback, 'stage', stage='write', total=match_count)
+                
+                # 加载Excel文件
+                workbook = load_workbook(input_file)
+                replacement_count = 0
+                cell_log = CellLog('terminology', audit_file)
+                
+                for sheet_name, (matches, merged_refs) in scan_results.items():
+                    if not matches:
+                        continue
+                    worksheet = workbook[sheet_name]
+                    
+                    # 获取合并单元格信息
+                    merged_cells_info = build_merged_cells_info(CellRange(ref) for ref in merged_refs)
+                    
+                    for row, column, old_value in matches:
+                        new_value = terminology_dict[old_value]
+                        cell_coord = f"{get_column_letter(column)}{row}"
+                        
+                        # 合并单元格只在主单元格更新
+                        merged_info = merged_cells_info.get(cell_coord)
+                        if merged_info and cell_coord != merged_info['master_cell']:
+                            continue
+                        
+                        worksheet.cell(row=row, column=column).value = new_value
+                        replacement_count += 1
+                        cell_log.record(sheet_name, cell_coord, old_value, new_value)
+                
+                # 保存文件
+                workbook.save(output_file)
+                workbook.close()
+                cell_log.flush()
+                
+                logger.info(f"术语库匹配完成，共替换 {replacement_count} 个术语，结果保存到: {output_file}")
+                notify_progress(progress_callback, 'stage', stage='done')
+                return replacement_count
             
         except Exception as e:
             logger.error(f"术语库匹配过程中出现错误: {str(e)}")
@@ -170,65 +1518,73 @@ class ExcelTranslator:
         Returns:
             Dict: 合并单元格信息
         """
-        merged_cells_info = {}
-        for merged_range in worksheet.merged_cells.ranges:
-            # 获取合并区域的所有单元格
-            for row in range(merged_range.min_row, merged_range.max_row + 1):
-                for col in range(merged_range.min_col, merged_range.max_col + 1):
-                    cell_coord = f"{get_column_letter(col)}{row}"
-                    merged_cells_info[cell_coord] = {
-                        'master_cell': f"{get_column_letter(merged_range.min_col)}{merged_range.min_row}",
-                        'range': str(merged_range)
-                    }
-        return merged_cells_info
+        return build_merged_cells_info(worksheet.merged_cells.ranges)
     
-    def extract_chinese_content(self, file_path: str) -> Dict:
+    def extract_chinese_content(self, file_path: str, scope: Optional[CellScope] = None) -> Dict:
         """
         提取 Excel 文件中所有包含中文的单元格内容
         
         Args:
             file_path: Excel 文件路径
+            scope: 处理范围，None 表示所有工作表的所有单元格
             
         Returns:
             Dict: 包含位置和内容的字典
         """
         logger.info(f"正在分析文件: {file_path}")
         
-        workbook = load_workbook(file_path)
-        chinese_content = {}
+        sheet_states = {}
+        chinese_content = build_chinese_content(self.scan_workbook(file_path, scope=scope, sheet_states=sheet_states),
+                                                sheet_states)
         
-        for sheet_name in workbook.sheetnames:
-            logger.info(f"处理工作表: {sheet_name}")
-            worksheet = workbook[sheet_name]
-            
-            # 获取合并单元格信息
-            merged_cells_info = self.extract_merged_cells_info(worksheet)
-            
-            sheet_chinese_content = {}
+        logger.info(f"找到 {sum(len(content) for content in chinese_content.values())} 个包含中文的单元格")
+        return chinese_content
+    
+    def scan_workbook(self, file_path: str, terms=None, workers: Optional[int] = None,
+                      scope: Optional[CellScope] = None, sheet_states: Optional[Dict] = None) -> Dict:
+        """
+        扫描工作簿的所有工作表；大文件按工作表分发到多个进程并行扫描
+        
+        Args:
+            file_path: Excel 文件路径
+            terms: 术语集合，为 None 时扫描包含中文的单元格（见 scan_worksheet）
+            workers: 进程数，默认使用 self.scan_workers
+            scope: 处理范围，范围外的工作表直接跳过
+            sheet_states: 提供时填入所有工作表的 {工作表名: 可见状态}
             
-            # 遍历所有单元格
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.value and self.contains_chinese(str(cell.value)):
-                        cell_coord = cell.coordinate
-                        
-                        # 检查是否为合并单元格
-                        is_merged = cell_coord in merged_cells_info
-                        
-                        sheet_chinese_content[cell_coord] = {
-                            'content': str(cell.value),
-                            'row': cell.row,
-                            'column': cell.column,
-                            'is_merged': is_merged,
-                            'merged_info': merged_cells_info.get(cell_coord, None)
-                        }
+        Returns:
+            Dict: {工作表名: (匹配单元格列表, 合并区域引用列表)}，按工作表原顺序排列
+        """
+        workers = workers or self.scan_workers
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            if sheet_states is not None:
+                sheet_states.update((worksheet.title, worksheet.sheet_state) for worksheet in workbook.worksheets)
+            sheet_names = [worksheet.title for worksheet in workbook.worksheets
+                           if scope is None or scope.includes_sheet(worksheet.title, worksheet.sheet_state)]
+            parallel = (workers > 1 and len(sheet_names) > 1
+                        and os.path.getsize(file_path) >= PARALLEL_SCAN_MIN_BYTES)
             
-            if sheet_chinese_content:
-                chinese_content[sheet_name] = sheet_chinese_content
+            if not parallel:
+                results = {}
+                for sheet_name in sheet_names:
+                    logger.info(f"处理工作表: {sheet_name}")
+                    results[sheet_name] = scan_worksheet(workbook[sheet_name], terms, scope)
+                return results
+        finally:
+            workbook.close()
         
-        workbook.close()
-        logger.info(f"找到 {sum(len(content) for content in chinese_content.values())} 个包含中文的单元格")
-        return chinese_content
+        workers = min(workers, len(sheet_names))
+        logger.info(f"使用 {workers} 个进程并行扫描 {len(sheet_names)} 个工作表")
+        with create_process_pool(workers,
+                                 initializer=_init_scan_worker,
+                                 initargs=(file_path, terms, scope)) as executor:
+            results = {}
+            for sheet_name, (result, cpu_seconds, peak_rss) in zip(sheet_names,
+                                                                  executor.map(_scan_sheet_in_worker, sheet_names)):
+                self.instrumentation.add_worker_usage(cpu_seconds, peak_rss)
+                results[sheet_name] = result
+            return results
     
     def prepare_translation_batch(self, chinese_content: Dict, keywords: str = "") -> List[Dict]:
         """
@@ -309,14 +1665,11 @@ class ExcelTranslator:
         
         try:
             # 调用 Gemini API
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt
-            )
+            response_text = self.generate(prompt)
             
-            if response.text:
+            if response_text:
                 # 解析翻译结果
-                translated_lines = [line.strip() for line in response.text.strip().split('\n') if line.strip()]
+                translated_lines = [line.strip() for line in response_text.strip().split('\n') if line.strip()]
                 
                 # 确保翻译结果数量与原文本数量匹配
                 if len(translated_lines) == len(texts):
@@ -329,6 +1682,8 @@ class ExcelTranslator:
                 logger.error("API 返回空响应")
                 translations = self.translate_individually(texts, keywords)
                 
+        except BackendUnavailable:
+            raise
         except Exception as e:
             logger.error(f"批量翻译失败: {str(e)}")
             translations = self.translate_individually(texts, keywords)
@@ -340,6 +1695,9 @@ class ExcelTranslator:
         }
         
         for i, (original_info, translation) in enumerate(zip(batch['mapping'], translations)):
+            # 翻译失败的单元格保持原文
+            if translation is None:
+                continue
             result['translations'].append({
                 'coord': original_info['coord'],
                 'original': original_info['original'],
@@ -349,16 +1707,20 @@ class ExcelTranslator:
         
         return result
     
-    def translate_individually(self, texts: List[str], keywords: str = "") -> List[str]:
+    def translate_individually(self, texts: List[str], keywords: str = "") -> List[Optional[str]]:
         """
-        逐个翻译文本（备用方案）
+        逐个翻译文本（备用方案）；请求之间不额外等待，由密钥池（或 request_limiter）控制请求速率，
+        被限流时密钥进入冷却
         
         Args:
             texts: 待翻译文本列表
             keywords: 专业领域关键词
             
         Returns:
-            List[str]: 翻译结果列表
+            List[Optional[str]]: 翻译结果列表，翻译失败的文本为 None（单元格保持原文）
+            
+        Raises:
+            BackendUnavailable: 熔断器打开，不再继续逐个请求
         """
         logger.info("使用逐个翻译模式")
         translations = []
@@ -376,22 +1738,18 @@ class ExcelTranslator:
                 
                 prompt = "\n".join(prompt_parts)
                 
-                response = self.client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=prompt
-                )
+                response_text = self.generate(prompt)
                 
-                if response.text:
-                    translations.append(response.text.strip())
+                if response_text:
+                    translations.append(response_text.strip())
                 else:
-                    translations.append(f"[翻译失败: {text}]")
-                    
-                # 添加延时避免API限制
-                time.sleep(0.5)
+                    translations.append(None)
                 
+            except BackendUnavailable:
+                raise
             except Exception as e:
-                logger.error(f"翻译文本 '{text}' 时出错: {str(e)}")
-                translations.append(f"[翻译失败: {text}]")
+                logger.error("翻译文本 '%s' 时出错: %s", text, e)
+                translations.append(None)
         
         return translations
     
@@ -408,6 +1766,7 @@ class ExcelTranslator:
         
         # 加载原始文件
         workbook = load_workbook(file_path)
+        cell_log = CellLog('translate')
         
         for result in translation_results:
             sheet_name = result['sheet_name']
@@ -423,80 +1782,420 @@ class ExcelTranslator:
                 translation = translation_info['translation']
                 original_info = translation_info['info']
                 
-                try:
-                    # 获取单元格
-                    cell = worksheet[coord]
-                    
-                    # 处理合并单元格的情况
-                    if original_info['is_merged']:
-                        merged_info = original_info['merged_info']
-                        logger.info(f"处理合并单元格 {coord} (范围: {merged_info['range']})")
-                        
-                        # 只更新主单元格
-                        if coord == merged_info['master_cell']:
-                            cell.value = translation
-                    else:
-                        cell.value = translation
-                        
-                    logger.debug(f"已更新单元格 {coord}: {translation}")
-                    
-                except Exception as e:
-                    logger.error(f"更新单元格 {coord} 时出错: {str(e)}")
+                try:
+                    # 获取单元格
+                    cell = worksheet[coord]
+                    
+                    # 处理合并单元格的情况：只更新主单元格
+                    if original_info['is_merged']:
+                        if coord != original_info['merged_info']['master_cell']:
+                            continue
+                    cell.value = translation
+                    cell_log.record(sheet_name, coord, translation_info['original'], translation)
+                    
+                except Exception as e:
+                    # 出错的单元格可能很多，使用延迟格式化
+                    logger.error("更新单元格 %s 时出错: %s", coord, e)
+        
+        # 保存文件
+        workbook.save(output_path)
+        workbook.close()
+        cell_log.flush()
+        logger.info(f"翻译完成，结果已保存到: {output_path}")
+    
+    def translate_excel(self, input_file: str, output_file: str, keywords: str = "",
+                        manifest_file: Optional[str] = None, checkpoint_dir: Optional[str] = None,
+                        scope: Optional[CellScope] = None, progress_callback=None,
+                        chinese_content: Optional[Dict] = None, deadline: Optional[float] = None,
+                        report_file: Optional[str] = None, audit_file: Optional[str] = None) -> Dict:
+        """
+        翻译整个 Excel 文件
+        
+        Args:
+            input_file: 输入文件路径
+            output_file: 输出文件路径
+            keywords: 专业领域关键词
+            manifest_file: 增量翻译清单路径；提供时只翻译相对上一版本新增或修改的单元格，
+                           其余单元格复用清单中的译文，完成后更新清单
+            checkpoint_dir: 任务日志目录；提供时每完成一块译文即写入日志，
+                            中断后以相同输入重新运行会从断点继续
+            scope: 处理范围（工作表、区域、隐藏内容、公式），范围外的单元格保持原样
+            progress_callback: 进度回调，接收 notify_progress 发送的事件字典；
+                               回调抛出 TranslationCancelled 可在块与块之间取消任务
+            chinese_content: 已提取的中文内容（如由上传时的分析结果还原，且已应用 scope）；
+                             提供时跳过工作簿解析
+            deadline: 截止时间（time.time() 时间戳）；到期前停止翻译并写出部分翻译的工作簿，
+                      未翻译的单元格保持原文，任务日志保留，以相同输入重新运行会继续翻译
+            report_file: 性能报告（JSON）路径；提供时任务结束（包括失败和取消）后写入该文件
+            audit_file: 单元格审计文件路径；提供时每个写入译文的单元格追加一条记录（见 CellLog）
+            
+        Returns:
+            Dict: 翻译报告：translated_cells、untranslated_cells、untranslated（未翻译单元格列表，
+                  含到达截止时间和翻译失败的单元格）、deadline_reached、performance（性能报告，
+                  见 performance_report）
+            
+        Raises:
+            BackendUnavailable: 翻译接口连续失败（熔断器打开）；已完成的块保留在任务日志中
+        """
+        self.instrumentation.reset()
+        journal_file = None
+        try:
+            # 1. 提取中文内容
+            notify_progress(progress_callback, 'stage', stage='extract')
+            with self.instrumentation.span('extract'):
+                if chinese_content is None:
+                    chinese_content = self.run_cpu_stage('extract_chinese_content', input_file, scope)
+            
+            if not chinese_content:
+                logger.info("未找到包含中文的单元格，输出文件与原文件相同")
+                shutil.copyfile(input_file, output_file)
+                notify_progress(progress_callback, 'stage', stage='done')
+                return {'translated_cells': 0, 'untranslated_cells': 0, 'untranslated': [],
+                        'deadline_reached': False,
+                        'performance': self.performance_report(report_file, input_file=input_file,
+                                                               output_file=output_file, status='completed',
+                                                               translated_cells=0, untranslated_cells=0)}
+            
+            total_cells = sum(len(content) for content in chinese_content.values())
+            notify_progress(progress_callback, 'stage', stage='translate', total=total_cells)
+            
+            with self.instrumentation.span('translate'):
+                # 2. 增量模式下与上一版本的清单对比，只保留需要重新翻译的单元格
+                reused_translations = []
+                if manifest_file:
+                    manifest = self.load_manifest(manifest_file, keywords)
+                    chinese_content, reused_translations = self.diff_against_manifest(chinese_content, manifest)
+                    notify_progress(progress_callback, 'reused', cells=len(reused_translations))
+                    self.instrumentation.count('manifest_cells', len(reused_translations))
+                
+                # 3. 分块翻译所有中文内容
+                if checkpoint_dir:
+                    journal_file = self.claim_journal(self.journal_path(checkpoint_dir, input_file, keywords))
+                    if journal_file and os.path.exists(journal_file):
+                        logger.info(f"检测到未完成的翻译任务，将从断点继续: {journal_file}")
+                
+                # 按工作簿大小和近期的写回速率，为写回工作簿预留截止前的时间
+                translate_deadline = None
+                if deadline is not None:
+                    translate_deadline = deadline - TIMING_HISTORY.write_seconds(os.path.getsize(input_file))
+                
+                translation_result = self.translate_all_content(chinese_content, keywords, journal_file,
+                                                                progress_callback, translate_deadline)
+                translation_result['translations'].extend(reused_translations)
+                untranslated = translation_result['untranslated']
+            
+            # 4. 应用翻译结果
+            notify_progress(progress_callback, 'stage', stage='write')
+            with self.instrumentation.span('write'):
+                write_started = time.time()
+                self.run_cpu_stage('apply_all_translations', input_file, translation_result, output_file, audit_file)
+                TIMING_HISTORY.record_write(os.path.getsize(input_file), time.time() - write_started)
+                
+                if manifest_file:
+                    self.save_manifest(manifest_file, translation_result, keywords)
+            
+            # 输出文件已完整生成，本任务占用的任务日志不再需要；部分翻译时保留日志供下次继续
+            if journal_file and os.path.exists(journal_file) and not untranslated:
+                os.remove(journal_file)
+            
+            notify_progress(progress_callback, 'stage', stage='done')
+            if untranslated:
+                logger.warning(f"输出部分翻译的工作簿，{len(untranslated)} 个单元格未翻译（保持原文）")
+            else:
+                logger.info("Excel 翻译完成!")
+            performance = self.performance_report(report_file, input_file=input_file, output_file=output_file,
+                                                  status='partial' if untranslated else 'completed',
+                                                  translated_cells=len(translation_result['translations']),
+                                                  untranslated_cells=len(untranslated))
+            return {
+                'translated_cells': len(translation_result['translations']),
+                'untranslated_cells': len(untranslated),
+                'untranslated': untranslated,
+                'deadline_reached': translation_result['deadline_reached'],
+                'performance': performance
+            }
+            
+        except TranslationCancelled:
+            logger.info("翻译任务已取消")
+            self.performance_report(report_file, input_file=input_file, output_file=output_file, status='cancelled')
+            raise
+        except Exception as e:
+            logger.error(f"翻译过程中出现错误: {str(e)}")
+            self.performance_report(report_file, input_file=input_file, output_file=output_file, status='failed',
+                                    error=str(e))
+            raise
+        finally:
+            if journal_file:
+                self.release_journal(journal_file)
+    
+    def performance_report(self, report_file: Optional[str] = None, **fields) -> Dict:
+        """
+        汇总本次任务的性能报告：总墙钟和 CPU 时间、峰值内存、各阶段的墙钟和 CPU 时间、
+        请求数（出错、限流重试、切换逐个翻译）、token 用量和缓存命中
+        
+        Args:
+            report_file: 提供时将报告写入该文件（JSON），写入失败只记录警告
+            **fields: 附加到报告中的字段
+            
+        Returns:
+            Dict: 性能报告
+        """
+        report = self.instrumentation.report(**fields)
+        if report_file:
+            try:
+                write_report(report, report_file)
+            except OSError as e:
+                logger.warning(f"无法写入性能报告: {report_file}: {str(e)}")
+        return report
+
+    def estimate_translation_size(self, file_path: str, scope: Optional[CellScope] = None) -> Dict:
+        """
+        流式扫描文件并估算翻译任务规模（不调用 API）
+        
+        Args:
+            file_path: Excel 文件路径
+            scope: 单元格范围过滤
+            
+        Returns:
+            Dict: 见 estimate_job_size
+        """
+        return estimate_job_size(self.extract_chinese_content(file_path, scope), self.chunk_size)
+
+    def analyze_workbook(self, file_path: str, analysis_file: Optional[str] = None) -> Dict:
+        """
+        流式扫描一次工作簿，生成可复用的分析结果：工作表列表、所有中文单元格记录
+        （含隐藏、公式标记）、不同文本表和任务规模估算
+        
+        Args:
+            file_path: Excel 文件路径
+            analysis_file: 提供时将分析结果写入该文件
+            
+        Returns:
+            Dict: 分析结果，可用 chinese_content_from_analysis 还原中文内容
+        """
+        logger.info(f"正在分析文件: {file_path}")
+        
+        sheet_states = {}
+        scan_results = self.scan_workbook(file_path, sheet_states=sheet_states)
+        chinese_content = build_chinese_content(scan_results, sheet_states)
+        
+        # 单元格记录引用不同文本表的下标，重复文本只存一次
+        strings = {}
+        cells = {}
+        for sheet_name, (matches, _) in scan_results.items():
+            if matches:
+                cells[sheet_name] = [[row, column, strings.setdefault(content, len(strings)),
+                                      chinese_chars, int(hidden), int(formula)]
+                                     for row, column, content, chinese_chars, hidden, formula in matches]
+        
+        file_stat = os.stat(file_path)
+        analysis = {
+            'version': ANALYSIS_VERSION,
+            'file_size': file_stat.st_size,
+            'file_mtime': file_stat.st_mtime,
+            'sheets': [{'name': name, 'state': state} for name, state in sheet_states.items()],
+            'chinese_cells': sum(len(content) for content in chinese_content.values()),
+            'estimate': estimate_job_size(chinese_content, self.chunk_size),
+            'strings': list(strings),
+            'cells': cells,
+            'merged': {sheet_name: merged_refs for sheet_name, (_, merged_refs) in scan_results.items()
+                       if sheet_name in cells and merged_refs}
+        }
+        
+        if analysis_file:
+            temp_file = f"{analysis_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(analysis, f, ensure_ascii=False)
+            os.replace(temp_file, analysis_file)
+            logger.info(f"分析结果已保存: {analysis_file}")
+        
+        return analysis
+
+    def load_analysis(self, analysis_file: str, file_path: str) -> Optional[Dict]:
+        """
+        加载工作簿的分析结果
+        
+        Args:
+            analysis_file: 分析结果文件路径
+            file_path: 对应的 Excel 文件路径，文件大小或修改时间不一致时分析结果作废
+            
+        Returns:
+            Optional[Dict]: 分析结果，不存在或已失效时返回 None
+        """
+        if not os.path.exists(analysis_file):
+            return None
+        
+        try:
+            with open(analysis_file, 'r', encoding='utf-8') as f:
+                analysis = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取分析结果失败: {str(e)}")
+            return None
+        
+        file_stat = os.stat(file_path)
+        if (analysis.get('version') != ANALYSIS_VERSION or analysis.get('file_size') != file_stat.st_size
+                or analysis.get('file_mtime') != file_stat.st_mtime):
+            logger.info(f"分析结果已失效: {analysis_file}")
+            return None
+        
+        return analysis
+
+    def run_cpu_stage(self, method_name: str, *args):
+        """
+        执行 CPU 密集阶段（解析提取、写回）；配置了进程池时在子进程中执行
+        
+        Args:
+            method_name: ExcelTranslator 的方法名
+            *args: 方法参数（需可序列化）
+            
+        Returns:
+            方法返回值
+        """
+        if self.cpu_executor is None:
+            return getattr(self, method_name)(*args)
+        result, cpu_seconds, peak_rss = self.cpu_executor.submit(_run_cpu_stage_in_worker, method_name, args).result()
+        self.instrumentation.add_worker_usage(cpu_seconds, peak_rss)
+        return result
+
+    def load_manifest(self, manifest_file: str, keywords: str = "") -> Dict:
+        """
+        加载增量翻译清单
+        
+        Args:
+            manifest_file: 清单文件路径
+            keywords: 专业领域关键词，与清单记录的不一致时清单作废
+            
+        Returns:
+            Dict: {工作表名: {单元格坐标: {'hash': 内容哈希, 'translation': 译文}}}
+        """
+        if not os.path.exists(manifest_file):
+            logger.info(f"增量翻译清单不存在，将完整翻译: {manifest_file}")
+            return {}
+        
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取增量翻译清单失败，将完整翻译: {str(e)}")
+            return {}
+        
+        if (manifest.get('version') != MANIFEST_VERSION or manifest.get('keywords') != keywords
+                or manifest.get('model') != self.model):
+            logger.info("增量翻译清单的版本、关键词或模型已变化，将完整翻译")
+            return {}
+        
+        return manifest.get('sheets', {})
+    
+    def diff_against_manifest(self, chinese_content: Dict, manifest: Dict) -> Tuple[Dict, List[Dict]]:
+        """
+        将提取的中文内容与清单对比，拆分为待翻译内容和可复用的译文
+        
+        同一位置内容哈希未变时直接复用；位置变化但内容在旧版本中出现过时也复用其译文。
+        
+        Args:
+            chinese_content: 提取的中文内容
+            manifest: load_manifest 返回的清单
+            
+        Returns:
+            Tuple: (待翻译的中文内容, 复用的翻译结果列表)
+        """
+        translations_by_hash = {}
+        for cells in manifest.values():
+            for entry in cells.values():
+                translations_by_hash[entry['hash']] = entry['translation']
+        
+        pending_content = {}
+        reused_translations = []
+        
+        for sheet_name, content in chinese_content.items():
+            sheet_manifest = manifest.get(sheet_name, {})
+            for cell_coord, cell_info in content.items():
+                digest = content_hash(cell_info['content'])
+                entry = sheet_manifest.get(cell_coord)
+                
+                if entry and entry['hash'] == digest:
+                    translation = entry['translation']
+                else:
+                    translation = translations_by_hash.get(digest)
+                
+                if translation is None:
+                    pending_content.setdefault(sheet_name, {})[cell_coord] = cell_info
+                else:
+                    reused_translations.append({
+                        'sheet_name': sheet_name,
+                        'coord': cell_coord,
+                        'original': cell_info['content'],
+                        'translation': translation,
+                        'info': cell_info
+                    })
         
-        # 保存文件
-        workbook.save(output_path)
-        workbook.close()
-        logger.info(f"翻译完成，结果已保存到: {output_path}")
+        pending_count = sum(len(content) for content in pending_content.values())
+        logger.info(f"增量翻译: 复用 {len(reused_translations)} 个译文，需翻译 {pending_count} 个文本")
+        return pending_content, reused_translations
     
-    def translate_excel(self, input_file: str, output_file: str, keywords: str = ""):
+    def save_manifest(self, manifest_file: str, translation_result: Dict, keywords: str = ""):
         """
-        翻译整个 Excel 文件
+        保存本次翻译的增量翻译清单（持有 manifest_lock 写入各自的临时文件再替换，
+        避免中断或同时保存时损坏清单）
         
         Args:
-            input_file: 输入文件路径
-            output_file: 输出文件路径
+            manifest_file: 清单文件路径
+            translation_result: 翻译结果（包含复用的译文）
             keywords: 专业领域关键词
         """
-        try:
-            # 1. 提取中文内容
-            chinese_content = self.extract_chinese_content(input_file)
-            
-            if not chinese_content:
-                logger.info("未找到包含中文的单元格")
-                return
-            
-            # 2. 一次性翻译所有中文内容
-            translation_result = self.translate_all_content(chinese_content, keywords)
-            
-            # 3. 应用翻译结果
-            self.apply_all_translations(input_file, translation_result, output_file)
-            
-            logger.info("Excel 翻译完成!")
-            
-        except Exception as e:
-            logger.error(f"翻译过程中出现错误: {str(e)}")
-            raise
+        sheets = {}
+        for trans in translation_result['translations']:
+            # 失败占位不写入清单，下次增量翻译时重试
+            if is_failed_translation(trans['translation']):
+                continue
+            sheets.setdefault(trans['sheet_name'], {})[trans['coord']] = {
+                'hash': content_hash(trans['original']),
+                'translation': trans['translation']
+            }
+        
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'keywords': keywords,
+            'model': self.model,
+            'sheets': sheets
+        }
+        
+        manifest_dir = os.path.dirname(manifest_file)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        # 临时文件按进程和线程区分，多个进程同时保存同一清单时也不会写入同一个临时文件
+        temp_file = f"{manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self.manifest_lock:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(temp_file, manifest_file)
+        logger.info(f"增量翻译清单已保存: {manifest_file}")
 
-    def translate_all_content(self, chinese_content: Dict, keywords: str = "") -> Dict:
+    def translate_all_content(self, chinese_content: Dict, keywords: str = "",
+                              journal_file: Optional[str] = None, progress_callback=None,
+                              deadline: Optional[float] = None) -> Dict:
         """
-        一次性翻译所有中文内容
+        分块翻译所有中文内容
         
         Args:
             chinese_content: 提取的中文内容
             keywords: 专业领域关键词
+            journal_file: 任务日志路径；每完成一块即追加到日志，重启后跳过已完成的单元格
+            progress_callback: 进度回调（见 notify_progress）
+            deadline: 截止时间（time.time() 时间戳）；提供时先翻译价值最高的文本，
+                      预计来不及完成的块不再发出，到期时放弃仍在进行的请求
             
         Returns:
-            Dict: 翻译结果
+            Dict: 翻译结果；translations 只包含已翻译的单元格，未翻译的单元格列在 untranslated 中
+                  （reason 为 deadline 或 failed），deadline_reached 表示是否到达截止时间
         """
-        logger.info("开始一次性翻译所有中文内容")
+        logger.info("开始翻译所有中文内容")
         
         # 收集所有需要翻译的文本和对应位置信息
-        all_texts = []
         text_mapping = []
         
         for sheet_name, content in chinese_content.items():
             for cell_coord, cell_info in content.items():
-                all_texts.append(cell_info['content'])
                 text_mapping.append({
                     'sheet_name': sheet_name,
                     'coord': cell_coord,
@@ -504,13 +2203,193 @@ class ExcelTranslator:
                     'info': cell_info
                 })
         
-        total_texts = len(all_texts)
+        total_texts = len(text_mapping)
         logger.info(f"共需要翻译 {total_texts} 个文本")
         
         if total_texts == 0:
-            return {'translations': []}
+            return {'translations': [], 'untranslated': [], 'deadline_reached': False}
         
-        # 构建提示词
+        # 从任务日志恢复已完成的译文
+        completed = self.load_journal(journal_file) if journal_file else {}
+        translations = [None] * total_texts
+        pending_indexes = []
+        for i, mapping_info in enumerate(text_mapping):
+            key = (mapping_info['sheet_name'], mapping_info['coord'], content_hash(mapping_info['original']))
+            if key in completed:
+                translations[i] = completed[key]
+            else:
+                pending_indexes.append(i)
+        
+        if completed:
+            logger.info(f"从任务日志恢复 {total_texts - len(pending_indexes)} 个译文，剩余 {len(pending_indexes)} 个")
+            notify_progress(progress_callback, 'restored', cells=total_texts - len(pending_indexes))
+            self.instrumentation.count('checkpoint_cells', total_texts - len(pending_indexes))
+        
+        # 相同文本只翻译一次，译文分发给所有内容相同的单元格
+        text_groups = {}
+        for i in pending_indexes:
+            text_groups.setdefault(text_mapping[i]['original'], []).append(i)
+        
+        # 共享译文缓存（如同一批次的其他文件）中已有的文本直接复用
+        if self.translation_memory is not None and text_groups:
+            cached = self.translation_memory.lookup(list(text_groups), keywords, self.model)
+            if cached:
+                cached_indexes = [i for text in cached for i in text_groups.pop(text)]
+                for i in cached_indexes:
+                    translations[i] = cached[text_mapping[i]['original']]
+                if journal_file:
+                    self.append_journal(journal_file, [text_mapping[i] for i in cached_indexes],
+                                        [translations[i] for i in cached_indexes])
+                logger.info(f"从共享译文缓存复用 {len(cached_indexes)} 个单元格的译文")
+                notify_progress(progress_callback, 'reused', cells=len(cached_indexes))
+        
+        unique_texts = list(text_groups)
+        logger.info(f"待翻译 {len(unique_texts)} 个不同文本")
+        if deadline is not None:
+            # 有截止时间时先翻译价值最高的文本：可见工作表和行列中的、表头行的、重复次数多的
+            header_rows = {sheet_name: min(cell_info['row'] for cell_info in content.values())
+                           for sheet_name, content in chinese_content.items() if content}
+            unique_texts.sort(key=lambda text: self.text_priority([text_mapping[i] for i in text_groups[text]],
+                                                                  header_rows), reverse=True)
+        chunks = [[unique_texts[position] for position in chunk_positions]
+                  for chunk_positions in self.plan_chunks([text_mapping[text_groups[text][0]]['info']
+                                                           for text in unique_texts])]
+        chunk_count = len(chunks)
+        
+        # 各块的 API 请求并发执行，在途的块数不超过并发数；日志追加和进度通知都在当前线程完成
+        executor = ThreadPoolExecutor(max_workers=self.request_concurrency, thread_name_prefix='chunk')
+        deadline_reached = False
+        failed_indexes = set()
+        try:
+            futures = {}
+            next_chunk = 0
+            chunk_seconds = []
+            while True:
+                while next_chunk < chunk_count and len(futures) < self.request_concurrency:
+                    # 按预计的块耗时（本任务已完成块的中位数，还没有时按进程内近期的块）判断，
+                    # 截止前来不及完成的块不再发出
+                    if chunk_seconds:
+                        expected = statistics.median(chunk_seconds)
+                    else:
+                        expected = TIMING_HISTORY.expected_chunk_seconds() or 0
+                    if deadline is not None and time.time() + expected > deadline:
+                        deadline_reached = True
+                        break
+                    chunk_texts = chunks[next_chunk]
+                    next_chunk += 1
+                    logger.info(f"正在调用 Gemini API 翻译第 {next_chunk}/{chunk_count} 块（{len(chunk_texts)} 个文本）")
+                    futures[executor.submit(self.translate_texts, chunk_texts, keywords)] = \
+                        (next_chunk, chunk_texts, time.time())
+                if not futures:
+                    break
+                
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # 截止时间已到，放弃仍在进行的请求
+                    deadline_reached = True
+                    break
+                
+                for future in done:
+                    chunk_number, chunk_texts, started = futures.pop(future)
+                    chunk_translations = future.result()
+                    chunk_seconds.append(time.time() - started)
+                    TIMING_HISTORY.record_chunk(chunk_seconds[-1])
+                    
+                    chunk_indexes = []
+                    for text, translation in zip(chunk_texts, chunk_translations):
+                        for i in text_groups[text]:
+                            translations[i] = translation
+                            chunk_indexes.append(i)
+                            if translation is None:
+                                failed_indexes.add(i)
+                    
+                    if journal_file:
+                        self.append_journal(journal_file, [text_mapping[i] for i in chunk_indexes],
+                                            [translations[i] for i in chunk_indexes])
+                    
+                    notify_progress(progress_callback, 'chunk', chunk=chunk_number, chunks=chunk_count,
+                                    cells=len(chunk_indexes))
+        finally:
+            # 出错、被取消或到达截止时间时不再发出尚未开始的请求；到达截止时间时不等待进行中的请求
+            executor.shutdown(wait=not deadline_reached, cancel_futures=True)
+        
+        # 构建结果字典；未翻译（到达截止时间或翻译失败）的单元格保持原样，单独列出
+        result = {
+            'translations': [],
+            'untranslated': [],
+            'deadline_reached': deadline_reached
+        }
+        
+        for i, (mapping_info, translation) in enumerate(zip(text_mapping, translations)):
+            if translation is None:
+                result['untranslated'].append({
+                    'sheet_name': mapping_info['sheet_name'],
+                    'coord': mapping_info['coord'],
+                    'original': mapping_info['original'],
+                    'reason': 'failed' if i in failed_indexes else 'deadline'
+                })
+                continue
+            result['translations'].append({
+                'sheet_name': mapping_info['sheet_name'],
+                'coord': mapping_info['coord'],
+                'original': mapping_info['original'],
+                'translation': translation,
+                'info': mapping_info['info']
+            })
+        
+        logger.info(f"翻译完成，共处理 {len(result['translations'])} 个文本")
+        return result
+
+    def text_priority(self, mappings: List[Dict], header_rows: Dict) -> Tuple[bool, bool, int]:
+        """
+        文本的翻译优先级（越大越先翻译）：是否出现在可见的工作表和行列中、是否出现在表头行、出现次数
+        
+        Args:
+            mappings: 内容为该文本的所有单元格（text_mapping 中的记录）
+            header_rows: {工作表名: 该表第一个中文单元格所在的行}
+        """
+        visible = any(not mapping['info'].get('hidden') and not mapping['info'].get('sheet_hidden')
+                      for mapping in mappings)
+        header = any(mapping['info']['row'] == header_rows.get(mapping['sheet_name']) for mapping in mappings)
+        return visible, header, len(mappings)
+
+    def plan_chunks(self, cell_infos: List[Dict]) -> List[List[int]]:
+        """
+        按文本数量和中文字符数将待翻译单元格划分为若干块
+        
+        Args:
+            cell_infos: 待翻译单元格信息列表（chinese_chars 缺失时按文本长度计）
+            
+        Returns:
+            List[List[int]]: 每块包含的 cell_infos 下标
+        """
+        chunks = []
+        current = []
+        current_chars = 0
+        for i, cell_info in enumerate(cell_infos):
+            chars = cell_info.get('chinese_chars') or len(cell_info['content'])
+            if current and (len(current) >= self.chunk_size or current_chars + chars > self.chunk_chars):
+                chunks.append(current)
+                current = []
+                current_chars = 0
+            current.append(i)
+            current_chars += chars
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def build_translation_prompt(self, texts: List[str], keywords: str = "") -> str:
+        """
+        构建批量翻译提示词
+        
+        Args:
+            texts: 待翻译文本列表
+            keywords: 专业领域关键词
+            
+        Returns:
+            str: 提示词
+        """
         prompt_parts = []
         
         if keywords:
@@ -527,65 +2406,255 @@ class ExcelTranslator:
         ])
         
         # 添加所有待翻译的文本
-        for i, text in enumerate(all_texts, 1):
+        for i, text in enumerate(texts, 1):
             prompt_parts.append(f"{i}. {text}")
         
-        prompt = "\n".join(prompt_parts)
+        return "\n".join(prompt_parts)
+
+    def generate(self, prompt: str, on_latency: Optional[Callable[[float], None]] = None) -> Optional[str]:
+        """
+        调用模型生成内容；受 request_limiter 限制同一 API 密钥的在途请求数，
+        使用密钥池时由密钥池选择密钥并处理限流；调用结果计入熔断器，耗时和 token 用量计入埋点
+        
+        Args:
+            prompt: 提示词
+            on_latency: 成功时以模型调用本身的耗时（秒，不含排队时间）调用
+            
+        Returns:
+            Optional[str]: 模型返回的文本
+            
+        Raises:
+            BackendUnavailable: 熔断器打开
+        """
+        if self.key_pool is None and self.client is None:
+            raise RuntimeError("未提供 API 密钥，无法调用翻译接口")
+        
+        try:
+            self.circuit_breaker.before_call()
+        except BackendUnavailable:
+            metrics.API_CALLS.inc(outcome='rejected')
+            raise
+        with self.instrumentation.span('api_call', kind='request') as span:
+            try:
+                if self.key_pool is not None:
+                    response = self.key_pool.generate(self.model, prompt, self.key_usage,
+                                                      on_retry=lambda: self.instrumentation.count('retries'),
+                                                      on_latency=on_latency)
+                else:
+                    with self.request_limiter:
+                        started = time.time()
+                        response = call_model(self.client, self.model, prompt)
+                        if on_latency is not None:
+                            on_latency(time.time() - started)
+            except Exception as e:
+                self.circuit_breaker.record_failure(e)
+                raise
+            self.circuit_breaker.record_success()
+            
+            usage_metadata = getattr(response, 'usage_metadata', None)
+            if usage_metadata is not None:
+                span['input_tokens'] = usage_metadata.prompt_token_count or 0
+                span['output_tokens'] = usage_metadata.candidates_token_count or 0
+                self.instrumentation.count('input_tokens', span['input_tokens'])
+                self.instrumentation.count('output_tokens', span['output_tokens'])
+            return response.text
+
+    def translate_texts(self, texts: List[str], keywords: str = "") -> List[str]:
+        """
+        翻译一块文本：共享译文缓存中已有的文本直接复用，进程内正在被其他任务翻译的相同文本
+        等待其结果（见 SingleFlight），新的成功译文写入缓存
+        
+        Args:
+            texts: 待翻译文本列表（互不相同）
+            keywords: 专业领域关键词
+            
+        Returns:
+            List[str]: 与 texts 一一对应的译文
+        """
+        memory = self.translation_memory
+        cached = memory.lookup(texts, keywords, self.model) if memory is not None else {}
+        missing = [text for text in texts if text not in cached]
+        self.instrumentation.count('cache_hits', len(cached))
+        if missing:
+            translated = SINGLE_FLIGHT.translate(missing, keywords, self.model,
+                                                 lambda owned: self.request_translations(owned, keywords))
+            if memory is not None:
+                memory.store(missing, translated, keywords, self.model)
+            cached.update(zip(missing, translated))
+        return [cached[text] for text in texts]
+
+    def request_translations(self, texts: List[str], keywords: str = "") -> List[str]:
+        """
+        请求翻译一组文本；配置了请求打包器时与其他任务的文本合并发送
+        
+        Args:
+            texts: 待翻译文本列表
+            keywords: 专业领域关键词
+            
+        Returns:
+            List[str]: 与 texts 一一对应的译文
+        """
+        if self.request_packer is None:
+            return self.translate_chunk(texts, keywords)
+        return self.request_packer.translate(self, texts, keywords)
+
+    def parse_chunk_response(self, response_text: Optional[str]) -> List[str]:
+        """将批量翻译的响应拆分为逐行译文（忽略空行）"""
+        return [line.strip() for line in (response_text or '').strip().split('\n') if line.strip()]
+
+    def translate_chunk(self, texts: List[str], keywords: str = "") -> List[str]:
+        """
+        通过一次 API 调用翻译一块文本，结果数量不匹配或调用失败时切换到逐个翻译；
+        配置了对冲器时，耗时过长的请求会再发一份，取先返回的数量匹配的结果
+        
+        Args:
+            texts: 待翻译文本列表
+            keywords: 专业领域关键词
+            
+        Returns:
+            List[Optional[str]]: 与 texts 一一对应的翻译结果，翻译失败的文本为 None
+        """
+        prompt = self.build_translation_prompt(texts, keywords)
         
         try:
-            # 调用 Gemini API 一次性翻译所有内容
-            logger.info("正在调用 Gemini API 进行翻译...")
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt
-            )
-            
-            if response.text:
+            if self.hedger is not None:
+                response_text = self.hedger.call(
+                    lambda on_latency: self.generate(prompt, on_latency),
+                    lambda text: len(self.parse_chunk_response(text)) == len(texts),
+                    congested=self.key_pool.congested if self.key_pool is not None else None)
+            else:
+                response_text = self.generate(prompt)
+            
+            if response_text:
                 # 解析翻译结果
-                translated_lines = [line.strip() for line in response.text.strip().split('\n') if line.strip()]
+                translated_lines = self.parse_chunk_response(response_text)
                 
                 # 确保翻译结果数量与原文本数量匹配
-                if len(translated_lines) == len(all_texts):
-                    translations = translated_lines
-                    logger.info("API 翻译成功，结果数量匹配")
-                else:
-                    logger.warning(f"翻译结果数量不匹配: 期望 {len(all_texts)}, 实际 {len(translated_lines)}")
-                    # 如果数量不匹配，尝试逐个翻译
-                    logger.info("切换到逐个翻译模式")
-                    translations = self.translate_individually(all_texts, keywords)
+                if len(translated_lines) == len(texts):
+                    return translated_lines
+                
+                logger.warning(f"翻译结果数量不匹配: 期望 {len(texts)}, 实际 {len(translated_lines)}")
+                logger.info("切换到逐个翻译模式")
+                metrics.INDIVIDUAL_FALLBACKS.inc(reason='mismatch')
+                self.instrumentation.count('fallbacks')
             else:
                 logger.error("API 返回空响应，切换到逐个翻译模式")
-                translations = self.translate_individually(all_texts, keywords)
+                metrics.INDIVIDUAL_FALLBACKS.inc(reason='empty')
+                self.instrumentation.count('fallbacks')
                 
+        except BackendUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"一次性翻译失败: {str(e)}，切换到逐个翻译模式")
-            translations = self.translate_individually(all_texts, keywords)
+            logger.error(f"批量翻译失败: {str(e)}，切换到逐个翻译模式")
+            metrics.INDIVIDUAL_FALLBACKS.inc(reason='error')
+            self.instrumentation.count('fallbacks')
         
-        # 构建结果字典
-        result = {
-            'translations': []
-        }
+        return self.translate_individually(texts, keywords)
+
+    def journal_path(self, checkpoint_dir: str, input_file: str, keywords: str = "") -> str:
+        """
+        根据输入文件内容、关键词和模型计算任务日志路径，相同输入的任务共用同一日志
         
-        for i, (mapping_info, translation) in enumerate(zip(text_mapping, translations)):
-            result['translations'].append({
-                'sheet_name': mapping_info['sheet_name'],
-                'coord': mapping_info['coord'],
-                'original': mapping_info['original'],
-                'translation': translation,
-                'info': mapping_info['info']
-            })
+        Args:
+            checkpoint_dir: 任务日志目录
+            input_file: 输入文件路径
+            keywords: 专业领域关键词
+            
+        Returns:
+            str: 任务日志路径
+        """
+        digest = hashlib.sha256()
+        with open(input_file, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(f"\0{keywords}\0{self.model}".encode('utf-8'))
+        return os.path.join(checkpoint_dir, f"{digest.hexdigest()[:32]}.jsonl")
+
+    def claim_journal(self, journal_file: str) -> Optional[str]:
+        """
+        占用任务日志：同一进程中另一个任务（如同一文件、不同处理范围的任务）正在使用该日志时，
+        本任务不使用任务日志，既不写入也不删除别人的日志
         
-        logger.info(f"翻译完成，共处理 {len(result['translations'])} 个文本")
-        return result
+        Args:
+            journal_file: 任务日志路径
+            
+        Returns:
+            Optional[str]: 占用成功时返回日志路径，否则为 None
+        """
+        journal_file = os.path.abspath(journal_file)
+        with ExcelTranslator.journal_lock:
+            if journal_file in ExcelTranslator.journals_in_use:
+                logger.warning(f"任务日志正被其他任务使用，本次翻译不记录断点: {journal_file}")
+                return None
+            ExcelTranslator.journals_in_use.add(journal_file)
+        return journal_file
+    
+    def release_journal(self, journal_file: str):
+        """释放 claim_journal 占用的任务日志"""
+        with ExcelTranslator.journal_lock:
+            ExcelTranslator.journals_in_use.discard(journal_file)
+    
+    def load_journal(self, journal_file: str) -> Dict:
+        """
+        读取任务日志
+        
+        Args:
+            journal_file: 任务日志路径
+            
+        Returns:
+            Dict: {(工作表名, 单元格坐标, 内容哈希): 译文}
+        """
+        completed = {}
+        if not os.path.exists(journal_file):
+            return completed
+        
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能只写了一半
+                    continue
+                for sheet_name, cell_coord, digest, translation in record['cells']:
+                    completed[(sheet_name, cell_coord, digest)] = translation
+        return completed
+
+    def append_journal(self, journal_file: str, mappings: List[Dict], translations: List[str]):
+        """
+        将一块已完成的译文追加到任务日志并落盘
+        
+        Args:
+            journal_file: 任务日志路径
+            mappings: 该块单元格的位置信息
+            translations: 该块的翻译结果
+        """
+        cells = [
+            [mapping_info['sheet_name'], mapping_info['coord'], content_hash(mapping_info['original']), translation]
+            for mapping_info, translation in zip(mappings, translations)
+            # 失败占位不记录，恢复时重新翻译
+            if not is_failed_translation(translation)
+        ]
+        if not cells:
+            return
+        
+        journal_dir = os.path.dirname(journal_file)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        with open(journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'cells': cells}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
 
-    def apply_all_translations(self, file_path: str, translation_result: Dict, output_path: str):
+    def apply_all_translations(self, file_path: str, translation_result: Dict, output_path: str,
+                               audit_file: Optional[str] = None):
         """
-        将所有翻译结果应用到 Excel 文件
+        将所有翻译结果应用到 Excel 文件；逐单元格循环中不写日志，结束后每个工作表输出一条汇总
         
         Args:
             file_path: 源文件路径
             translation_result: 翻译结果
             output_path: 输出文件路径
+            audit_file: 单元格审计文件路径；提供时每个写入的单元格追加一条记录（见 CellLog）
         """
         logger.info("正在应用翻译结果到文件")
         
@@ -601,13 +2670,13 @@ class ExcelTranslator:
             sheet_translations[sheet_name].append(trans)
         
         # 应用翻译结果
+        cell_log = CellLog('translate', audit_file)
         for sheet_name, translations in sheet_translations.items():
             if sheet_name not in workbook.sheetnames:
                 logger.warning(f"工作表 '{sheet_name}' 不存在，跳过")
                 continue
                 
             worksheet = workbook[sheet_name]
-            logger.info(f"正在处理工作表 '{sheet_name}'，共 {len(translations)} 个翻译")
             
             for translation_info in translations:
                 coord = translation_info['coord']
@@ -618,34 +2687,425 @@ class ExcelTranslator:
                     # 获取单元格
                     cell = worksheet[coord]
                     
-                    # 处理合并单元格的情况
+                    # 处理合并单元格的情况：只更新主单元格
                     if original_info['is_merged']:
-                        merged_info = original_info['merged_info']
-                        logger.debug(f"处理合并单元格 {coord} (范围: {merged_info['range']})")
-                        
-                        # 只更新主单元格
-                        if coord == merged_info['master_cell']:
-                            cell.value = translation
-                    else:
-                        cell.value = translation
-                        
-                    logger.debug(f"已更新单元格 [{sheet_name}]{coord}: {translation}")
+                        if coord != original_info['merged_info']['master_cell']:
+                            continue
+                    cell.value = translation
+                    cell_log.record(sheet_name, coord, translation_info['original'], translation)
                     
                 except Exception as e:
-                    logger.error(f"更新单元格 [{sheet_name}]{coord} 时出错: {str(e)}")
+                    # 出错的单元格可能很多，使用延迟格式化
+                    logger.error("更新单元格 [%s]%s 时出错: %s", sheet_name, coord, e)
         
         # 保存文件
         workbook.save(output_path)
         workbook.close()
+        cell_log.flush()
         logger.info(f"翻译完成，结果已保存到: {output_path}")
 
 
-def main():
-    """主函数"""
+# 命令行模式的任务日志目录
+CLI_CHECKPOINT_DIR = ".checkpoints"
+
+# 命令行批量模式：目录输入中匹配的扩展名（openpyxl 能读写的格式）、同时翻译的文件数
+CLI_EXCEL_EXTENSIONS = ('.xlsx',)
+# openpyxl 无法读取的旧版 Excel 格式：跳过并提示另存为 .xlsx
+CLI_UNSUPPORTED_EXTENSIONS = ('.xls',)
+CLI_FILE_WORKERS = 4
+
+# 监视模式：文件停止变化多久后才翻译（秒）、无文件事件时扫描目录的间隔（秒）、译文缓存上限
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_POLL_SECONDS = 1.0
+WATCH_MEMORY_ENTRIES = 200000
+
+# 命令行退出码：全部完成、有文件失败、参数错误、有文件只部分翻译（无失败）、被中断
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+EXIT_INTERRUPTED = 130
+
+
+def translated_output_path(input_file: str, output_dir: Optional[str] = None, relative_path: Optional[str] = None) -> str:
+    """
+    译文文件路径：<文件名>_translated.<扩展名>，默认与输入文件放在一起
+
+    Args:
+        input_file: 输入文件路径
+        output_dir: 输出目录；提供时输出到该目录
+        relative_path: 输入文件相对于输入目录的路径，输出到 output_dir 时保留其子目录结构
+    """
+    base_name, extension = os.path.splitext(relative_path or os.path.basename(input_file))
+    file_name = f"{base_name}_translated{extension or '.xlsx'}"
+    if output_dir is None:
+        return os.path.join(os.path.dirname(input_file), os.path.basename(file_name))
+    return os.path.join(output_dir, file_name)
+
+
+def is_cli_input_file(path: str) -> bool:
+    """
+    是否为待翻译的 Excel 文件：跳过 Excel 的临时锁文件（~$ 开头）、隐藏文件（如写入中的临时译文）
+    和已生成的译文（_translated 结尾）
+    """
+    name = os.path.basename(path)
+    stem, extension = os.path.splitext(name)
+    return (extension.lower() in CLI_EXCEL_EXTENSIONS and not name.startswith(('~$', '.'))
+            and not stem.endswith('_translated'))
+
+
+def output_is_current(input_file: str, output_file: str) -> bool:
+    """译文已存在且不比输入文件旧"""
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    except OSError:
+        return False
+
+
+def expand_cli_inputs(inputs: List[str], recursive: bool = False) -> List[Tuple[str, Optional[str]]]:
+    """
+    展开命令行输入：文件、目录（其中的 Excel 文件）或 glob 模式（如 "reports/**/*.xlsx"）
+
+    只保留待翻译的 Excel 文件（见 is_cli_input_file），重复的文件只保留一个；.xls 文件跳过并记录警告
+
+    Returns:
+        List[Tuple]: (文件路径, 相对于输入目录的路径；非目录输入为 None)
+    """
+    files = {}
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            walk = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            matches = [(os.path.join(directory, name), os.path.relpath(os.path.join(directory, name), pattern))
+                       for directory, _, names in walk for name in sorted(names)]
+        elif glob.has_magic(pattern):
+            matches = [(path, None) for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path)]
+        else:
+            # 不存在的文件也保留，翻译时报告为失败
+            matches = [(pattern, None)]
+        for path, relative_path in matches:
+            if is_cli_input_file(path):
+                files.setdefault(os.path.abspath(path), (path, relative_path))
+            elif (os.path.splitext(path)[1].lower() in CLI_UNSUPPORTED_EXTENSIONS
+                  and not os.path.basename(path).startswith(('~$', '.'))):
+                logger.warning(f"跳过不支持的文件格式（请另存为 .xlsx 后再翻译）: {path}")
+    return list(files.values())
+
+
+def display_width(text: str) -> int:
+    """终端显示宽度：全角字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+
+
+def format_table(headers: List[str], rows: List[List[str]]) -> str:
+    """按显示宽度对齐的纯文本表格"""
+    widths = [max(display_width(str(row[i])) for row in [headers] + rows) for i in range(len(headers))]
+    lines = []
+    for row in [headers] + rows:
+        lines.append('  '.join(str(value) + ' ' * (width - display_width(str(value)))
+                               for value, width in zip(row, widths)).rstrip())
+        if row is headers:
+            lines.append('  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
+
+def build_cli_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    parser = argparse.ArgumentParser(
+        prog='excel_translator.py',
+        description='翻译 Excel 文件中的中文内容；不带参数在终端中运行时逐项询问',
+        epilog='退出码: 0 全部完成（监视模式为正常停止），1 有文件失败，2 参数错误，3 有文件只部分翻译')
+    parser.add_argument('inputs', nargs='*', help='Excel 文件、目录或 glob 模式（如 "reports/**/*.xlsx"）')
+    parser.add_argument('--api-key', default=os.environ.get('GEMINI_API_KEY', ''),
+                        help='Gemini API 密钥，多个密钥用逗号分隔（默认读取环境变量 GEMINI_API_KEY）')
+    parser.add_argument('-o', '--output-dir', help='输出目录（默认与输入文件放在一起）')
+    parser.add_argument('-k', '--keywords', default='', help='专业领域关键词，如 医学、法律、技术')
+    parser.add_argument('-r', '--recursive', action='store_true', help='目录输入包含子目录')
+    parser.add_argument('-j', '--file-workers', type=int, default=CLI_FILE_WORKERS,
+                        help=f'同时翻译的文件数（默认 {CLI_FILE_WORKERS}）')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUEST_CONCURRENCY,
+                        help=f'每个 API 密钥的在途请求数，所有文件共享（默认 {DEFAULT_REQUEST_CONCURRENCY}）')
+    parser.add_argument('--requests-per-minute', type=int, default=0,
+                        help='每个 API 密钥每分钟的请求配额，0 表示不限制')
+    parser.add_argument('--sheets', default='', help='只翻译这些工作表（逗号分隔）')
+    parser.add_argument('--exclude-sheets', default='', help='不翻译这些工作表（逗号分隔）')
+    parser.add_argument('--ranges', default='', help='只翻译这些单元格范围（如 A:C,B2:D100）')
+    parser.add_argument('--skip-hidden', action='store_true', help='跳过隐藏的工作表和行列')
+    parser.add_argument('--skip-formulas', action='store_true', help='跳过公式单元格')
+    parser.add_argument('--glossary', help='术语库文件（第一列中文，第二列英文）；翻译前先替换精确匹配的单元格')
+    parser.add_argument('--time-limit', type=float,
+                        help='时间限制（秒），到时输出部分翻译的文件；批量模式为整批，监视模式为每个文件')
+    parser.add_argument('--skip-existing', action='store_true', help='跳过译文已存在且比输入文件新的文件')
+    parser.add_argument('--checkpoint-dir', default=CLI_CHECKPOINT_DIR,
+                        help=f'任务日志目录，中断后重新运行从断点继续（默认 {CLI_CHECKPOINT_DIR}）')
+    parser.add_argument('--audit', action='store_true', help='在译文旁写入单元格审计文件 <译文>.audit.jsonl')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视模式：持续监视输入目录，翻译新增或修改的文件，直到 Ctrl+C 或 SIGTERM')
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help=f'监视模式下文件停止变化多久后才翻译（秒，默认 {WATCH_DEBOUNCE_SECONDS:g}）')
+    parser.add_argument('--poll-interval', type=float, default=WATCH_POLL_SECONDS,
+                        help=f'监视模式下扫描目录的间隔（秒，默认 {WATCH_POLL_SECONDS:g}；'
+                             f'安装 watchdog 时改为接收文件事件）')
+    parser.add_argument('-q', '--quiet', action='store_true', help='只输出警告、错误和汇总表')
+    return parser
+
+
+class CliSession:
+    """
+    一次命令行运行的共享状态：所有文件共用密钥池（限流）、译文缓存、请求打包器、熔断器、
+    解析写回的进程池和术语库；监视模式下这些状态在文件之间一直保持，新文件没有启动开销
+    """
+    
+    def __init__(self, args: argparse.Namespace, file_workers: int, deadline: Optional[float] = None,
+                 file_time_limit: Optional[float] = None, memory_entries: Optional[int] = None):
+        """
+        Args:
+            args: 命令行参数（见 build_cli_parser）
+            file_workers: 同时翻译的文件数，也是进程池的大小
+            deadline: 所有文件共用的截止时间（time.time() 时间戳），None 表示不限制
+            file_time_limit: 每个文件的时间限制（秒），None 表示不限制
+            memory_entries: 译文缓存上限，None 表示不限制
+        """
+        self.args = args
+        self.scope = CellScope.from_dict({
+            'include_sheets': args.sheets,
+            'exclude_sheets': args.exclude_sheets,
+            'ranges': args.ranges,
+            'skip_hidden': args.skip_hidden,
+            'skip_formulas': args.skip_formulas
+        })
+        api_keys = [key.strip() for key in args.api_key.split(',') if key.strip()]
+        self.key_pool = KeyPool.from_api_keys(api_keys, max_requests=args.requests,
+                                              requests_per_minute=args.requests_per_minute)
+        self.translation_memory = TranslationMemory(max_entries=memory_entries)
+        self.request_packer = RequestPacker()
+        self.circuit_breaker = CircuitBreaker()
+        self.file_workers = file_workers
+        self.cpu_pool = create_process_pool(file_workers)
+        self.deadline = deadline
+        self.file_time_limit = file_time_limit
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.glossary_cache = None  # (术语库修改时间, 术语库字典)
+    
+    def warm_up(self):
+        """预先启动进程池的子进程，第一个文件不必等待进程启动"""
+        wait([self.cpu_pool.submit(os.getpid) for _ in range(self.file_workers)])
+    
+    def glossary(self) -> Dict:
+        """术语库字典，术语库文件修改后重新加载"""
+        mtime = os.path.getmtime(self.args.glossary)
+        with self.lock:
+            if self.glossary_cache is None or self.glossary_cache[0] != mtime:
+                terminology_dict = ExcelTranslator(api_key=None).load_terminology(self.args.glossary)
+                self.glossary_cache = (mtime, terminology_dict)
+            return self.glossary_cache[1]
+    
+    def cancel(self):
+        """取消：尚未开始的文件不再翻译，进行中的文件在当前块完成后停止（已完成的块保存在任务日志中）"""
+        self.cancel_event.set()
+    
+    def check_cancelled(self, event: Dict):
+        """进度回调：已取消时抛出 TranslationCancelled"""
+        if self.cancel_event.is_set():
+            raise TranslationCancelled("已中断")
+    
+    def translate_file(self, input_file: str, output_file: str) -> Dict:
+        """
+        翻译一个文件（指定术语库时先替换精确匹配的术语）；译文先写入隐藏的临时文件再原子替换，
+        监视的目录和下游任务不会读到写了一半的译文
+        
+        Returns:
+            Dict: file、output、status（completed / partial / failed / cancelled），成功时包含单元格数、
+                  耗时和请求数，失败时包含 error
+        """
+        args = self.args
+        if self.cancel_event.is_set():
+            return {'file': input_file, 'output': output_file, 'status': 'cancelled'}
+        output_dir = os.path.dirname(output_file) or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        temp_prefix = os.path.join(output_dir,
+                                   f".{os.path.basename(output_file)}.{os.getpid()}.{threading.get_ident()}")
+        extension = os.path.splitext(output_file)[1]
+        matched_file = f"{temp_prefix}.matched{extension}"
+        temp_output = f"{temp_prefix}.partial{extension}"
+        report_file = f"{output_file}{PERFORMANCE_REPORT_SUFFIX}"
+        audit_file = f"{output_file}.audit.jsonl" if args.audit else None
+        deadline = self.deadline
+        if self.file_time_limit:
+            deadline = time.time() + self.file_time_limit
+        translator = ExcelTranslator(api_key=None, key_pool=self.key_pool, request_concurrency=args.requests,
+                                     scan_workers=1, cpu_executor=self.cpu_pool,
+                                     translation_memory=self.translation_memory,
+                                     request_packer=self.request_packer, circuit_breaker=self.circuit_breaker)
+        result = {'file': input_file, 'output': output_file}
+        try:
+            source_file = input_file
+            terminology_stage = None
+            if args.glossary:
+                translator.apply_terminology_matching(input_file, matched_file, terminology_dict=self.glossary(),
+                                                      audit_file=audit_file)
+                source_file = matched_file
+                # translate_excel 开始时重新计数，术语库匹配阶段单独保留
+                terminology_stage = translator.instrumentation.report()['stages'].get('terminology')
+            report = translator.translate_excel(source_file, temp_output, args.keywords,
+                                                checkpoint_dir=args.checkpoint_dir, scope=self.scope,
+                                                progress_callback=self.check_cancelled,
+                                                deadline=deadline, audit_file=audit_file)
+            os.replace(temp_output, output_file)
+        except TranslationCancelled:
+            return dict(result, status='cancelled')
+        except Exception as e:
+            write_report(translator.performance_report(input_file=input_file, output_file=output_file,
+                                                       status='failed', error=str(e)), report_file)
+            return dict(result, status='failed', error=str(e))
+        finally:
+            for path in (matched_file, temp_output):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        performance = dict(report['performance'], input_file=input_file, output_file=output_file)
+        if terminology_stage is not None:
+            performance['stages'] = dict({'terminology': terminology_stage}, **performance['stages'])
+        write_report(performance, report_file)
+        return dict(result,
+                    status='partial' if report['untranslated_cells'] else 'completed',
+                    translated_cells=report['translated_cells'],
+                    untranslated_cells=report['untranslated_cells'],
+                    seconds=performance['wall_seconds'],
+                    requests=performance['requests']['count'])
+    
+    def close(self, wait: bool = True):
+        """关闭进程池；wait 为 False 时不等待进行中的阶段，取消排队的阶段"""
+        self.cpu_pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# 汇总表中的状态名
+CLI_STATUS_NAMES = {'completed': '完成', 'partial': '部分', 'failed': '失败', 'skipped': '跳过', 'cancelled': '取消'}
+
+
+def print_cli_result(result: Dict, prefix: str = ''):
+    """输出一个文件的翻译结果，失败输出到标准错误"""
+    message = f"{prefix}{result['status']}: {result['file']}"
+    if 'error' in result:
+        message += f" ({result['error']})"
+    print(message, file=sys.stderr if result['status'] == 'failed' else sys.stdout, flush=True)
+
+
+def run_cli_batch(args: argparse.Namespace, files: List[Tuple[str, Optional[str]]]) -> int:
+    """
+    并行翻译一批文件，所有文件共享同一 CliSession，结束时输出汇总表
+    
+    Returns:
+        int: 退出码
+    """
+    deadline = time.time() + args.time_limit if args.time_limit else None
+    session = CliSession(args, max(1, min(args.file_workers, len(files))), deadline=deadline)
+    
+    def translate_file(input_file: str, relative_path: Optional[str]) -> Dict:
+        output_file = translated_output_path(input_file, args.output_dir, relative_path)
+        if args.skip_existing and output_is_current(input_file, output_file):
+            return {'file': input_file, 'output': output_file, 'status': 'skipped'}
+        return session.translate_file(input_file, output_file)
+    
+    started = time.time()
+    results = []
+    # 不用 with：中断时不能在退出时等待所有进行中的文件
+    executor = ThreadPoolExecutor(max_workers=session.file_workers, thread_name_prefix='cli-file')
+    try:
+        futures = [executor.submit(translate_file, path, relative_path) for path, relative_path in files]
+        for future in as_completed(futures):
+            results.append(future.result())
+            print_cli_result(results[-1], f"[{len(results)}/{len(files)}] ")
+    except BaseException as e:
+        # 尚未开始的文件取消，进行中的文件在当前块完成后停止
+        session.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close(wait=False)
+        if not isinstance(e, KeyboardInterrupt):
+            raise
+        print("\n已中断；重新运行相同的命令会从断点继续", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    executor.shutdown()
+    session.close()
+    
+    # 汇总表按输入顺序列出
+    order = {path: index for index, (path, _) in enumerate(files)}
+    results.sort(key=lambda result: order[result['file']])
+    rows = [[result['file'], CLI_STATUS_NAMES[result['status']],
+             result.get('translated_cells', ''), result.get('untranslated_cells', ''),
+             f"{result['seconds']:.1f}s" if 'seconds' in result else '', result.get('requests', ''),
+             result.get('error', result['output'])]
+            for result in results]
+    print()
+    print(format_table(['文件', '状态', '已翻译', '未翻译', '耗时', '请求', '输出 / 错误'], rows))
+    counts = {status: sum(1 for result in results if result['status'] == status) for status in CLI_STATUS_NAMES}
+    print(f"\n共 {len(results)} 个文件：完成 {counts['completed']}，部分 {counts['partial']}，"
+          f"失败 {counts['failed']}，跳过 {counts['skipped']}；总耗时 {time.time() - started:.1f}s，"
+          f"缓存 {len(session.translation_memory)} 个译文")
+    
+    if counts['failed']:
+        return EXIT_FAILED
+    if counts['partial']:
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    命令行入口：带文件、目录或 glob 参数时非交互地批量翻译；不带参数在终端中运行时逐项询问
+
+    Returns:
+        int: 退出码
+    """
+    parser = build_cli_parser()
+    args = parser.parse_args(argv)
+    if not args.inputs:
+        if sys.stdin.isatty():
+            interactive_main()
+            return EXIT_OK
+        parser.print_usage(sys.stderr)
+        print("错误: 请指定要翻译的文件、目录或 glob 模式", file=sys.stderr)
+        return EXIT_USAGE
+    
+    if not args.api_key.strip():
+        print("错误: 请通过 --api-key 或环境变量 GEMINI_API_KEY 提供 API 密钥", file=sys.stderr)
+        return EXIT_USAGE
+    if args.glossary and not os.path.isfile(args.glossary):
+        print(f"错误: 术语库文件不存在: {args.glossary}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    
+    if args.watch:
+        if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]):
+            print("错误: 监视模式需要且只能指定一个输入目录", file=sys.stderr)
+            return EXIT_USAGE
+        # 监视器依赖本模块，运行时再导入
+        from watcher import run_watch
+        try:
+            return run_watch(args)
+        except ValueError as e:
+            print(f"错误: {str(e)}", file=sys.stderr)
+            return EXIT_USAGE
+    
+    files = expand_cli_inputs(args.inputs, args.recursive)
+    if not files:
+        print("错误: 没有找到要翻译的 Excel 文件", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        return run_cli_batch(args, files)
+    except ValueError as e:
+        # 处理范围参数无效
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+
+
+def interactive_main():
+    """交互模式：逐项询问密钥、文件和选项，翻译单个文件"""
     print("=== Excel 中文翻译器 (使用 Gemini AI) ===\n")
     
     # 获取用户输入
-    api_key = input("请输入您的 Gemini API 密钥: ").strip()
+    api_key = input("请输入您的 Gemini API 密钥（多个密钥用逗号分隔）: ").strip()
     if not api_key:
         print("错误: API 密钥不能为空")
         return
@@ -668,15 +3128,48 @@ def main():
     # 获取专业领域关键词（可选）
     keywords = input("请输入专业领域关键词（可选，如：医学、法律、技术等）: ").strip()
     
+    # 获取处理范围（可选）
+    include_sheets = input("请输入要翻译的工作表（可选，逗号分隔，默认全部）: ").strip()
+    exclude_sheets = input("请输入不翻译的工作表（可选，逗号分隔）: ").strip()
+    ranges = input("请输入要翻译的单元格范围（可选，如 A:C 或 B2:D100，逗号分隔）: ").strip()
+    skip_hidden = input("是否跳过隐藏的工作表和行列? (y/N): ").strip().lower() == 'y'
+    skip_formulas = input("是否跳过公式单元格? (y/N): ").strip().lower() == 'y'
+    time_limit = input("请输入时间限制（可选，秒；到时输出部分翻译的文件）: ").strip()
+    
     try:
-        # 创建翻译器实例
-        translator = ExcelTranslator(api_key)
+        scope = CellScope.from_dict({
+            'include_sheets': include_sheets,
+            'exclude_sheets': exclude_sheets,
+            'ranges': ranges,
+            'skip_hidden': skip_hidden,
+            'skip_formulas': skip_formulas
+        })
         
-        # 开始翻译
+        # 创建翻译器实例；多个密钥组成密钥池
+        api_keys = [key.strip() for key in api_key.split(',') if key.strip()]
+        translator = ExcelTranslator(api_keys if len(api_keys) > 1 else api_keys[0])
+        
+        # 开始翻译；中断或到达时间限制后重新运行相同的文件和关键词会从断点继续
         print("\n开始翻译...")
-        translator.translate_excel(input_file, output_file, keywords)
+        deadline = time.time() + float(time_limit) if time_limit else None
+        report_file = f"{output_file}{PERFORMANCE_REPORT_SUFFIX}"
+        report = translator.translate_excel(input_file, output_file, keywords,
+                                            checkpoint_dir=CLI_CHECKPOINT_DIR, scope=scope, deadline=deadline,
+                                            report_file=report_file)
+        
+        if report['untranslated_cells']:
+            reason = '已到达时间限制' if report['deadline_reached'] else '部分单元格翻译失败'
+            print(f"\n{reason}，{report['untranslated_cells']} 个单元格未翻译（保持原文）:")
+            for cell in report['untranslated'][:20]:
+                print(f"  {cell['sheet_name']}!{cell['coord']}: {cell['original']}")
+            print(f"部分翻译的结果已保存到: {output_file}，重新运行可继续翻译其余单元格")
+        else:
+            print(f"\n翻译完成! 结果已保存到: {output_file}")
         
-        print(f"\n翻译完成! 结果已保存到: {output_file}")
+        performance = report['performance']
+        stages = '，'.join(f"{name} {stage['wall_seconds']:.2f}s" for name, stage in performance['stages'].items())
+        print(f"耗时 {performance['wall_seconds']:.2f}s（{stages}），API 请求 {performance['requests']['count']} 次，"
+              f"性能报告: {report_file}")
         
     except FileNotFoundError:
         print(f"错误: 找不到文件 '{input_file}'")
@@ -687,4 +3180,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
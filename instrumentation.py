@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+翻译器埋点
+用 span 包裹翻译器的各阶段和每次接口调用：span 结束时通知钩子，并汇总为每个任务的性能报告
+（各阶段的墙钟和 CPU 时间、进程峰值内存、请求数、重试、token 和缓存命中）
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告峰值内存
+    resource = None
+
+# 性能报告格式版本
+REPORT_VERSION = 2
+
+# 报告中计数器的初始值
+REPORT_COUNTERS = ('requests', 'request_errors', 'retries', 'fallbacks', 'input_tokens', 'output_tokens',
+                   'cache_hits', 'checkpoint_cells', 'manifest_cells')
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """当前进程启动以来的峰值常驻内存（字节，进程级，包含同一进程中其他任务的占用），平台不支持时为 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def record_stage_metrics(span: Dict):
+    """默认钩子：阶段耗时计入 /metrics 的 stage_duration_seconds"""
+    if span['kind'] == 'stage':
+        metrics.STAGE_SECONDS.observe(span['wall_seconds'], stage=span['name'])
+
+
+class Instrumentation:
+    """
+    翻译器的埋点：span 记录墙钟时间和调用线程的 CPU 时间，加上子进程为本任务执行的阶段报告的 CPU 时间
+    （见 add_worker_usage；不含并发请求线程和同一进程中的其他任务），结束时依次调用钩子；
+    同一翻译器的 span 和计数汇总为性能报告，每次 translate_excel 开始时重新计数
+
+    钩子接收结束的 span 字典：name、kind（stage / request）、wall_seconds、cpu_seconds、
+    error（异常信息，成功时为 None）及 span 的其他属性；钩子抛出的异常只记录日志，不影响翻译
+    """
+
+    def __init__(self, hooks: Optional[List[Callable[[Dict], None]]] = None):
+        """
+        Args:
+            hooks: span 结束时调用的钩子列表
+        """
+        self.hooks = list(hooks or [])
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        """添加钩子"""
+        self.hooks.append(hook)
+
+    def reset(self):
+        """开始新的报告"""
+        with self.lock:
+            self.started_at = time.time()
+            self.started_wall = time.perf_counter()
+            self.stages = {}
+            self.counters = dict.fromkeys(REPORT_COUNTERS, 0)
+            self.request_seconds = 0.0
+            self.max_request_seconds = 0.0
+            self.worker_peak_rss = None
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'stage', **attributes):
+        """
+        记录代码块的耗时；代码块内可向 yield 的字典添加属性（如 token 数）
+
+        Args:
+            name: 阶段名，如 extract / translate / write，接口调用为 api_call
+            kind: stage（阶段）或 request（接口调用）
+            **attributes: 传给钩子的其他属性
+        """
+        span = dict(attributes, name=name, kind=kind, error=None)
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(span)
+        span['worker_cpu_seconds'] = 0.0
+        started_wall = time.perf_counter()
+        started_cpu = time.thread_time()
+        try:
+            yield span
+        except BaseException as e:
+            span['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            span['wall_seconds'] = time.perf_counter() - started_wall
+            span['cpu_seconds'] = time.thread_time() - started_cpu + span.pop('worker_cpu_seconds')
+            self._record(span)
+            for hook in self.hooks:
+                try:
+                    hook(span)
+                except Exception as e:
+                    logger.warning(f"埋点钩子出错: {str(e)}")
+
+    def count(self, name: str, amount: int = 1):
+        """累加报告中的计数（如 retries、cache_hits）"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_worker_usage(self, cpu_seconds: float, peak_rss: Optional[int]):
+        """
+        记录子进程为本任务执行阶段消耗的 CPU 时间和该子进程的峰值内存（进程级），
+        CPU 时间计入当前线程最内层的 span
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            stack[-1]['worker_cpu_seconds'] += cpu_seconds
+        if peak_rss is not None:
+            with self.lock:
+                self.worker_peak_rss = max(self.worker_peak_rss or 0, peak_rss)
+
+    def _record(self, span: Dict):
+        """将结束的 span 汇总到报告"""
+        with self.lock:
+            if span['kind'] == 'request':
+                self.counters['requests'] += 1
+                if span['error'] is not None:
+                    self.counters['request_errors'] += 1
+                self.request_seconds += span['wall_seconds']
+                self.max_request_seconds = max(self.max_request_seconds, span['wall_seconds'])
+                return
+            stage = self.stages.setdefault(span['name'], {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'count': 0})
+            stage['wall_seconds'] += span['wall_seconds']
+            stage['cpu_seconds'] += span['cpu_seconds']
+            stage['count'] += 1
+
+    def report(self, **fields) -> Dict:
+        """
+        当前的性能报告；cpu_seconds 和各阶段只包含本任务的 CPU 时间，process_peak_rss_mb 和
+        worker_process_peak_rss_mb 是当前进程和执行过本任务阶段的子进程启动以来的峰值内存（进程级，
+        进程池被多个任务共用时包含其他任务的占用）
+
+        Args:
+            **fields: 附加到报告中的字段（如输入输出文件、单元格数）
+
+        Returns:
+            Dict: 可序列化为 JSON 的报告
+        """
+        peak = peak_rss_bytes()
+        with self.lock:
+            counters = dict(self.counters)
+            # 只统计本任务各阶段的 CPU 时间，不含同一进程中其他任务的线程
+            cpu_seconds = sum(stage['cpu_seconds'] for stage in self.stages.values())
+            return dict(fields,
+                        version=REPORT_VERSION,
+                        started_at=self.started_at,
+                        wall_seconds=round(time.perf_counter() - self.started_wall, 4),
+                        cpu_seconds=round(cpu_seconds, 4),
+                        process_peak_rss_mb=round(peak / 1024 / 1024, 1) if peak is not None else None,
+                        worker_process_peak_rss_mb=(round(self.worker_peak_rss / 1024 / 1024, 1)
+                                                    if self.worker_peak_rss is not None else None),
+                        stages={name: {'wall_seconds': round(stage['wall_seconds'], 4),
+                                       'cpu_seconds': round(stage['cpu_seconds'], 4),
+                                       'count': stage['count']}
+                                for name, stage in self.stages.items()},
+                        requests={'count': counters.pop('requests'),
+                                  'errors': counters.pop('request_errors'),
+                                  'retries': counters.pop('retries'),
+                                  'fallbacks': counters.pop('fallbacks'),
+                                  'total_seconds': round(self.request_seconds, 4),
+                                  'max_seconds': round(self.max_request_seconds, 4)},
+                        tokens={'input': counters.pop('input_tokens'),
+                                'output': counters.pop('output_tokens')},
+                        cache={'memory_hits': counters.pop('cache_hits'),
+                               'checkpoint_cells': counters.pop('checkpoint_cells'),
+                               'manifest_cells': counters.pop('manifest_cells')},
+                        counters=counters)
+
+
+def write_report(report: Dict, report_file: str):
+    """原子写入性能报告（JSON）；临时文件按线程区分，同一报告的并发写入互不覆盖"""
+    temp_file = f"{report_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, report_file)
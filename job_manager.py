@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务管理
+在有界的工作线程中执行翻译任务，提供任务状态、进度查询、事件流和取消，
+并按 API 密钥限制同时执行的任务数和在途请求数
+"""
+
+import time
+import uuid
+import threading
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from excel_translator import TranslationCancelled
+
+logger = logging.getLogger(__name__)
+
+# 已结束任务在内存中保留的时间（秒）
+JOB_RETENTION_SECONDS = 3600
+
+# 排队任务每等待一秒抵扣的规模（预计 token 数），保证大任务不会一直被后来的小任务插队
+JOB_AGING_COST_PER_SECOND = 200
+
+
+class Job:
+    """一个后台任务及其状态"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+    def __init__(self, kind: str, params: Dict, dedupe_key: Optional[str] = None,
+                 tenant: Optional[str] = None, cost: float = 0):
+        """
+        Args:
+            kind: 任务类型，如 translate / terminology
+            params: 任务参数（会原样返回给查询方，不要放入 API 密钥）
+            dedupe_key: 去重键，相同键的任务未结束时重复提交会返回已有任务
+            tenant: 任务所属的 API 密钥标识（密钥哈希），用于按密钥限流
+            cost: 预计任务规模（如预计 token 数），规模小的任务优先执行
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.dedupe_key = dedupe_key
+        self.tenant = tenant
+        self.cost = cost
+        self.status = Job.QUEUED
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.message = '任务已提交，等待执行'
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.func = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.events = []
+        self.cache_hits = 0
+        self.translate_started_at = None
+        self.translated = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in Job.FINISHED_STATES
+
+    def handle_event(self, event: Dict):
+        """
+        进度回调：根据翻译器发送的事件更新进度并记录到事件流，任务被取消时抛出 TranslationCancelled
+
+        Args:
+            event: notify_progress 发送的事件字典
+        """
+        with self.lock:
+            if event['type'] == 'stage':
+                self.stage = event['stage']
+                if 'total' in event:
+                    self.total = event['total']
+                if self.stage == 'translate':
+                    self.translate_started_at = time.time()
+            elif event['type'] in ('reused', 'restored'):
+                self.done += event['cells']
+                self.cache_hits += event['cells']
+            elif event['type'] == 'chunk':
+                self.done += event['cells']
+                self.translated += event['cells']
+            self._record(event)
+
+        if self.cancel_event.is_set():
+            raise TranslationCancelled("任务已取消")
+
+    def eta_seconds(self) -> Optional[float]:
+        """按已完成块的翻译速度估算剩余时间（调用方需持有锁）"""
+        if not self.translate_started_at or not self.translated or self.total <= self.done:
+            return None
+        elapsed = time.time() - self.translate_started_at
+        return round(elapsed / self.translated * (self.total - self.done), 1)
+
+    def _record(self, event: Dict):
+        """追加事件（附带当前进度）并唤醒等待事件流的请求（调用方需持有锁）"""
+        self.events.append(dict(event,
+                                seq=len(self.events) + 1,
+                                done=self.done,
+                                total=self.total,
+                                cache_hits=self.cache_hits,
+                                eta=self.eta_seconds(),
+                                time=time.time()))
+        self.changed.notify_all()
+
+    def wait_events(self, after: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """
+        等待序号大于 after 的事件
+
+        Args:
+            after: 已收到的最后一个事件序号
+            timeout: 最长等待秒数
+
+        Returns:
+            Tuple: (新事件列表, 任务是否已结束)
+        """
+        with self.lock:
+            if len(self.events) <= after and not self.finished:
+                self.changed.wait(timeout)
+            return self.events[after:], self.finished
+
+    def _finish(self, status: str, message: str, result: Optional[Dict] = None):
+        """记录任务结束状态并发送 status 事件（调用方需持有锁）"""
+        self.result = result
+        self.status = status
+        self.message = message
+        self.finished_at = time.time()
+        self._record({'type': 'status', 'status': status, 'message': message, 'result': result})
+
+    def to_dict(self) -> Dict:
+        """任务状态的 JSON 表示"""
+        with self.lock:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'cost': self.cost,
+                'stage': self.stage,
+                'progress': {
+                    'done': self.done,
+                    'total': self.total,
+                    'cache_hits': self.cache_hits,
+                    'eta': self.eta_seconds()
+                },
+                'message': self.message,
+                'result': self.result,
+                'params': self.params,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobManager:
+    """
+    后台任务管理器：固定数量的工作线程，同一 API 密钥同时执行的任务数有上限
+
+    排队任务按预计规模短作业优先调度，并随等待时间老化提升优先级
+    """
+
+    def __init__(self, max_workers: int = 2, max_jobs_per_tenant: Optional[int] = None,
+                 aging_rate: float = JOB_AGING_COST_PER_SECOND):
+        """
+        Args:
+            max_workers: 同时执行的任务数
+            max_jobs_per_tenant: 同一 API 密钥同时执行的任务数，None 表示不限制
+            aging_rate: 排队任务每等待一秒抵扣的规模，0 表示严格短作业优先
+        """
+        self.max_jobs_per_tenant = max_jobs_per_tenant
+        self.aging_rate = aging_rate
+        self.jobs = {}
+        self.pending = []
+        self.running = {}
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.workers = [threading.Thread(target=self._worker_loop, name=f'job-{i}', daemon=True)
+                        for i in range(max_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind: str, params: Dict, func: Callable[[Job], Optional[Dict]],
+               dedupe_key: Optional[str] = None, tenant: Optional[str] = None, cost: float = 0) -> Job:
+        """
+        提交任务，立即返回
+
+        Args:
+            kind: 任务类型
+            params: 任务参数
+            func: 任务函数，接收 Job（用 job.handle_event 作为进度回调），返回结果字典
+            dedupe_key: 去重键；已有相同键的未结束任务时直接返回该任务，避免重复提交
+            tenant: API 密钥标识；同一密钥执行中的任务达到上限时，新任务排队等待
+            cost: 预计任务规模，排队时规模小的任务先执行
+
+        Returns:
+            Job: 新建的任务或已有的相同任务
+        """
+        self.purge_finished()
+        with self.lock:
+            if dedupe_key is not None:
+                for existing in self.jobs.values():
+                    if existing.dedupe_key == dedupe_key and not existing.finished:
+                        logger.info(f"相同任务正在执行，复用任务: {existing.id}")
+                        return existing
+            job = Job(kind, params, dedupe_key, tenant, cost)
+            job.func = func
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.work_available.notify()
+        logger.info(f"任务已提交: {job.id} ({kind}，预计规模 {cost})")
+        return job
+
+    def _tenant_available(self, tenant: Optional[str]) -> bool:
+        """该 API 密钥是否还能再执行一个任务（调用方需持有锁）"""
+        if self.max_jobs_per_tenant is None or tenant is None:
+            return True
+        return self.running.get(tenant, 0) < self.max_jobs_per_tenant
+
+    def _priority(self, job: Job, now: float) -> Tuple[float, float]:
+        """排队优先级，越小越先执行：预计规模减去等待时间的老化抵扣，相同时先提交的优先"""
+        return job.cost - self.aging_rate * (now - job.created_at), job.created_at
+
+    def _next_job(self) -> Job:
+        """取出优先级最高的可执行任务，没有时阻塞等待（调用方需持有锁）"""
+        while True:
+            now = time.time()
+            runnable = [job for job in self.pending if self._tenant_available(job.tenant)]
+            if runnable:
+                job = min(runnable, key=lambda candidate: self._priority(candidate, now))
+                self.pending.remove(job)
+                self.running[job.tenant] = self.running.get(job.tenant, 0) + 1
+                return job
+            self.work_available.wait()
+
+    def _worker_loop(self):
+        """工作线程：按优先级执行任务，跳过所属密钥已达并发上限的任务"""
+        while True:
+            with self.lock:
+                job = self._next_job()
+            try:
+                self._run(job, job.func)
+            finally:
+                with self.lock:
+                    self.running[job.tenant] -= 1
+                    if not self.running[job.tenant]:
+                        del self.running[job.tenant]
+                    self.work_available.notify_all()
+
+    def _run(self, job: Job, func: Callable[[Job], Optional[Dict]]):
+        """在工作线程中执行任务并记录结果"""
+        with job.lock:
+            if job.cancel_event.is_set():
+                if not job.finished:
+                    job._finish(Job.CANCELLED, '任务已取消')
+                return
+            job.status = Job.RUNNING
+            job.started_at = time.time()
+            job.message = '任务执行中'
+            job._record({'type': 'status', 'status': Job.RUNNING, 'message': job.message})
+
+        try:
+            result = func(job)
+            status, message = Job.COMPLETED, '任务完成'
+        except TranslationCancelled:
+            result, status, message = None, Job.CANCELLED, '任务已取消'
+        except Exception as e:
+            logger.error(f"任务 {job.id} 执行失败: {str(e)}")
+            result, status, message = None, Job.FAILED, f'任务失败: {str(e)}'
+
+        with job.lock:
+            job._finish(status, message, result)
+        metrics.JOBS_FINISHED.inc(kind=job.kind, status=status)
+
+    def add_completed(self, kind: str, params: Dict, result: Dict, message: str) -> Job:
+        """
+        登记一个无需执行、已有结果的任务（如复用之前的输出文件），查询和事件流与普通任务一致
+
+        Returns:
+            Job: 已完成的任务
+        """
+        self.purge_finished()
+        job = Job(kind, params)
+        with job.lock:
+            job.started_at = job.created_at
+            job._finish(Job.COMPLETED, message, result)
+        with self.lock:
+            self.jobs[job.id] = job
+        metrics.JOBS_FINISHED.inc(kind=kind, status=Job.COMPLETED)
+        logger.info(f"任务直接完成: {job.id} ({kind})")
+        return job
+
+    def active_jobs(self) -> List[Job]:
+        """排队或执行中的任务"""
+        with self.lock:
+            return [job for job in self.jobs.values() if not job.finished]
+
+    def stats(self) -> Dict:
+        """各状态的任务数（含保留中的已结束任务）和排队等待执行的任务数"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+            queued = len(self.pending)
+        states = dict.fromkeys((Job.QUEUED, Job.RUNNING) + Job.FINISHED_STATES, 0)
+        for job in jobs:
+            states[job.status] += 1
+        return {'states': states, 'queued': queued}
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """按 ID 查找任务"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务：排队中的任务直接取消，执行中的任务在当前块完成后停止
+
+        Returns:
+            bool: 任务存在且尚未结束时返回 True
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+
+        job.cancel_event.set()
+        with self.lock:
+            queued = job in self.pending
+            if queued:
+                self.pending.remove(job)
+        if queued:
+            with job.lock:
+                job._finish(Job.CANCELLED, '任务已取消')
+        else:
+            with job.lock:
+                job.message = '正在取消任务'
+        return True
+
+    def purge_finished(self):
+        """清理结束超过保留时间的任务"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标
+进程内的计数器、仪表和直方图，由 Web 服务的 /metrics 接口以 Prometheus 文本格式输出
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 指标名前缀
+METRIC_PREFIX = 'excel_translator_'
+
+# 阶段耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def escape_label_value(value) -> str:
+    """转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    """格式化标签，如 {stage="translate",le="1"}；没有标签时为空字符串"""
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    """格式化样本值，整数不带小数点"""
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """带标签的指标基类，各标签组合的样本分别记录"""
+
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        """
+        Args:
+            name: 指标名（不含前缀）
+            help_text: 指标说明
+            labelnames: 标签名
+        """
+        self.name = METRIC_PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        """按标签名顺序取标签值，标签不全或多余时报错"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Prometheus 文本格式的行"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.TYPE}']
+        with self.lock:
+            samples = sorted(self.samples.items(), key=lambda item: tuple(map(str, item[0])))
+        for key, value in samples:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: Tuple, value) -> List[str]:
+        return [f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}']
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """增加计数"""
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """当前计数"""
+        with self.lock:
+            return self.samples.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """可任意设置的仪表，通常在输出指标前更新"""
+
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels):
+        """设置当前值"""
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+
+class Histogram(Metric):
+    """按桶累计观测值分布的直方图"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: 各桶的上限（升序），+Inf 桶自动追加
+        """
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        """记录一个观测值"""
+        key = self._key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['counts'][index] += 1
+                    break
+            sample['sum'] += value
+            sample['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时（秒），代码块抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key: Tuple, value: Dict) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value['counts']):
+            cumulative += count
+            labels = format_labels(self.labelnames, key, ('le', format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {format_value(value["sum"])}')
+        lines.append(f'{self.name}_count{labels} {value["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """所有指标的 Prometheus 文本格式"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# 任务
+JOBS = REGISTRY.gauge('jobs', '当前保留的任务数（按状态）', ('state',))
+JOBS_FINISHED = REGISTRY.counter('jobs_finished_total', '已结束的任务数（按类型和结束状态）', ('kind', 'status'))
+QUEUE_DEPTH = REGISTRY.gauge('job_queue_depth', '排队等待执行的任务数')
+
+# 各阶段耗时：upload / parse / extract / terminology / translate / write
+STAGE_SECONDS = REGISTRY.histogram('stage_duration_seconds', '各处理阶段的耗时（秒）', ('stage',))
+
+# 翻译接口
+API_CALLS = REGISTRY.counter('api_calls_total',
+                             '翻译接口调用次数（按结果：success / error / rate_limited / rejected）', ('outcome',))
+API_TOKENS = REGISTRY.counter('api_tokens_total', '翻译接口用量报告的 token 数（input / output）', ('direction',))
+INDIVIDUAL_FALLBACKS = REGISTRY.counter('individual_fallbacks_total',
+                                        '批量翻译切换到逐个翻译的次数（按原因：mismatch / empty / error）',
+                                        ('reason',))
+
+# 缓存与术语库
+CACHE_LOOKUPS = REGISTRY.counter('cache_lookups_total',
+                                 '缓存查找次数（translation_memory 按文本，result 按任务结果）', ('cache', 'result'))
+GLOSSARY_CELLS = REGISTRY.counter('glossary_cells_total', '术语库匹配的中文单元格数（hit / miss）', ('result',))
+
+# 存储
+STORAGE_BYTES = REGISTRY.gauge('storage_bytes', '上传、下载、任务日志和清单目录占用的字节数', ('folder',))
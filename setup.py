@@ -53,6 +53,7 @@ def verify_imports():
     modules_to_test = [
         ("google.genai", "Google GenAI SDK"),
         ("openpyxl", "OpenPyXL"),
+        ("numpy", "NumPy"),
         ("pandas", "Pandas")
     ]
     
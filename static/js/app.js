@@ -8,6 +8,8 @@ class ExcelTranslatorApp {
         this.downloadFilename = '';
         this.terminologyDownloadFilename = '';
         this.terminologyMatchedFilename = '';  // 用于翻译的术语库匹配后文件名
+        this.currentJobId = '';  // 正在执行的翻译任务 ID
+        this.currentStage = '';
         
         this.initializeEventListeners();
         this.checkFormValidity();
@@ -56,6 +58,11 @@ class ExcelTranslatorApp {
             this.translateAfterTerminology();
         });
 
+        // 取消翻译
+        document.getElementById('cancelTranslation').addEventListener('click', () => {
+            this.cancelTranslation();
+        });
+
         // 下载结果
         document.getElementById('downloadResult').addEventListener('click', () => {
             this.downloadResult();
@@ -205,6 +212,10 @@ class ExcelTranslatorApp {
             <p><strong>文件大小:</strong> ${this.formatFileSize(uploadData.size)}</p>
         `;
 
+        if (uploadData.estimate) {
+            infoHtml += `<p><strong>预计翻译量:</strong> ${uploadData.estimate.unique_strings} 个不同文本，约 ${uploadData.estimate.estimated_tokens} tokens</p>`;
+        }
+
         try {
             // 获取详细文件分析
             const response = await fetch(`/api/file-info/${uploadData.filename}`);
@@ -248,16 +259,23 @@ class ExcelTranslatorApp {
 
     async startTranslation() {
         const apiKey = document.getElementById('apiKey').value.trim();
-        const keywords = document.getElementById('keywords').value.trim();
 
         if (!apiKey || !this.currentFilename) {
             this.showToast('错误', '请确保已输入 API 密钥并上传文件', 'error');
             return;
         }
 
+        await this.runTranslation(this.currentFilename, 'startTranslation');
+    }
+
+    async runTranslation(filename, buttonId) {
+        const apiKey = document.getElementById('apiKey').value.trim();
+        const keywords = document.getElementById('keywords').value.trim();
+
         // 显示进度
+        this.updateTranslationProgress(null);
         document.getElementById('translationProgress').style.display = 'block';
-        document.getElementById('startTranslation').disabled = true;
+        document.getElementById(buttonId).disabled = true;
 
         try {
             const response = await fetch('/api/translate', {
@@ -267,37 +285,183 @@ class ExcelTranslatorApp {
                 },
                 body: JSON.stringify({
                     api_key: apiKey,
-                    filename: this.currentFilename,
-                    keywords: keywords
+                    filename: filename,
+                    keywords: keywords,
+                    incremental: document.getElementById('incremental').checked,
+                    scope: this.getScopeOptions(),
+                    deadline: document.getElementById('deadline').value.trim() || null
                 })
             });
 
             const data = await response.json();
 
-            if (data.success) {
-                this.downloadFilename = data.download_filename;
-                this.showTranslationResult(data);
-                this.showToast('成功', '翻译完成！', 'success');
-            } else {
+            if (!data.success) {
                 this.showToast('错误', data.message, 'error');
+                return;
+            }
+
+            this.currentJobId = data.job_id;
+            const job = await this.watchJob(data.job_id, (event) => this.updateTranslationProgress(event));
+
+            if (job.status === 'completed') {
+                this.downloadFilename = job.result.download_filename;
+                this.showTranslationResult(job.result);
+                if (job.result.partial) {
+                    const reason = job.result.deadline_reached ? '已到达时间限制' : '部分单元格翻译失败';
+                    this.showToast('部分完成', `${reason}，${job.result.untranslated_cells} 个单元格未翻译`, 'warning');
+                } else {
+                    this.showToast('成功', '翻译完成！', 'success');
+                }
+            } else if (job.status === 'cancelled') {
+                this.showToast('已取消', '翻译任务已取消', 'warning');
+            } else {
+                this.showToast('错误', job.message, 'error');
             }
         } catch (error) {
             this.showToast('错误', `翻译失败: ${error.message}`, 'error');
         } finally {
+            this.currentJobId = '';
             document.getElementById('translationProgress').style.display = 'none';
-            document.getElementById('startTranslation').disabled = false;
+            document.getElementById(buttonId).disabled = false;
+        }
+    }
+
+    watchJob(jobId, onProgress) {
+        // 通过 SSE 接收任务事件；浏览器不支持或连接失败时退回轮询
+        if (!window.EventSource) {
+            return this.waitForJob(jobId, onProgress);
+        }
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/jobs/${jobId}/events`);
+            let finished = false;
+
+            const handleProgress = (e) => onProgress(JSON.parse(e.data));
+            ['stage', 'reused', 'restored', 'chunk'].forEach(type => {
+                source.addEventListener(type, handleProgress);
+            });
+
+            source.addEventListener('status', (e) => {
+                const event = JSON.parse(e.data);
+                onProgress(event);
+                if (['completed', 'failed', 'cancelled'].includes(event.status)) {
+                    finished = true;
+                    source.close();
+                    resolve(event);
+                }
+            });
+
+            source.onerror = () => {
+                if (finished) return;
+                source.close();
+                this.waitForJob(jobId, onProgress).then(resolve, reject);
+            };
+        });
+    }
+
+    async waitForJob(jobId, onProgress) {
+        // 轮询任务状态直到结束
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const data = await response.json();
+
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+
+            const job = data.job;
+            if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+                return job;
+            }
+
+            onProgress({ ...job.progress, stage: job.stage, status: job.status });
+            await new Promise(resolve => setTimeout(resolve, 1000));
         }
     }
 
+    describeStage(stage) {
+        const stageNames = {
+            extract: '正在分析文件',
+            translate: '正在翻译',
+            write: '正在写入结果',
+            scan: '正在扫描术语',
+            done: '即将完成'
+        };
+        return stageNames[stage] || '处理中';
+    }
+
+    formatEta(seconds) {
+        if (seconds === null || seconds === undefined) return '';
+        if (seconds < 60) return `，预计剩余 ${Math.ceil(seconds)} 秒`;
+        return `，预计剩余 ${Math.ceil(seconds / 60)} 分钟`;
+    }
+
+    updateTranslationProgress(progress) {
+        const bar = document.getElementById('translationProgressBar');
+        const text = document.getElementById('translationProgressText');
+
+        if (!progress || progress.status === 'queued') {
+            bar.style.width = '100%';
+            text.textContent = progress ? '任务排队中，请稍候...' : '正在提交翻译任务...';
+            return;
+        }
+
+        if (progress.stage) {
+            this.currentStage = progress.stage;
+        }
+
+        if (!progress.total) {
+            bar.style.width = '100%';
+            text.textContent = `${this.describeStage(this.currentStage)}，请稍候...`;
+            return;
+        }
+
+        const percent = Math.floor(progress.done * 100 / progress.total);
+        const cacheHits = progress.cache_hits ? `，复用 ${progress.cache_hits} 个已有译文` : '';
+        bar.style.width = `${percent}%`;
+        text.textContent = `${this.describeStage(this.currentStage)}：${progress.done} / ${progress.total} 个单元格（${percent}%）`
+            + cacheHits + this.formatEta(progress.eta);
+    }
+
+    async cancelTranslation() {
+        if (!this.currentJobId) return;
+
+        try {
+            const response = await fetch(`/api/jobs/${this.currentJobId}/cancel`, { method: 'POST' });
+            const data = await response.json();
+            this.showToast(data.success ? '已请求' : '错误', data.message, data.success ? 'info' : 'error');
+        } catch (error) {
+            this.showToast('错误', `取消失败: ${error.message}`, 'error');
+        }
+    }
+
+    getScopeOptions() {
+        return {
+            include_sheets: document.getElementById('includeSheets').value.trim(),
+            exclude_sheets: document.getElementById('excludeSheets').value.trim(),
+            ranges: document.getElementById('cellRanges').value.trim(),
+            skip_hidden: document.getElementById('skipHidden').checked,
+            skip_formulas: document.getElementById('skipFormulas').checked
+        };
+    }
+
     showTranslationResult(data) {
         const resultSection = document.getElementById('resultSection');
         const resultContent = document.getElementById('resultContent');
 
+        const untranslatedHtml = data.partial ? `
+                <p class="mb-2"><strong>未翻译:</strong> ${data.untranslated_cells} 个单元格（保持原文，重新翻译可继续）</p>
+                <ul class="small mb-2">
+                    ${data.untranslated.slice(0, 10).map(cell =>
+                        `<li>${cell.sheet_name}!${cell.coord}: ${cell.original}</li>`).join('')}
+                </ul>
+            ` : '';
         const resultHtml = `
-            <div class="alert alert-success">
-                <h6><i class="bi bi-check-circle"></i> 翻译成功完成！</h6>
+            <div class="alert ${data.partial ? 'alert-warning' : 'alert-success'}">
+                <h6><i class="bi bi-check-circle"></i> ${data.partial ? `${data.deadline_reached ? '已到达时间限制' : '部分单元格翻译失败'}，输出部分翻译的文件` : '翻译成功完成！'}</h6>
                 <p class="mb-2"><strong>原文件:</strong> ${this.uploadedFile.name}</p>
                 <p class="mb-2"><strong>译文件:</strong> ${data.download_filename}</p>
+                ${untranslatedHtml}
                 <p class="mb-0"><strong>文件大小:</strong> ${this.formatFileSize(data.output_size)}</p>
             </div>
         `;
@@ -326,6 +490,7 @@ class ExcelTranslatorApp {
         }
 
         // 显示进度
+        document.getElementById('terminologyProgressText').textContent = '正在进行术语库匹配，请稍候...';
         document.getElementById('terminologyProgress').style.display = 'block';
         document.getElementById('terminologyMatch').disabled = true;
 
@@ -343,13 +508,25 @@ class ExcelTranslatorApp {
 
             const data = await response.json();
 
-            if (data.success) {
-                this.terminologyDownloadFilename = data.download_filename;
-                this.terminologyMatchedFilename = data.matched_filename;  // 保存用于翻译的文件名
-                this.showTerminologyResult(data);
-                this.showToast('成功', `术语库匹配完成！共替换 ${data.replacement_count} 个术语`, 'success');
-            } else {
+            if (!data.success) {
                 this.showToast('错误', data.message, 'error');
+                return;
+            }
+
+            const progressText = document.getElementById('terminologyProgressText');
+            const job = await this.watchJob(data.job_id, (event) => {
+                if (event.stage) {
+                    progressText.textContent = `${this.describeStage(event.stage)}，请稍候...`;
+                }
+            });
+
+            if (job.status === 'completed') {
+                this.terminologyDownloadFilename = job.result.download_filename;
+                this.terminologyMatchedFilename = job.result.matched_filename;  // 保存用于翻译的文件名
+                this.showTerminologyResult(job.result);
+                this.showToast('成功', `术语库匹配完成！共替换 ${job.result.replacement_count} 个术语`, 'success');
+            } else {
+                this.showToast('错误', job.message, 'error');
             }
         } catch (error) {
             this.showToast('错误', `术语库匹配失败: ${error.message}`, 'error');
@@ -416,41 +593,7 @@ class ExcelTranslatorApp {
             return;
         }
 
-        const apiKey = document.getElementById('apiKey').value.trim();
-        const keywords = document.getElementById('keywords').value.trim();
-
-        // 显示进度
-        document.getElementById('translationProgress').style.display = 'block';
-        document.getElementById('translateAfterTerminology').disabled = true;
-
-        try {
-            const response = await fetch('/api/translate', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    api_key: apiKey,
-                    filename: this.terminologyMatchedFilename,  // 使用术语库匹配后的文件
-                    keywords: keywords
-                })
-            });
-
-            const data = await response.json();
-
-            if (data.success) {
-                this.downloadFilename = data.download_filename;
-                this.showTranslationResult(data);
-                this.showToast('成功', '翻译完成！', 'success');
-            } else {
-                this.showToast('错误', data.message, 'error');
-            }
-        } catch (error) {
-            this.showToast('错误', `翻译失败: ${error.message}`, 'error');
-        } finally {
-            document.getElementById('translationProgress').style.display = 'none';
-            document.getElementById('translateAfterTerminology').disabled = false;
-        }
+        await this.runTranslation(this.terminologyMatchedFilename, 'translateAfterTerminology');
     }
 
     resetForm() {
@@ -458,6 +601,12 @@ class ExcelTranslatorApp {
         document.getElementById('apiKey').value = '';
         document.getElementById('fileInput').value = '';
         document.getElementById('keywords').value = '';
+        document.getElementById('incremental').checked = false;
+        document.getElementById('deadline').value = '';
+        document.getElementById('includeSheets').value = '';
+        document.getElementById('cellRanges').value = '';
+        document.getElementById('skipHidden').checked = false;
+        document.getElementById('skipFormulas').checked = false;
 
         // 重置状态
         this.apiKey = '';
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""app.py 的测试"""
+
+import io
+import os
+import time
+import zipfile
+import contextlib
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app
+from job_manager import Job, JobManager
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """把上传、下载、任务日志和清单目录指向临时目录"""
+    folders = {}
+    for name in ('UPLOAD_FOLDER', 'DOWNLOAD_FOLDER', 'CHECKPOINT_FOLDER', 'MANIFEST_FOLDER'):
+        folders[name] = tmp_path / name.split('_')[0].lower()
+        folders[name].mkdir()
+        monkeypatch.setitem(app.app.config, name, str(folders[name]))
+    return folders
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """独立的任务管理器；翻译任务不申请 API 客户端，直接调用替换后的 translate_upload"""
+    manager = JobManager(max_workers=1)
+    monkeypatch.setattr(app, 'job_manager', manager)
+    monkeypatch.setattr(app.client_registry, 'lease', lambda api_keys: contextlib.nullcontext())
+
+    class Translator:
+        key_usage = {}
+
+    monkeypatch.setattr(app, 'create_job_translator', lambda client_entry: Translator())
+    return manager
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def write_file(path, size=10, age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    used_at = time.time() - age
+    os.utime(path, (used_at, used_at))
+
+
+def write_group(storage, stem, size=10, age=0):
+    """一个上传文件及其术语库匹配文件、译文、附属文件和任务日志"""
+    paths = [
+        storage['UPLOAD_FOLDER'] / f"{stem}.xlsx",
+        storage['UPLOAD_FOLDER'] / f"{stem}.xlsx.analysis.json",
+        storage['UPLOAD_FOLDER'] / f"{stem}_terminology_matched_0123abcd.xlsx",
+        storage['DOWNLOAD_FOLDER'] / f"{stem}_terminology_matched_0123abcd.xlsx",
+        storage['DOWNLOAD_FOLDER'] / f"{stem}_translated_89abcdef.xlsx",
+        storage['DOWNLOAD_FOLDER'] / f"{stem}_translated_89abcdef.xlsx.result.json",
+        storage['DOWNLOAD_FOLDER'] / f"{stem}_translated_89abcdef.xlsx.perf.json",
+        storage['CHECKPOINT_FOLDER'] / stem / 'journal.jsonl',
+    ]
+    for path in paths:
+        write_file(path, size, age)
+    return paths
+
+
+def test_storage_group_covers_derived_files():
+    stem = 'report_0123456789abcdef'
+    for filename in (f"{stem}.xlsx", f"{stem}.xlsx.analysis.json", f"{stem}_translated_89abcdef.xlsx",
+                     f"{stem}_terminology_matched_0123abcd_translated_89abcdef.xlsx.result.json",
+                     f"{stem}_translated_89abcdef.xlsx.part",
+                     os.path.basename(app.partial_path_for(f"{stem}_translated_89abcdef.xlsx"))):
+        assert app.storage_group(filename) == stem
+    assert app.checkpoint_dir_for(f"{stem}_terminology_matched_0123abcd.xlsx").endswith(stem)
+
+
+def test_expired_group_is_evicted_as_a_whole(storage):
+    old = write_group(storage, 'old_0123456789abcdef', age=app.STORAGE_MAX_AGE_SECONDS + 60)
+    new = write_group(storage, 'new_fedcba9876543210')
+    app.evict_storage(force=True)
+    assert not any(path.exists() for path in old)
+    assert not (storage['CHECKPOINT_FOLDER'] / 'old_0123456789abcdef').exists()
+    assert all(path.exists() for path in new)
+
+
+def test_size_cap_counts_checkpoints_and_manifests(storage, monkeypatch):
+    old = write_group(storage, 'old_0123456789abcdef', size=100, age=20)
+    new = write_group(storage, 'new_fedcba9876543210', size=100, age=10)
+    manifest = storage['MANIFEST_FOLDER'] / 'new.json'
+    write_file(manifest, size=100)
+    # 上传和下载目录合计 1400 字节，加上任务日志和清单超过上限
+    monkeypatch.setattr(app, 'STORAGE_MAX_BYTES', 1500)
+    app.evict_storage(force=True)
+    assert not any(path.exists() for path in old)
+    assert all(path.exists() for path in new)
+    assert manifest.exists()
+
+
+def test_manifest_is_removed_with_the_last_upload_of_its_workbook(storage):
+    write_group(storage, 'report_0123456789abcdef', age=app.STORAGE_MAX_AGE_SECONDS + 60)
+    manifest = storage['MANIFEST_FOLDER'] / 'tenant' / 'report.json'
+    other_manifest = storage['MANIFEST_FOLDER'] / 'tenant' / 'other.json'
+    write_file(manifest)
+    write_file(other_manifest)
+    write_group(storage, 'other_fedcba9876543210')
+    app.evict_storage(force=True)
+    assert not manifest.exists()
+    assert other_manifest.exists()
+
+
+def test_groups_of_active_jobs_are_kept(storage, monkeypatch):
+    paths = write_group(storage, 'busy_0123456789abcdef', age=app.STORAGE_MAX_AGE_SECONDS + 60)
+
+    class ActiveJob:
+        params = {'filename': 'busy_0123456789abcdef_terminology_matched_0123abcd.xlsx'}
+
+    monkeypatch.setattr(app.job_manager, 'active_jobs', lambda: [ActiveJob()])
+    app.evict_storage(force=True)
+    assert all(path.exists() for path in paths)
+
+
+def test_manifest_is_shared_by_versions_of_a_workbook_within_a_tenant(storage):
+    tenant = app.api_key_tenant('key-a')
+    first = app.manifest_path_for('report_0123456789abcdef.xlsx', tenant)
+    assert app.manifest_path_for('report_fedcba9876543210.xlsx', tenant) == first
+    assert app.manifest_path_for('report_fedcba9876543210_terminology_matched_0123abcd.xlsx', tenant) == first
+    assert app.manifest_path_for('budget_0123456789abcdef.xlsx', tenant) != first
+
+
+def test_manifest_is_not_shared_between_tenants(storage):
+    filename = 'report_0123456789abcdef.xlsx'
+    assert (app.manifest_path_for(filename, app.api_key_tenant('key-a'))
+            != app.manifest_path_for(filename, app.api_key_tenant('key-b')))
+
+
+def test_job_cost_uses_stored_analysis_without_parsing(storage, monkeypatch):
+    from create_sample_excel import create_synthetic_excel
+    filename = 'report_0123456789abcdef.xlsx'
+    create_synthetic_excel(str(storage['UPLOAD_FOLDER'] / filename), sheets=1, rows=50, columns=2)
+    monkeypatch.setattr(app, 'cpu_pool', None)
+    estimated_tokens = app.load_upload_analysis(filename)['estimate']['estimated_tokens']
+
+    def no_parsing(*args):
+        raise AssertionError('job_cost 不应解析工作簿')
+
+    monkeypatch.setattr(app.ExcelTranslator, 'run_cpu_stage', no_parsing)
+    assert app.job_cost(filename) == estimated_tokens
+    # 术语库匹配生成的文件还没有分析结果，按原上传文件估算
+    matched = 'report_0123456789abcdef_terminology_matched_0123abcd.xlsx'
+    write_file(storage['UPLOAD_FOLDER'] / matched, size=1234)
+    assert app.job_cost(matched) == estimated_tokens
+    # 没有任何分析结果时按文件大小
+    write_file(storage['UPLOAD_FOLDER'] / 'other_fedcba9876543210.xlsx', size=4321)
+    assert app.job_cost('other_fedcba9876543210.xlsx') == 4321
+
+
+def test_translate_returns_a_job_id_and_runs_in_the_background(storage, jobs, monkeypatch):
+    filename = 'report_0123456789abcdef.xlsx'
+    write_file(storage['UPLOAD_FOLDER'] / filename)
+
+    def translate_upload(translator, filename, *args):
+        return {'download_filename': 'report_translated.xlsx'}
+
+    monkeypatch.setattr(app, 'translate_upload', translate_upload)
+    client = app.app.test_client()
+    response = client.post('/api/translate', json={'api_key': 'key-a', 'filename': filename})
+    job_id = response.get_json()['job_id']
+    assert wait_until(lambda: jobs.get(job_id).finished)
+    job = client.get(f'/api/jobs/{job_id}').get_json()['job']
+    assert job['status'] == Job.COMPLETED
+    assert job['result']['download_filename'] == 'report_translated.xlsx'
+    # 任务参数中不含 API 密钥
+    assert 'key-a' not in str(job)
+    assert client.get('/api/jobs/missing').status_code == 404
+
+
+def test_translate_rejects_missing_uploads_without_creating_a_job(storage, jobs):
+    response = app.app.test_client().post('/api/translate', json={'api_key': 'key-a', 'filename': 'gone.xlsx'})
+    assert response.get_json()['success'] is False
+    assert jobs.jobs == {}
+
+
+def test_event_stream_replays_events_after_last_event_id(jobs):
+    job = jobs.submit('translate', {}, lambda job: job.handle_event({'type': 'chunk', 'cells': 2}) or {'ok': True})
+    assert wait_until(lambda: job.finished)
+    client = app.app.test_client()
+    body = client.get(f'/api/jobs/{job.id}/events').get_data(as_text=True)
+    assert [line for line in body.splitlines() if line.startswith('event:')] == [
+        'event: status', 'event: chunk', 'event: status']
+    resumed = client.get(f'/api/jobs/{job.id}/events', headers={'Last-Event-ID': '2'}).get_data(as_text=True)
+    assert resumed.startswith('id: 3\nevent: status\n')
+    assert client.get('/api/jobs/missing/events').status_code == 404
+
+
+def test_identical_uploads_are_stored_once(storage):
+    first = app.store_upload(io.BytesIO(b'workbook'), 'report.xlsx')
+    second = app.store_upload(io.BytesIO(b'workbook'), 'report.xlsx')
+    changed = app.store_upload(io.BytesIO(b'workbook v2'), 'report.xlsx')
+    assert first == second != changed
+    assert first.startswith('report_') and first.endswith('.xlsx')
+    assert sorted(os.listdir(storage['UPLOAD_FOLDER'])) == sorted([first, changed])
+
+
+def test_output_name_depends_on_keywords_and_scope():
+    filename = 'report_0123456789abcdef.xlsx'
+    name = app.translation_output_filename(filename, '财务', None)
+    assert app.translation_output_filename(filename, '财务', None) == name
+    assert app.translation_output_filename(filename, '医疗', None) != name
+    assert app.translation_output_filename(filename, '财务', {'ranges': 'A:A'}) != name
+    # 增量翻译的输出还取决于租户（各租户的清单不同）
+    incremental = app.translation_output_filename(filename, '财务', None, True, 'tenant-a')
+    assert incremental not in (name, app.translation_output_filename(filename, '财务', None, True, 'tenant-b'))
+    assert app.translation_output_filename(filename, '财务', None, False, 'tenant-a') == name
+
+
+def test_partial_output_does_not_replace_a_published_result(tmp_path):
+    output_path = str(tmp_path / 'report_translated_89abcdef.xlsx')
+    complete, partial = app.partial_path_for(output_path), app.partial_path_for(output_path)
+    assert complete != partial
+    with open(complete, 'w') as f:
+        f.write('complete')
+    with open(partial, 'w') as f:
+        f.write('partial')
+    assert app.publish_output(complete, output_path, {'download_filename': 'report_translated_89abcdef.xlsx'})
+    assert not app.publish_output(partial, output_path)
+    with open(output_path) as f:
+        assert f.read() == 'complete'
+    assert sorted(os.listdir(tmp_path)) == ['report_translated_89abcdef.xlsx',
+                                            'report_translated_89abcdef.xlsx.result.json']
+
+
+def test_translation_with_a_stored_result_is_reused_without_running(storage, jobs, monkeypatch):
+    filename = 'report_0123456789abcdef.xlsx'
+    write_file(storage['UPLOAD_FOLDER'] / filename)
+    output_path = str(storage['DOWNLOAD_FOLDER'] / app.translation_output_filename(filename, '', None))
+    write_file(output_path)
+    app.save_result(output_path, {'download_filename': os.path.basename(output_path)})
+
+    def translate_upload(*args):
+        raise AssertionError('已有相同的翻译结果时不应重新翻译')
+
+    monkeypatch.setattr(app, 'translate_upload', translate_upload)
+    client = app.app.test_client()
+    response = client.post('/api/translate', json={'api_key': 'key-a', 'filename': filename}).get_json()
+    job = client.get(f"/api/jobs/{response['job_id']}").get_json()['job']
+    assert job['status'] == Job.COMPLETED
+    assert job['result'] == {'download_filename': os.path.basename(output_path)}
+    # 只有输出文件、没有任务结果时（如上次翻译中断）不复用
+    os.remove(app.result_path_for(output_path))
+    assert app.load_reusable_result(output_path) is None
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_connection_test_checks_every_key(monkeypatch):
+    keys = [type('Key', (), {'client': name})() for name in ('client-1', 'client-2', 'client-3')]
+    entry = type('Entry', (), {'key_pool': type('Pool', (), {'keys': keys})()})()
+    monkeypatch.setattr(app.client_registry, 'lease', lambda api_keys: contextlib.nullcontext(entry))
+    discarded = []
+    monkeypatch.setattr(app.client_registry, 'discard', discarded.append)
+    replies = {'client-1': 'API连接成功', 'client-2': '无法回答', 'client-3': 'API连接成功'}
+    monkeypatch.setattr(app, 'call_model', lambda client, model, prompt: Reply(replies[client]))
+    assert app.test_gemini_api('k1,k2,k3') == (True, '第 2 个密钥API 响应: 无法回答...')
+    replies['client-2'] = 'API连接成功'
+    assert app.test_gemini_api('k1,k2,k3') == (True, '3 个密钥均API 连接成功')
+
+    def call_model(client, model, prompt):
+        if client == 'client-3':
+            raise RuntimeError('API key not valid')
+        return Reply('API连接成功')
+
+    monkeypatch.setattr(app, 'call_model', call_model)
+    assert app.test_gemini_api('k1,k2,k3') == (False, '第 3 个密钥API 连接失败: API key not valid')
+    assert discarded == [['k1', 'k2', 'k3']]
+
+
+def upload(filename, content):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def test_batch_collects_workbooks_from_files_and_zip_archives(storage):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('q1/report.xlsx', b'report')
+        zf.writestr('q2/budget.xlsx', b'budget')
+        zf.writestr('notes.txt', b'notes')
+        zf.writestr('__MACOSX/q1/._report.xlsx', b'meta')
+        zf.writestr('q1/', b'')
+    uploads, skipped = app.collect_batch_uploads([
+        upload('bundle.zip', archive.getvalue()),
+        # 与压缩包内的文件内容相同，只保存一次
+        upload('report.xlsx', b'report'),
+        upload('summary.pdf', b'pdf'),
+        upload('broken.zip', b'not a zip'),
+    ])
+    assert [original_name for original_name, _ in uploads] == ['report.xlsx', 'budget.xlsx']
+    assert all(os.path.exists(storage['UPLOAD_FOLDER'] / filename) for _, filename in uploads)
+    assert [reason.split(':')[0] for reason in skipped] == ['notes.txt', 'summary.pdf', 'broken.zip']
+
+
+def test_batch_archive_names_are_unique_and_skip_failed_files():
+    uploads = [('report.xlsx', 'a.xlsx'), ('report.xlsx', 'b.xlsx'), ('budget.xlsx', 'c.xlsx')]
+    results = [{'download_filename': 'a_translated.xlsx'}, {'download_filename': 'b_translated.xlsx'},
+               {'error': 'failed'}]
+    assert app.batch_archive_names(uploads, results) == [('report_translated.xlsx', 'a_translated.xlsx'),
+                                                         ('report_translated_2.xlsx', 'b_translated.xlsx')]
+
+
+def test_metrics_endpoint_reports_jobs_and_storage(storage, jobs):
+    write_file(storage['UPLOAD_FOLDER'] / 'report_0123456789abcdef.xlsx', size=123)
+    job = jobs.submit('translate', {}, lambda job: {'ok': True})
+    assert wait_until(lambda: job.finished)
+    response = app.app.test_client().get('/metrics')
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert 'excel_translator_jobs{state="completed"} 1' in body
+    assert 'excel_translator_storage_bytes{folder="uploads"} 123' in body
+    assert '# TYPE excel_translator_stage_duration_seconds histogram' in body
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""benchmark.py 和合成工作簿生成器的测试：确定的生成结果、模拟接口、结果比较"""
+
+import json
+
+import openpyxl
+
+import benchmark
+from benchmark import FakeClient, compare_results, run_benchmark, BENCHMARK_VERSION
+from create_sample_excel import create_synthetic_excel
+
+
+def sheet_values(path):
+    workbook = openpyxl.load_workbook(path)
+    return {worksheet.title: [[cell.value for cell in row] for row in worksheet.iter_rows()]
+            for worksheet in workbook.worksheets}
+
+
+def test_synthetic_workbook_depends_only_on_parameters_and_seed(tmp_path):
+    params = {'sheets': 2, 'rows': 50, 'columns': 4, 'merged_density': 0.2, 'glossary_size': 10}
+    first = create_synthetic_excel(str(tmp_path / 'a.xlsx'), glossary_file=str(tmp_path / 'a_glossary.xlsx'), **params)
+    second = create_synthetic_excel(str(tmp_path / 'b.xlsx'), glossary_file=str(tmp_path / 'b_glossary.xlsx'), **params)
+    other = create_synthetic_excel(str(tmp_path / 'c.xlsx'), seed=1, **params)
+    assert dict(first, file_size=None) == dict(second, file_size=None)
+    assert sheet_values(tmp_path / 'a.xlsx') == sheet_values(tmp_path / 'b.xlsx') != sheet_values(tmp_path / 'c.xlsx')
+    assert sheet_values(tmp_path / 'a_glossary.xlsx') == sheet_values(tmp_path / 'b_glossary.xlsx')
+    assert first['cells'] == 2 * 51 * 4 - first['merged_ranges']
+    assert first['glossary_cells'] > 0 and first['merged_ranges'] > 0
+    # 其他种子只改变内容，不改变工作簿的规模
+    assert other['cells'] == 2 * 51 * 4 - other['merged_ranges']
+
+
+def test_fake_client_answers_batch_prompts_line_by_line():
+    prompt = '请翻译\n待翻译文本:\n1. 苹果\n2. 香蕉 SKU'
+    response = FakeClient().models.generate_content('model', prompt)
+    assert response.text.splitlines() == [benchmark.fake_translation('苹果'), benchmark.fake_translation('香蕉 SKU')]
+    assert all(ord(char) < 128 for char in response.text)
+
+
+def scenario_result(seconds, params=None):
+    return {'params': params or {'rows': 10},
+            'stages': {stage: {'wall_seconds': {'median': value}} for stage, value in seconds.items()},
+            'total_seconds': {'median': sum(seconds.values())}}
+
+
+def test_compare_results_flags_only_significant_slowdowns():
+    baseline = {'scenarios': {'small': scenario_result({'extract': 1.0, 'translate': 0.01, 'write': 1.0}),
+                              'changed': scenario_result({'extract': 1.0}, {'rows': 10})}}
+    current = {'scenarios': {'small': scenario_result({'extract': 1.5, 'translate': 0.03, 'write': 1.1}),
+                             'changed': scenario_result({'extract': 5.0}, {'rows': 20}),
+                             'new': scenario_result({'extract': 1.0})}}
+    comparisons = compare_results(baseline, current)
+    # 参数不同或新增的场景不比较
+    assert {item['scenario'] for item in comparisons} == {'small'}
+    # 短阶段的倍数变化在测量噪声范围内，不视为回退
+    assert {item['stage']: item['regression'] for item in comparisons} == {
+        'extract': True, 'translate': False, 'write': False, 'total': True}
+
+
+def test_benchmark_runs_a_small_scenario_end_to_end(tmp_path):
+    result = run_benchmark({'tiny': {'sheets': 1, 'rows': 20, 'columns': 3, 'glossary_size': 5}}, repeat=2,
+                           work_dir=str(tmp_path))
+    scenario = result['scenarios']['tiny']
+    assert result['version'] == BENCHMARK_VERSION
+    assert set(scenario['stages']) == {'terminology', 'extract', 'translate', 'write'}
+    assert scenario['translated_cells'] > 0 and scenario['requests'] > 0
+    json.dumps(result)
+    # 与自身比较没有回退
+    assert not any(item['regression'] for item in compare_results(result, result))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""excel_translator.py 命令行的测试：退出码、跳过已有译文、中断"""
+
+import os
+import time
+import threading
+
+import openpyxl
+import pytest
+
+import excel_translator
+from benchmark import FakeClient
+from create_sample_excel import create_synthetic_excel
+from excel_translator import main, EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_PARTIAL, EXIT_INTERRUPTED
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """用本地模拟客户端代替 Gemini，每次请求延迟 0.3 秒"""
+    monkeypatch.setattr(excel_translator.genai, 'Client', lambda api_key: FakeClient(latency=0.3))
+
+
+@pytest.fixture
+def fast_client(monkeypatch):
+    monkeypatch.setattr(excel_translator.genai, 'Client', lambda api_key: FakeClient())
+
+
+def cli_file_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('cli-file')]
+
+
+def test_interrupt_returns_promptly_and_stops_in_flight_files(tmp_path, monkeypatch, fake_client):
+    for index in range(2):
+        create_synthetic_excel(str(tmp_path / f"book{index}.xlsx"), sheets=1, rows=600, columns=4,
+                               chinese_ratio=1.0, repetition=0, seed=index)
+    real_as_completed = excel_translator.as_completed
+
+    def interrupted(futures):
+        # 翻译开始后模拟 Ctrl+C
+        time.sleep(1.0)
+        raise KeyboardInterrupt
+        yield from real_as_completed(futures)
+
+    monkeypatch.setattr(excel_translator, 'as_completed', interrupted)
+    started = time.monotonic()
+    code = main([str(tmp_path), '--api-key', 'test', '--requests', '1', '-j', '2', '-q',
+                 '--checkpoint-dir', str(tmp_path / 'checkpoints')])
+    assert code == EXIT_INTERRUPTED
+    assert time.monotonic() - started < 3
+    # 进行中的文件在当前块完成后停止，不会翻译完整个工作簿
+    for thread in cli_file_threads():
+        thread.join(timeout=3)
+    assert cli_file_threads() == []
+    assert not (tmp_path / 'book0_translated.xlsx').exists()
+    assert not (tmp_path / 'book1_translated.xlsx').exists()
+
+
+def test_exclude_sheets_leaves_excluded_sheets_untouched(tmp_path, fast_client):
+    input_file = tmp_path / 'book.xlsx'
+    create_synthetic_excel(str(input_file), sheets=3, rows=20, columns=2, chinese_ratio=1.0)
+    code = main([str(input_file), '--api-key', 'test', '--exclude-sheets', '数据2,数据3', '-q',
+                 '--checkpoint-dir', str(tmp_path / 'checkpoints')])
+    assert code == EXIT_OK
+    original = openpyxl.load_workbook(input_file)
+    translated = openpyxl.load_workbook(tmp_path / 'book_translated.xlsx')
+    assert translated['数据1']['A2'].value != original['数据1']['A2'].value
+    for name in ('数据2', '数据3'):
+        assert [[cell.value for cell in row] for row in translated[name].iter_rows()] == \
+            [[cell.value for cell in row] for row in original[name].iter_rows()]
+
+
+def run_cli(tmp_path, *arguments):
+    return main(list(map(str, arguments)) + ['--api-key', 'test', '-q', '--checkpoint-dir', str(tmp_path / 'checkpoints')])
+
+
+def test_directory_batch_translates_every_workbook_and_keeps_subdirectories(tmp_path, fast_client):
+    inputs = tmp_path / 'inputs'
+    (inputs / 'q1').mkdir(parents=True)
+    create_synthetic_excel(str(inputs / 'report.xlsx'), sheets=1, rows=10, columns=2)
+    create_synthetic_excel(str(inputs / 'q1' / 'budget.xlsx'), sheets=1, rows=10, columns=2)
+    # Excel 的锁文件和已有译文不是输入
+    (inputs / '~$report.xlsx').write_bytes(b'lock')
+    create_synthetic_excel(str(inputs / 'old_translated.xlsx'), sheets=1, rows=5, columns=2)
+    assert run_cli(tmp_path, inputs, '-r', '-o', tmp_path / 'outputs') == EXIT_OK
+    assert sorted(os.path.relpath(os.path.join(directory, name), tmp_path / 'outputs')
+                  for directory, _, names in os.walk(tmp_path / 'outputs') for name in names
+                  if name.endswith('_translated.xlsx')) == [os.path.join('q1', 'budget_translated.xlsx'),
+                                                            'report_translated.xlsx']
+
+
+def test_xls_files_are_skipped_with_a_warning(tmp_path, fast_client, caplog):
+    create_synthetic_excel(str(tmp_path / 'report.xlsx'), sheets=1, rows=10, columns=2)
+    (tmp_path / 'legacy.xls').write_bytes(b'legacy workbook')
+    assert run_cli(tmp_path, tmp_path) == EXIT_OK
+    assert (tmp_path / 'report_translated.xlsx').exists()
+    assert not (tmp_path / 'legacy_translated.xls').exists()
+    assert 'legacy.xls' in caplog.text
+
+
+def test_failed_file_sets_exit_code_but_other_files_are_translated(tmp_path, fast_client):
+    create_synthetic_excel(str(tmp_path / 'report.xlsx'), sheets=1, rows=10, columns=2)
+    assert run_cli(tmp_path, tmp_path / 'report.xlsx', tmp_path / 'missing.xlsx') == EXIT_FAILED
+    assert (tmp_path / 'report_translated.xlsx').exists()
+
+
+def test_time_limit_leaves_partial_output_and_exit_code(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_translator.genai, 'Client', lambda api_key: FakeClient(latency=0.2))
+    create_synthetic_excel(str(tmp_path / 'report.xlsx'), sheets=1, rows=300, columns=4, chinese_ratio=1.0,
+                           repetition=0)
+    assert run_cli(tmp_path, tmp_path / 'report.xlsx', '--requests', '1', '--time-limit', '1.5') == EXIT_PARTIAL
+    assert (tmp_path / 'report_translated.xlsx').exists()
+
+
+def test_skip_existing_keeps_up_to_date_outputs(tmp_path, fast_client, capsys):
+    create_synthetic_excel(str(tmp_path / 'report.xlsx'), sheets=1, rows=10, columns=2)
+    assert run_cli(tmp_path, tmp_path / 'report.xlsx') == EXIT_OK
+    output = tmp_path / 'report_translated.xlsx'
+    modified = output.stat().st_mtime_ns
+    capsys.readouterr()
+    assert run_cli(tmp_path, tmp_path / 'report.xlsx', '--skip-existing') == EXIT_OK
+    assert output.stat().st_mtime_ns == modified
+    assert 'skipped' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('arguments', [
+    [],
+    ['missing_dir/*.xlsx'],
+    ['book.xlsx', '--ranges', 'not a range'],
+    ['book.xlsx', '--glossary', 'missing.xlsx'],
+])
+def test_usage_errors_exit_with_code_2(tmp_path, monkeypatch, fast_client, arguments):
+    monkeypatch.chdir(tmp_path)
+    create_synthetic_excel(str(tmp_path / 'book.xlsx'), sheets=1, rows=5, columns=2)
+    assert run_cli(tmp_path, *arguments) == EXIT_USAGE
+
+
+def test_missing_api_key_is_a_usage_error(tmp_path, monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    assert main([str(tmp_path)]) == EXIT_USAGE
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""client_registry.py 的测试：客户端复用、回收和关闭"""
+
+import time
+
+import pytest
+
+import client_registry
+from client_registry import ClientRegistry
+
+
+class FakeGenaiClient:
+    """记录创建和关闭的 genai.Client 替身"""
+
+    created = []
+
+    def __init__(self, api_key, http_options=None):
+        self.api_key = api_key
+        self.http_options = http_options
+        self.closed = False
+        FakeGenaiClient.created.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    FakeGenaiClient.created = []
+    monkeypatch.setattr(client_registry.genai, 'Client', FakeGenaiClient)
+    return FakeGenaiClient.created
+
+
+def test_same_keys_share_one_entry_and_client(fake_clients):
+    registry = ClientRegistry()
+    with registry.lease(['key-a']) as first:
+        with registry.lease(['key-a', 'key-a']) as second:
+            assert second is first
+            assert first.leases == 2
+    assert len(fake_clients) == 1
+    # 不同密钥组共用同一密钥的客户端和限流状态
+    with registry.lease(['key-a', 'key-b']) as combined:
+        assert combined is not first
+        assert combined.key_pool.keys[0] is first.key_pool.keys[0]
+    assert [client.api_key for client in fake_clients] == ['key-a', 'key-b']
+
+
+def test_translators_share_the_entry_state(fake_clients):
+    registry = ClientRegistry()
+    with registry.lease(['key-a']) as entry:
+        first = registry.create_translator(entry)
+        second = registry.create_translator(entry)
+    assert first.key_pool is second.key_pool is entry.key_pool
+    assert first.request_packer is second.request_packer
+
+
+def test_idle_entries_are_closed(fake_clients):
+    registry = ClientRegistry(idle_seconds=0.05)
+    with registry.lease(['key-a']):
+        pass
+    time.sleep(0.1)
+    with registry.lease(['key-b']):
+        pass
+    assert fake_clients[0].closed and not fake_clients[1].closed
+    assert list(registry.keys) == ['key-b']
+
+
+def test_leased_entries_are_kept_beyond_the_limit(fake_clients):
+    registry = ClientRegistry(max_clients=1)
+    with registry.lease(['key-a']):
+        with registry.lease(['key-b']):
+            assert not any(client.closed for client in fake_clients)
+    with registry.lease(['key-c']):
+        pass
+    # 超出上限时回收最久未使用的空闲条目
+    assert [client.closed for client in fake_clients] == [True, True, False]
+
+
+def test_close_all_closes_every_client(fake_clients):
+    registry = ClientRegistry()
+    with registry.lease(['key-a', 'key-b']):
+        pass
+    registry.close_all()
+    assert all(client.closed for client in fake_clients)
+    assert registry.entries == {} and registry.keys == {}
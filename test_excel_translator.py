@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""excel_translator.py 的测试"""
+
+import os
+import json
+import time
+import threading
+
+import openpyxl
+import pytest
+
+import excel_translator
+from benchmark import FakeClient
+from create_sample_excel import create_synthetic_excel
+from excel_translator import ExcelTranslator, CellScope, TranslationCancelled, ApiKeyState, KeyPool, \
+    RequestHedger, TimingHistory, detect_chinese, chinese_content_from_analysis, CHINESE_PATTERN, \
+    CircuitBreaker, BackendUnavailable, HEDGE_MIN_SAMPLES
+
+
+def make_key_pool(latency=0.0, max_requests=1):
+    return KeyPool([ApiKeyState('test', client=FakeClient(latency), max_requests=max_requests)])
+
+
+def make_hedger():
+    hedger = RequestHedger(percentile=50, budget=1.0, min_delay=0.05)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        hedger.record_latency(0.01)
+    return hedger
+
+
+def slow_request(calls, seconds=0.3):
+    def request(on_latency):
+        calls.append(time.time())
+        time.sleep(seconds if len(calls) == 1 else 0)
+        on_latency(seconds)
+        return 'ok'
+    return request
+
+
+def test_key_pool_latency_excludes_waiting_for_a_key():
+    key_pool = make_key_pool(latency=0.2)
+    latencies = []
+    threads = [threading.Thread(target=key_pool.generate, args=('model', 'prompt'),
+                                kwargs={'on_latency': latencies.append}) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 第二个请求排队等了约 0.2 秒，但只记录模型调用本身的耗时
+    assert len(latencies) == 2
+    assert max(latencies) < 0.35
+
+
+def test_key_pool_is_congested_while_requests_wait_or_keys_cool_down():
+    key_pool = make_key_pool(latency=0.2)
+    assert not key_pool.congested()
+    threads = [threading.Thread(target=key_pool.generate, args=('model', 'prompt')) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    assert key_pool.congested()
+    for thread in threads:
+        thread.join()
+    assert not key_pool.congested()
+    key_pool.keys[0].cooldown_until = time.time() + 10
+    assert key_pool.congested()
+
+
+def test_slow_request_is_hedged():
+    hedger = make_hedger()
+    calls = []
+    assert hedger.call(slow_request(calls), lambda text: text == 'ok') == 'ok'
+    assert len(calls) == 2
+    assert hedger.stats()['hedge_wins'] == 1
+    hedger.close()
+
+
+def test_no_hedge_while_backend_is_congested():
+    hedger = make_hedger()
+    calls = []
+    assert hedger.call(slow_request(calls), lambda text: text == 'ok', congested=lambda: True) == 'ok'
+    assert len(calls) == 1
+    assert hedger.stats()['hedges'] == 0
+    hedger.close()
+
+
+def test_hedger_records_reported_latency_not_wall_time():
+    hedger = RequestHedger()
+    hedger.call(lambda on_latency: on_latency(0.05) or time.sleep(0.2) or 'ok', lambda text: True)
+    assert hedger.latencies == [0.05]
+    hedger.close()
+
+
+def test_concurrent_manifest_saves_leave_a_complete_manifest(tmp_path):
+    manifest_file = str(tmp_path / 'tenant' / 'report.json')
+    translator = ExcelTranslator(api_key=None)
+
+    def save(index):
+        translations = [{'sheet_name': 'Sheet1', 'coord': f"A{row}", 'original': f"原文{row}",
+                         'translation': f"text {index} {row}"} for row in range(1, 200)]
+        translator.save_manifest(manifest_file, {'translations': translations}, 'keywords')
+
+    threads = [threading.Thread(target=save, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(translator.load_manifest(manifest_file, 'keywords')['Sheet1']) == 199
+    assert os.listdir(tmp_path / 'tenant') == ['report.json']
+    with open(manifest_file, encoding='utf-8') as f:
+        assert json.load(f)['keywords'] == 'keywords'
+
+
+def test_scope_from_web_options_excludes_sheets():
+    # Web 界面以逗号分隔的字符串提交工作表列表
+    scope = CellScope.from_dict({'include_sheets': '', 'exclude_sheets': '附录, 说明', 'ranges': '',
+                                 'skip_hidden': False, 'skip_formulas': False})
+    assert not scope.is_unrestricted()
+    assert scope.includes_sheet('数据')
+    assert not scope.includes_sheet('附录')
+    assert not scope.includes_sheet('说明')
+
+
+def test_write_reserve_scales_with_workbook_size_and_history():
+    history = TimingHistory()
+    small = history.write_seconds(200 * 1024)
+    assert small < 1.0
+    assert history.write_seconds(8 * 1024 * 1024) > 10 * small
+    # 本机写回更快时预留更少的时间
+    history.record_write(1024 * 1024, 0.5)
+    assert history.write_seconds(1024 * 1024) < 1.0
+
+
+def test_expected_chunk_seconds_is_the_recent_median():
+    history = TimingHistory(window=3)
+    assert history.expected_chunk_seconds() is None
+    for seconds in (5.0, 0.1, 0.2, 0.3):
+        history.record_chunk(seconds)
+    assert history.expected_chunk_seconds() == 0.2
+
+
+def test_short_deadline_keeps_translating_until_close_to_the_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_translator, 'TIMING_HISTORY', TimingHistory())
+    input_file = str(tmp_path / 'book.xlsx')
+    create_synthetic_excel(input_file, sheets=1, rows=400, columns=4, chinese_ratio=1.0, repetition=0)
+    translator = ExcelTranslator(api_key=None, client=FakeClient(latency=0.1), request_concurrency=1,
+                                 chunk_size=20)
+    started = time.time()
+    report = translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'), deadline=started + 2.5)
+    elapsed = time.time() - started
+    assert report['deadline_reached']
+    assert elapsed <= 2.5
+    # 小工作簿只需预留很短的写回时间，翻译一直进行到接近截止时间
+    assert report['performance']['stages']['translate']['wall_seconds'] > 1.8
+
+
+def test_individual_fallback_does_not_sleep_between_cells():
+    translator = ExcelTranslator(api_key=None, key_pool=make_key_pool())
+    started = time.time()
+    translations = translator.translate_individually([f"文本{index}" for index in range(10)])
+    assert len(translations) == 10 and None not in translations
+    assert time.time() - started < 1.0
+
+
+def workbook_values(path):
+    workbook = openpyxl.load_workbook(path)
+    return {worksheet.title: [[cell.value for cell in row] for row in worksheet.iter_rows()]
+            for worksheet in workbook.worksheets}
+
+
+def test_parallel_sheet_scan_matches_serial_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_translator, 'PARALLEL_SCAN_MIN_BYTES', 0)
+    input_file = str(tmp_path / 'book.xlsx')
+    create_synthetic_excel(input_file, sheets=3, rows=60, columns=4)
+    serial = ExcelTranslator(api_key=None, scan_workers=1).extract_chinese_content(input_file)
+    translator = ExcelTranslator(api_key=None, scan_workers=3)
+    with translator.instrumentation.span('extract'):
+        parallel = translator.extract_chinese_content(input_file)
+    assert parallel == serial
+    assert list(parallel) == ['数据1', '数据2', '数据3']
+    # 子进程扫描的 CPU 时间计入本任务
+    assert translator.instrumentation.report()['stages']['extract']['cpu_seconds'] > 0
+
+
+def test_process_pools_do_not_fork_the_threaded_parent():
+    pool = excel_translator.create_process_pool(1)
+    try:
+        assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+        assert pool.submit(os.getpid).result() != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_parallel_terminology_matching_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_translator, 'PARALLEL_SCAN_MIN_BYTES', 0)
+    input_file = str(tmp_path / 'book.xlsx')
+    glossary_file = str(tmp_path / 'glossary.xlsx')
+    create_synthetic_excel(input_file, sheets=2, rows=60, columns=4, glossary_size=20, glossary_ratio=0.3,
+                           glossary_file=glossary_file)
+    terminology = ExcelTranslator(api_key=None).load_terminology(glossary_file)
+    outputs = []
+    for workers in (1, 2):
+        output_file = str(tmp_path / f"matched_{workers}.xlsx")
+        count = ExcelTranslator(api_key=None, scan_workers=workers).apply_terminology_matching(
+            input_file, output_file, terminology_dict=terminology)
+        outputs.append((count, workbook_values(output_file)))
+    assert outputs[0][0] > 0
+    assert outputs[0] == outputs[1]
+
+
+class CountingClient(FakeClient):
+    """记录每次请求的待翻译文本数"""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.batches = []
+        generate_content = self.models.generate_content
+
+        def counting_generate_content(model, contents, **kwargs):
+            lines = contents.split('\n')
+            self.batches.append(len(lines) - lines.index('待翻译文本:') - 1 if '待翻译文本:' in lines else 1)
+            return generate_content(model, contents, **kwargs)
+
+        self.models.generate_content = counting_generate_content
+
+    @property
+    def texts(self):
+        return sum(self.batches)
+
+
+def write_workbook(path, rows):
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+
+
+def test_incremental_translation_only_sends_new_or_changed_cells(tmp_path):
+    manifest_file = str(tmp_path / 'manifests' / 'report.json')
+    write_workbook(tmp_path / 'v1.xlsx', [['产品名称', '价格'], ['苹果', '香蕉'], ['橙子', 1]])
+    client = CountingClient()
+    ExcelTranslator(api_key=None, client=client).translate_excel(
+        str(tmp_path / 'v1.xlsx'), str(tmp_path / 'v1_out.xlsx'), manifest_file=manifest_file)
+    assert client.texts == 5
+
+    # 修改一个单元格、移动一个单元格、新增一个单元格
+    write_workbook(tmp_path / 'v2.xlsx', [['产品名称', '价格'], ['苹果', '葡萄'], [1, '橙子'], ['西瓜']])
+    client = CountingClient()
+    report = ExcelTranslator(api_key=None, client=client).translate_excel(
+        str(tmp_path / 'v2.xlsx'), str(tmp_path / 'v2_out.xlsx'), manifest_file=manifest_file)
+    assert client.texts == 2
+    assert report['performance']['cache']['manifest_cells'] == 4
+    values = workbook_values(tmp_path / 'v2_out.xlsx')['Sheet']
+    assert values[2][1] == workbook_values(tmp_path / 'v1_out.xlsx')['Sheet'][2][0]
+
+
+def test_manifest_is_ignored_when_keywords_change(tmp_path):
+    manifest_file = str(tmp_path / 'report.json')
+    write_workbook(tmp_path / 'book.xlsx', [['产品名称', '价格']])
+    ExcelTranslator(api_key=None, client=FakeClient()).translate_excel(
+        str(tmp_path / 'book.xlsx'), str(tmp_path / 'out.xlsx'), keywords='医学', manifest_file=manifest_file)
+    client = CountingClient()
+    ExcelTranslator(api_key=None, client=client).translate_excel(
+        str(tmp_path / 'book.xlsx'), str(tmp_path / 'out.xlsx'), keywords='法律', manifest_file=manifest_file)
+    assert client.texts == 2
+
+
+def test_interrupted_job_resumes_from_its_journal(tmp_path):
+    input_file = str(tmp_path / 'book.xlsx')
+    output_file = str(tmp_path / 'out.xlsx')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    create_synthetic_excel(input_file, sheets=1, rows=100, columns=4, chinese_ratio=1.0, repetition=0)
+    chunks = []
+
+    def cancel_after_two_chunks(event):
+        if event['type'] == 'chunk':
+            chunks.append(event)
+            if len(chunks) == 2:
+                raise TranslationCancelled('已取消')
+
+    translator = ExcelTranslator(api_key=None, client=FakeClient(), request_concurrency=1, chunk_size=50)
+    with pytest.raises(TranslationCancelled):
+        translator.translate_excel(input_file, output_file, checkpoint_dir=checkpoint_dir,
+                                   progress_callback=cancel_after_two_chunks)
+    journal_file = translator.journal_path(checkpoint_dir, input_file)
+    assert os.path.exists(journal_file)
+
+    client = CountingClient()
+    report = ExcelTranslator(api_key=None, client=client, request_concurrency=1, chunk_size=50).translate_excel(
+        input_file, output_file, checkpoint_dir=checkpoint_dir)
+    restored = report['performance']['cache']['checkpoint_cells']
+    assert restored >= 100
+    assert client.texts == report['translated_cells'] - restored
+    assert report['untranslated_cells'] == 0
+    # 输出完整生成后任务日志删除
+    assert not os.path.exists(journal_file)
+
+
+def test_journal_tolerates_a_truncated_last_line(tmp_path):
+    journal_file = str(tmp_path / 'journal.jsonl')
+    translator = ExcelTranslator(api_key=None)
+    translator.append_journal(journal_file, [{'sheet_name': 'Sheet', 'coord': 'A1', 'original': '苹果'}], ['apple'])
+    with open(journal_file, 'a', encoding='utf-8') as f:
+        f.write('{"cells": [["Sheet", "A2"')
+    assert list(translator.load_journal(journal_file).values()) == ['apple']
+
+
+def test_journal_in_use_by_another_job_is_left_alone(tmp_path):
+    input_file = str(tmp_path / 'book.xlsx')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    create_synthetic_excel(input_file, sheets=1, rows=20, columns=2, chinese_ratio=1.0)
+    translator = ExcelTranslator(api_key=None, client=FakeClient())
+    journal_file = translator.journal_path(checkpoint_dir, input_file)
+    translator.append_journal(journal_file, [{'sheet_name': '数据1', 'coord': 'A2', 'original': '苹果'}], ['apple'])
+    with open(journal_file, 'rb') as f:
+        journal = f.read()
+    # 另一个任务正在使用该日志
+    owner = translator.claim_journal(journal_file)
+    try:
+        report = translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'), checkpoint_dir=checkpoint_dir)
+        assert report['untranslated_cells'] == 0
+        assert report['performance']['cache']['checkpoint_cells'] == 0
+        with open(journal_file, 'rb') as f:
+            assert f.read() == journal
+    finally:
+        translator.release_journal(owner)
+    # 日志释放后可以再次占用，完整翻译后删除
+    translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'), checkpoint_dir=checkpoint_dir)
+    assert not os.path.exists(journal_file)
+    assert ExcelTranslator.journals_in_use == set()
+
+
+def scoped_workbook(path):
+    """可见表含隐藏行、隐藏列和中文公式，另有一个隐藏工作表"""
+    workbook = openpyxl.Workbook()
+    visible = workbook.active
+    visible.title = '数据'
+    visible.append(['名称', '说明', '备注'])
+    visible.append(['苹果', '水果', '=CONCAT("合计","值")'])
+    visible.append(['隐藏行', '隐藏行', '隐藏行'])
+    visible.row_dimensions[3].hidden = True
+    visible.column_dimensions['B'].hidden = True
+    hidden = workbook.create_sheet('附录')
+    hidden.append(['附录内容'])
+    hidden.sheet_state = 'hidden'
+    workbook.save(path)
+
+
+def extracted_cells(path, **options):
+    content = ExcelTranslator(api_key=None).extract_chinese_content(str(path), CellScope(**options))
+    return {sheet_name: sorted(cells) for sheet_name, cells in content.items() if cells}
+
+
+def test_scope_filters_sheets_ranges_hidden_content_and_formulas(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    scoped_workbook(path)
+    everything = extracted_cells(path)
+    assert everything['数据'] == ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']
+    assert everything['附录'] == ['A1']
+    assert extracted_cells(path, exclude_sheets=['附录']).keys() == {'数据'}
+    assert extracted_cells(path, include_sheets=['附录']) == {'附录': ['A1']}
+    assert extracted_cells(path, ranges=['A:A']) == {'数据': ['A1', 'A2', 'A3'], '附录': ['A1']}
+    # 限定工作表的区域只约束该工作表
+    assert extracted_cells(path, ranges=['数据!B1:C2']) == {'数据': ['B1', 'B2', 'C1', 'C2'], '附录': ['A1']}
+    assert extracted_cells(path, skip_hidden=True) == {'数据': ['A1', 'A2', 'C1', 'C2']}
+    assert 'C2' not in extracted_cells(path, skip_formulas=True)['数据']
+
+
+def test_vectorized_detection_matches_the_regex():
+    values = ['苹果', 'apple', '', None, 42, 3.5, 'café', '价格 100 元', '苹果', '𠀀扩展', 'ｱｲｳ', '日本語かな',
+              '　', '中' * 500]
+    mask, counts = detect_chinese(values)
+    for value, detected, count in zip(values, mask, counts):
+        expected = sum(len(match) for match in CHINESE_PATTERN.findall(value)) if isinstance(value, str) else 0
+        assert detected == (expected > 0), value
+        assert count == expected, value
+
+
+def test_vectorized_detection_handles_empty_and_ascii_only_columns():
+    mask, counts = detect_chinese([])
+    assert len(mask) == 0 and len(counts) == 0
+    mask, counts = detect_chinese(['a', 'b', 1])
+    assert not mask.any() and not counts.any()
+
+
+@pytest.mark.parametrize('options', [{}, {'skip_hidden': True, 'skip_formulas': True}, {'ranges': ['A:B']},
+                                     {'exclude_sheets': ['附录']}])
+def test_content_restored_from_analysis_matches_extraction(tmp_path, options):
+    path = tmp_path / 'book.xlsx'
+    scoped_workbook(path)
+    translator = ExcelTranslator(api_key=None)
+    analysis = json.loads(json.dumps(translator.analyze_workbook(str(path))))
+    restored = chinese_content_from_analysis(analysis, CellScope(**options))
+    assert restored == translator.extract_chinese_content(str(path), CellScope(**options))
+
+
+def test_saved_analysis_is_reused_until_the_workbook_changes(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    analysis_file = str(tmp_path / 'book.xlsx.analysis.json')
+    scoped_workbook(path)
+    translator = ExcelTranslator(api_key=None)
+    analysis = translator.analyze_workbook(str(path), analysis_file)
+    assert translator.load_analysis(analysis_file, str(path))['estimate'] == analysis['estimate']
+    write_workbook(path, [['新内容']])
+    assert translator.load_analysis(analysis_file, str(path)) is None
+
+
+class RecordingTranslator:
+    """只记录 translate_chunk 调用的翻译器替身"""
+
+    model = 'test-model'
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def translate_chunk(self, texts, keywords=""):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [f'EN:{text}' for text in texts]
+
+
+def translate_concurrently(packer, batches):
+    """每组 (翻译器, 文本) 在各自的线程中提交，返回各组的译文"""
+    results = [None] * len(batches)
+
+    def run(index, translator, texts):
+        results[index] = packer.translate(translator, texts)
+
+    threads = [threading.Thread(target=run, args=(index,) + batch) for index, batch in enumerate(batches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_packer_fills_one_request_from_several_translators():
+    first, second = RecordingTranslator(), RecordingTranslator()
+    packer = excel_translator.RequestPacker(max_texts=4, linger=1.0)
+    results = translate_concurrently(packer, [(first, ['苹果', '香蕉']), (second, ['橙子', '苹果'])])
+    assert results == [['EN:苹果', 'EN:香蕉'], ['EN:橙子', 'EN:苹果']]
+    # 满额后立即发送，重复文本只翻译一次
+    assert packer.requests == 1
+    calls = first.calls + second.calls
+    assert len(calls) == 1 and sorted(calls[0]) == sorted(['苹果', '香蕉', '橙子'])
+
+
+def test_packer_sends_a_partial_request_after_linger():
+    translator = RecordingTranslator()
+    packer = excel_translator.RequestPacker(max_texts=100, linger=0.05)
+    started = time.monotonic()
+    assert packer.translate(translator, ['苹果']) == ['EN:苹果']
+    assert time.monotonic() - started < 1
+    assert translator.calls == [['苹果']]
+
+
+def test_packer_splits_by_text_and_char_limits():
+    translator = RecordingTranslator()
+    packer = excel_translator.RequestPacker(max_texts=2, max_chars=1000, linger=0.01)
+    assert packer.translate(translator, ['一', '二', '三']) == ['EN:一', 'EN:二', 'EN:三']
+    assert translator.calls == [['一', '二'], ['三']]
+    packer = excel_translator.RequestPacker(max_texts=100, max_chars=4, linger=0.01)
+    packer.translate(translator, ['一二三', '四五六'])
+    assert translator.calls[-2:] == [['一二三'], ['四五六']]
+
+
+def test_packer_returns_errors_to_every_caller():
+    failing = RecordingTranslator(error=RuntimeError('backend unavailable'))
+    packer = excel_translator.RequestPacker(max_texts=2, linger=1.0)
+    errors = []
+
+    def run(texts):
+        try:
+            packer.translate(failing, texts)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run, args=([text],)) for text in ('苹果', '香蕉')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ['backend unavailable'] * 2
+    assert len(failing.calls) == 1
+
+
+class ShortTranslator(RecordingTranslator):
+    """只返回第一条译文的翻译器替身"""
+
+    def translate_chunk(self, texts, keywords=""):
+        return super().translate_chunk(texts, keywords)[:1]
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def test_packer_resolves_every_caller_when_sending_breaks_midway():
+    packer = excel_translator.RequestPacker(max_texts=2, linger=1.0)
+    outcomes = []
+
+    def run(texts):
+        try:
+            outcomes.append(packer.translate(ShortTranslator(), texts))
+        except RuntimeError as e:
+            outcomes.append(str(e))
+
+    threads = [threading.Thread(target=run, args=([text],)) for text in ('苹果', '香蕉')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(outcomes) == 2 and any('缺少译文' in str(outcome) for outcome in outcomes)
+    # 中断同样交给每个等待中的调用方
+    interrupted = RecordingTranslator(error=Interrupted())
+    packer = excel_translator.RequestPacker(max_texts=1, linger=1.0)
+    with pytest.raises(Interrupted):
+        packer.translate(interrupted, ['苹果'])
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_single_flight_waits_for_identical_text_in_flight():
+    flight = excel_translator.SingleFlight()
+    release = threading.Event()
+    requested = []
+
+    def slow(texts):
+        requested.append(list(texts))
+        release.wait(5)
+        return [f'EN:{text}' for text in texts]
+
+    def fast(texts):
+        requested.append(list(texts))
+        return [f'EN:{text}' for text in texts]
+
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=flight.translate(['苹果'], '', 'm', slow)))
+    first.start()
+    assert wait_for(lambda: requested == [['苹果']])
+    second = threading.Thread(target=lambda: results.update(second=flight.translate(['香蕉', '苹果'], '', 'm', fast)))
+    second.start()
+    assert wait_for(lambda: len(requested) == 2)
+    # 第二个请求方只请求不在途的文本
+    assert requested[1] == ['香蕉']
+    release.set()
+    first.join()
+    second.join()
+    assert results == {'first': ['EN:苹果'], 'second': ['EN:香蕉', 'EN:苹果']}
+    assert flight.in_flight == {}
+
+
+def test_single_flight_waiter_retries_after_the_owner_fails():
+    flight = excel_translator.SingleFlight()
+    release = threading.Event()
+
+    def failing(texts):
+        release.wait(5)
+        raise RuntimeError('backend unavailable')
+
+    owner = threading.Thread(target=lambda: pytest.raises(RuntimeError, flight.translate, ['苹果'], '', 'm', failing))
+    owner.start()
+    assert wait_for(lambda: flight.in_flight)
+    waiter_requests = []
+
+    def succeed(texts):
+        waiter_requests.append(list(texts))
+        return [f'EN:{text}' for text in texts]
+
+    threading.Timer(0.1, release.set).start()
+    assert flight.translate(['苹果'], '', 'm', succeed) == ['EN:苹果']
+    owner.join()
+    assert waiter_requests == [['苹果']]
+
+
+class RateLimitedClient:
+    """每次调用都返回 429 的客户端替身"""
+
+    class RateLimitError(Exception):
+        code = 429
+
+    def __init__(self):
+        self.models = self
+        self.calls = 0
+
+    def generate_content(self, model, contents):
+        self.calls += 1
+        raise self.RateLimitError('RESOURCE_EXHAUSTED')
+
+
+def test_rate_limited_key_cools_down_and_request_moves_to_another_key():
+    limited = RateLimitedClient()
+    pool = KeyPool([ApiKeyState('limited', client=limited), ApiKeyState('healthy', client=FakeClient())])
+    usage = {}
+    for _ in range(3):
+        pool.generate('test-model', '1. 苹果', usage)
+    limited_usage, healthy_usage = pool.usage()
+    # 限流的密钥只被尝试一次，冷却期间的请求都发给另一个密钥
+    assert limited.calls == 1
+    assert limited_usage['rate_limited'] == 1 and limited_usage['cooldown_seconds'] > 0
+    assert healthy_usage['requests'] == 3
+    assert usage[healthy_usage['key_id']]['requests'] == 3
+
+
+def test_requests_are_spread_over_keys_and_per_minute_quota():
+    pool = KeyPool([ApiKeyState('a', client=FakeClient()), ApiKeyState('b', client=FakeClient())])
+    for _ in range(4):
+        pool.generate('test-model', '1. 苹果')
+    assert [key['requests'] for key in pool.usage()] == [2, 2]
+    # 每个请求发给每分钟剩余配额最多的密钥
+    pool = KeyPool([ApiKeyState('a', client=FakeClient(), requests_per_minute=1),
+                    ApiKeyState('b', client=FakeClient(), requests_per_minute=2)])
+    for _ in range(3):
+        pool.generate('test-model', '1. 苹果')
+    assert [(key['requests'], key['remaining_quota']) for key in pool.usage()] == [(1, 0), (2, 0)]
+
+
+def test_request_fails_once_every_key_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(excel_translator, 'RATE_LIMIT_COOLDOWN_SECONDS', 0.01)
+    pool = KeyPool([ApiKeyState('a', client=RateLimitedClient()), ApiKeyState('b', client=RateLimitedClient())])
+    with pytest.raises(RateLimitedClient.RateLimitError):
+        pool.generate('test-model', '1. 苹果')
+    assert sum(key.client.calls for key in pool.keys) == excel_translator.RATE_LIMIT_RETRIES_PER_KEY * 2
+
+
+def test_deadline_writes_partial_output_and_lists_untranslated_cells(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_translator, 'TIMING_HISTORY', TimingHistory())
+    input_file = str(tmp_path / 'book.xlsx')
+    output_file = str(tmp_path / 'out.xlsx')
+    create_synthetic_excel(input_file, sheets=1, rows=200, columns=4, chinese_ratio=1.0, repetition=0)
+    translator = ExcelTranslator(api_key=None, client=FakeClient(latency=0.1), request_concurrency=1,
+                                 chunk_size=20)
+    report = translator.translate_excel(input_file, output_file, deadline=time.time() + 1.0)
+    assert report['deadline_reached']
+    assert report['translated_cells'] > 0 and report['untranslated_cells'] > 0
+    assert {cell['reason'] for cell in report['untranslated']} == {'deadline'}
+    # 译文和未翻译的单元格都写入输出文件，未翻译的保持原文
+    original = openpyxl.load_workbook(input_file)
+    output = openpyxl.load_workbook(output_file)
+    for cell in report['untranslated']:
+        coord = cell['coord']
+        assert output[cell['sheet_name']][coord].value == original[cell['sheet_name']][coord].value == cell['original']
+    changed = sum(cell.value != original[worksheet.title][cell.coordinate].value
+                  for worksheet in output.worksheets for row in worksheet.iter_rows() for cell in row)
+    assert changed >= report['translated_cells']
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.1)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError('503'))
+    breaker.before_call()
+    breaker.record_success()
+    # 成功后重新计数
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError('503'))
+    assert breaker.stats() == {'state': CircuitBreaker.OPEN, 'consecutive_failures': 3}
+    with pytest.raises(BackendUnavailable):
+        breaker.before_call()
+    time.sleep(0.15)
+    # 半开状态只放行一次试探请求
+    breaker.before_call()
+    with pytest.raises(BackendUnavailable):
+        breaker.before_call()
+    breaker.record_failure(RuntimeError('503'))
+    assert breaker.stats()['state'] == CircuitBreaker.OPEN
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats() == {'state': CircuitBreaker.CLOSED, 'consecutive_failures': 0}
+
+
+class FailingClient:
+    """每次调用都失败的客户端替身"""
+
+    def __init__(self):
+        self.models = self
+        self.calls = 0
+
+    def generate_content(self, model, contents):
+        self.calls += 1
+        raise RuntimeError('503 Service Unavailable')
+
+
+def test_backend_outage_fails_the_job_without_calling_per_cell(tmp_path):
+    input_file = str(tmp_path / 'book.xlsx')
+    create_synthetic_excel(input_file, sheets=1, rows=100, columns=4, chinese_ratio=1.0, repetition=0)
+    client = FailingClient()
+    translator = ExcelTranslator(api_key=None, client=client, request_concurrency=1, chunk_size=20,
+                                 circuit_breaker=CircuitBreaker(failure_threshold=3, reset_seconds=60))
+    with pytest.raises(BackendUnavailable):
+        translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'))
+    # 熔断后不再逐个单元格重试
+    assert client.calls <= 5
+
+
+def test_translate_excel_reports_stage_timings_to_hooks_and_report_file(tmp_path):
+    input_file = str(tmp_path / 'book.xlsx')
+    report_file = str(tmp_path / 'out.xlsx.perf.json')
+    create_synthetic_excel(input_file, sheets=1, rows=50, columns=2, chinese_ratio=1.0)
+    spans = []
+    translator = ExcelTranslator(api_key=None, client=FakeClient(), instrumentation_hooks=[spans.append])
+    report = translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'), report_file=report_file)
+    names = {span['name'] for span in spans}
+    assert {'extract', 'translate', 'write', 'api_call'} <= names
+    with open(report_file, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == report['performance']['version']
+    assert {'extract', 'translate', 'write'} <= set(saved['stages'])
+    assert saved['requests']['count'] == sum(span['kind'] == 'request' for span in spans) > 0
+
+
+def test_cell_log_summarises_per_sheet_and_writes_the_audit_file(tmp_path, caplog):
+    audit_file = str(tmp_path / 'out.xlsx.audit.jsonl')
+    cell_log = excel_translator.CellLog('translate', audit_file, sample_size=2)
+    for row in range(1, 101):
+        cell_log.record('数据', f'A{row}', f'苹果{row}', f'Apple {row}')
+    cell_log.record('汇总', 'B2', '合计', 'Total')
+    with caplog.at_level('INFO', logger='excel_translator'):
+        cell_log.flush()
+    summaries = [record.getMessage() for record in caplog.records if record.getMessage().startswith('[translate]')]
+    # 每个工作表一条汇总，只列出前几个示例
+    assert len(summaries) == 2
+    assert '更新 100 个单元格' in summaries[0] and 'A2' in summaries[0] and 'A3' not in summaries[0]
+    with open(audit_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 101
+    assert records[-1] == {'action': 'translate', 'sheet': '汇总', 'cell': 'B2', 'original': '合计', 'value': 'Total'}
+    # flush 后重新开始收集
+    cell_log.flush()
+    with open(audit_file, encoding='utf-8') as f:
+        assert len(f.readlines()) == 101
+
+
+def test_translation_audit_file_lists_every_changed_cell(tmp_path):
+    input_file = str(tmp_path / 'book.xlsx')
+    audit_file = str(tmp_path / 'out.xlsx.audit.jsonl')
+    create_synthetic_excel(input_file, sheets=1, rows=30, columns=2, chinese_ratio=1.0)
+    translator = ExcelTranslator(api_key=None, client=FakeClient())
+    report = translator.translate_excel(input_file, str(tmp_path / 'out.xlsx'), audit_file=audit_file)
+    with open(audit_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == report['translated_cells']
+    assert {record['action'] for record in records} == {'translate'}
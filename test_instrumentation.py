@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""instrumentation.py 的测试：钩子、请求统计、只归属本任务的 CPU 时间、进程级峰值内存"""
+
+import sys
+import subprocess
+
+import pytest
+
+from instrumentation import Instrumentation
+
+
+def test_stage_cpu_excludes_unrelated_child_processes():
+    instrumentation = Instrumentation()
+    with instrumentation.span('extract'):
+        # 同一进程中其他任务的子进程在此期间结束，其 CPU 时间不属于本任务
+        subprocess.run([sys.executable, '-c', 'sum(range(20000000))'], check=True)
+    assert instrumentation.report()['stages']['extract']['cpu_seconds'] < 0.2
+
+
+def test_worker_usage_is_added_to_the_innermost_span():
+    instrumentation = Instrumentation()
+    with instrumentation.span('translate'):
+        with instrumentation.span('write'):
+            instrumentation.add_worker_usage(1.5, 200 * 1024 * 1024)
+    stages = instrumentation.report()['stages']
+    assert 1.5 <= stages['write']['cpu_seconds'] < 1.7
+    assert stages['translate']['cpu_seconds'] < 0.2
+    assert instrumentation.report()['worker_process_peak_rss_mb'] == 200.0
+
+
+def test_memory_fields_are_labelled_process_wide():
+    report = Instrumentation().report()
+    assert 'peak_rss_mb' not in report
+    assert 'process_peak_rss_mb' in report
+    assert report['worker_process_peak_rss_mb'] is None
+
+
+def test_hooks_receive_finished_spans_including_errors():
+    spans = []
+
+    def broken_hook(span):
+        raise RuntimeError('hook failed')
+
+    instrumentation = Instrumentation([spans.append, broken_hook])
+    with instrumentation.span('extract', sheets=2) as span:
+        span['cells'] = 10
+    with pytest.raises(ValueError):
+        with instrumentation.span('write'):
+            raise ValueError('disk full')
+    assert [(span['name'], span['kind'], span['error']) for span in spans] == [
+        ('extract', 'stage', None), ('write', 'stage', 'disk full')]
+    assert spans[0]['sheets'] == 2 and spans[0]['cells'] == 10
+    assert all(span['wall_seconds'] >= 0 and span['cpu_seconds'] >= 0 for span in spans)
+
+
+def test_request_spans_are_summarised_separately_from_stages():
+    instrumentation = Instrumentation()
+    with instrumentation.span('translate'):
+        for error in (None, RuntimeError('503')):
+            try:
+                with instrumentation.span('api_call', kind='request'):
+                    if error is not None:
+                        raise error
+            except RuntimeError:
+                pass
+        instrumentation.count('retries')
+    report = instrumentation.report(input_file='book.xlsx')
+    assert list(report['stages']) == ['translate']
+    assert (report['requests']['count'], report['requests']['errors'], report['requests']['retries']) == (2, 1, 1)
+    assert report['input_file'] == 'book.xlsx'
+    instrumentation.reset()
+    assert instrumentation.report()['stages'] == {}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""job_manager.py 的测试：任务执行、取消、去重、事件流、按密钥限流和短作业优先调度"""
+
+import time
+import threading
+
+from job_manager import Job, JobManager
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def blocking_job(release):
+    """在 release 被设置前一直执行的任务函数，期间按块发送进度以便响应取消"""
+    def run(job):
+        job.handle_event({'type': 'stage', 'stage': 'translate', 'total': 10})
+        while not release.wait(0.01):
+            job.handle_event({'type': 'heartbeat'})
+        return {'ok': True}
+    return run
+
+
+def test_job_runs_in_the_background_and_reports_its_result():
+    manager = JobManager(max_workers=1)
+    job = manager.submit('translate', {'file': 'a.xlsx'}, lambda job: {'output': 'a_translated.xlsx'})
+    assert wait_until(lambda: job.finished)
+    state = job.to_dict()
+    assert state['status'] == Job.COMPLETED
+    assert state['result'] == {'output': 'a_translated.xlsx'}
+    assert state['params'] == {'file': 'a.xlsx'}
+    assert manager.get(job.id) is job
+
+
+def test_failing_job_is_marked_failed():
+    def fail(job):
+        raise RuntimeError('backend unavailable')
+
+    manager = JobManager(max_workers=1)
+    job = manager.submit('translate', {}, fail)
+    assert wait_until(lambda: job.finished)
+    assert job.status == Job.FAILED
+    assert 'backend unavailable' in job.message
+
+
+def test_cancel_stops_running_and_queued_jobs():
+    release = threading.Event()
+    manager = JobManager(max_workers=1)
+    running = manager.submit('translate', {}, blocking_job(release))
+    queued = manager.submit('translate', {}, blocking_job(release))
+    assert wait_until(lambda: running.status == Job.RUNNING)
+    assert manager.cancel(queued.id)
+    assert queued.status == Job.CANCELLED
+    assert manager.cancel(running.id)
+    assert wait_until(lambda: running.finished)
+    assert running.status == Job.CANCELLED
+    # 已结束的任务不能再取消
+    assert not manager.cancel(running.id)
+    assert not manager.cancel('missing')
+
+
+def test_duplicate_submission_returns_the_unfinished_job():
+    release = threading.Event()
+    manager = JobManager(max_workers=1)
+    first = manager.submit('translate', {}, blocking_job(release), dedupe_key='a.xlsx')
+    assert manager.submit('translate', {}, blocking_job(release), dedupe_key='a.xlsx') is first
+    release.set()
+    assert wait_until(lambda: first.finished)
+    second = manager.submit('translate', {}, blocking_job(release), dedupe_key='a.xlsx')
+    assert second is not first
+    assert wait_until(lambda: second.finished)
+
+
+def test_events_carry_progress_and_resume_after_a_sequence_number():
+    def run(job):
+        job.handle_event({'type': 'stage', 'stage': 'translate', 'total': 4})
+        job.handle_event({'type': 'reused', 'cells': 1})
+        job.handle_event({'type': 'chunk', 'cells': 3})
+        return {'ok': True}
+
+    manager = JobManager(max_workers=1)
+    job = manager.submit('translate', {}, run)
+    assert wait_until(lambda: job.finished)
+    events, finished = job.wait_events(0, timeout=0)
+    assert finished
+    assert [event['seq'] for event in events] == list(range(1, len(events) + 1))
+    assert [event['type'] for event in events] == ['status', 'stage', 'reused', 'chunk', 'status']
+    assert events[-1]['status'] == Job.COMPLETED and events[-1]['result'] == {'ok': True}
+    assert (events[3]['done'], events[3]['total'], events[3]['cache_hits']) == (4, 4, 1)
+    # 断线重连时只返回之后的事件
+    assert job.wait_events(3, timeout=0)[0] == events[3:]
+
+
+def test_waiting_for_events_wakes_up_on_a_new_event():
+    release = threading.Event()
+    manager = JobManager(max_workers=1)
+    job = manager.submit('translate', {}, blocking_job(release))
+    assert wait_until(lambda: job.status == Job.RUNNING)
+    seen = len(job.events)
+    started = time.monotonic()
+    events, finished = job.wait_events(seen, timeout=5)
+    assert events and not finished
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_tenant_at_its_limit_does_not_block_other_tenants():
+    release = threading.Event()
+    manager = JobManager(max_workers=2, max_jobs_per_tenant=1)
+    first = manager.submit('translate', {}, blocking_job(release), tenant='a')
+    second = manager.submit('translate', {}, blocking_job(release), tenant='a')
+    other = manager.submit('translate', {}, blocking_job(release), tenant='b')
+    assert wait_until(lambda: first.status == Job.RUNNING and other.status == Job.RUNNING)
+    time.sleep(0.1)
+    assert second.status == Job.QUEUED
+    assert manager.stats()['queued'] == 1
+    release.set()
+    assert wait_until(lambda: second.finished)
+    assert second.status == Job.COMPLETED
+    assert manager.running == {}
+
+
+def test_cancelled_job_frees_its_tenant_slot():
+    release = threading.Event()
+    manager = JobManager(max_workers=2, max_jobs_per_tenant=1)
+    first = manager.submit('translate', {}, blocking_job(release), tenant='a')
+    second = manager.submit('translate', {}, lambda job: {'ok': True}, tenant='a')
+    assert wait_until(lambda: first.status == Job.RUNNING)
+    manager.cancel(first.id)
+    assert wait_until(lambda: second.finished)
+    assert (first.status, second.status) == (Job.CANCELLED, Job.COMPLETED)
+
+
+def run_order(manager, costs, waited=None):
+    """一个任务占住唯一的工作线程时按 costs 提交任务，返回执行顺序；waited 为各任务已等待的秒数"""
+    release = threading.Event()
+    order = []
+    blocker = manager.submit('translate', {}, blocking_job(release))
+    assert wait_until(lambda: blocker.status == Job.RUNNING)
+    jobs = [manager.submit('translate', {'name': name}, lambda job: order.append(job.params['name']), cost=cost)
+            for name, cost in costs.items()]
+    for job in jobs:
+        job.created_at -= (waited or {}).get(job.params['name'], 0)
+    release.set()
+    assert wait_until(lambda: all(job.finished for job in jobs))
+    return order
+
+
+def test_smaller_jobs_run_first():
+    manager = JobManager(max_workers=1, aging_rate=0)
+    assert run_order(manager, {'large': 5000, 'small': 10, 'medium': 800}) == ['small', 'medium', 'large']
+
+
+def test_equal_jobs_run_in_submission_order():
+    manager = JobManager(max_workers=1, aging_rate=0)
+    assert run_order(manager, {'first': 100, 'second': 100, 'third': 100}) == ['first', 'second', 'third']
+
+
+def test_waiting_large_job_eventually_overtakes_new_small_jobs():
+    manager = JobManager(max_workers=1, aging_rate=200)
+    # 大任务已等待 30 秒，抵扣 6000 后优先于刚提交的小任务
+    order = run_order(manager, {'large': 5000, 'small': 10}, waited={'large': 30})
+    assert order == ['large', 'small']
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""metrics.py 的测试：计数器、直方图和 Prometheus 文本格式"""
+
+import pytest
+
+from metrics import MetricsRegistry, METRIC_PREFIX
+
+
+def test_counter_renders_one_sample_per_label_set():
+    registry = MetricsRegistry()
+    calls = registry.counter('calls_total', '调用次数', ('outcome',))
+    calls.inc(outcome='success')
+    calls.inc(2, outcome='success')
+    calls.inc(outcome='error')
+    assert calls.value(outcome='success') == 3
+    assert registry.render().splitlines() == [
+        f'# HELP {METRIC_PREFIX}calls_total 调用次数',
+        f'# TYPE {METRIC_PREFIX}calls_total counter',
+        f'{METRIC_PREFIX}calls_total{{outcome="error"}} 1',
+        f'{METRIC_PREFIX}calls_total{{outcome="success"}} 3',
+    ]
+
+
+def test_counter_rejects_decrements_and_wrong_labels():
+    counter = MetricsRegistry().counter('calls_total', '调用次数', ('outcome',))
+    with pytest.raises(ValueError):
+        counter.inc(-1, outcome='success')
+    with pytest.raises(ValueError):
+        counter.inc(stage='translate')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    seconds = registry.histogram('stage_seconds', '阶段耗时', ('stage',), buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        seconds.observe(value, stage='translate')
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        f'{METRIC_PREFIX}stage_seconds_bucket{{stage="translate",le="1"}} 1',
+        f'{METRIC_PREFIX}stage_seconds_bucket{{stage="translate",le="5"}} 2',
+        f'{METRIC_PREFIX}stage_seconds_bucket{{stage="translate",le="+Inf"}} 3',
+        f'{METRIC_PREFIX}stage_seconds_sum{{stage="translate"}} 12.5',
+        f'{METRIC_PREFIX}stage_seconds_count{{stage="translate"}} 3',
+    ]
+
+
+def test_histogram_times_blocks_that_raise():
+    histogram = MetricsRegistry().histogram('stage_seconds', '阶段耗时', ('stage',))
+    with pytest.raises(RuntimeError):
+        with histogram.time(stage='parse'):
+            raise RuntimeError('parse failed')
+    assert histogram.samples[('parse',)]['count'] == 1
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.gauge('info', '说明', ('name',)).set(1, name='a "b"\\c\nd')
+    assert registry.render().splitlines()[-1] == f'{METRIC_PREFIX}info{{name="a \\"b\\"\\\\c\\nd"}} 1'
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""watcher.py 的测试：防抖、文件过滤、失败和部分翻译的重试"""
+
+import os
+import time
+import threading
+
+from watcher import FolderWatcher, TranslationDaemon
+
+
+class FakeSession:
+    """按顺序返回预设状态的 CliSession 替身，completed / partial 时写出译文"""
+
+    file_workers = 1
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+        self.cancel_event = threading.Event()
+
+    def warm_up(self):
+        pass
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def close(self):
+        pass
+
+    def translate_file(self, input_file, output_file):
+        status = self.statuses[min(len(self.calls), len(self.statuses) - 1)]
+        self.calls.append(input_file)
+        if status == 'failed':
+            return {'file': input_file, 'output': output_file, 'status': 'failed', 'error': 'backend unavailable'}
+        with open(output_file, 'wb') as f:
+            f.write(b'translated')
+        return {'file': input_file, 'output': output_file, 'status': status}
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def run_daemon(session, input_dir, **kwargs):
+    daemon = TranslationDaemon(session, str(input_dir), debounce_seconds=0, poll_interval=0.02,
+                               retry_seconds=0.1, **kwargs)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=daemon.run, args=(stop_event,))
+    thread.start()
+    return daemon, stop_event, thread
+
+
+def write_file(path, content=b'workbook'):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_failed_translation_is_retried_on_a_later_poll(tmp_path):
+    write_file(tmp_path / 'report.xlsx')
+    session = FakeSession(['failed', 'completed'])
+    daemon, stop_event, thread = run_daemon(session, tmp_path)
+    try:
+        assert wait_until(lambda: len(session.calls) >= 2)
+        assert wait_until(lambda: daemon.counts['completed'] == 1)
+        time.sleep(0.3)
+        # 完整翻译后不再重试
+        assert len(session.calls) == 2
+        assert daemon.failures == {}
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def test_partial_translation_is_retried_although_output_is_newer(tmp_path):
+    write_file(tmp_path / 'report.xlsx')
+    session = FakeSession(['partial', 'completed'])
+    daemon, stop_event, thread = run_daemon(session, tmp_path)
+    try:
+        assert wait_until(lambda: daemon.counts['completed'] == 1)
+        assert daemon.counts['partial'] == 1
+        assert os.path.exists(tmp_path / 'report_translated.xlsx')
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def test_retry_delay_backs_off_and_is_capped(tmp_path):
+    write_file(tmp_path / 'report.xlsx')
+    session = FakeSession(['failed'])
+    daemon, stop_event, thread = run_daemon(session, tmp_path, max_retry_seconds=0.2)
+    try:
+        # 0.1 + 0.2 + 0.2 秒内至少重试 3 次，且不会在两次轮询之间连续重试
+        assert wait_until(lambda: len(session.calls) >= 4, timeout=3)
+        assert daemon.failures[str(tmp_path / 'report.xlsx')] >= 3
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def test_up_to_date_output_is_skipped_at_startup(tmp_path):
+    write_file(tmp_path / 'report.xlsx')
+    write_file(tmp_path / 'report_translated.xlsx')
+    session = FakeSession(['completed'])
+    daemon, stop_event, thread = run_daemon(session, tmp_path)
+    try:
+        assert wait_until(lambda: daemon.counts['skipped'] == 1)
+        assert session.calls == []
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def test_file_is_handed_over_only_after_it_stops_changing(tmp_path):
+    ready = []
+    watcher = FolderWatcher(str(tmp_path), ready.append, debounce_seconds=0.2, use_events=False)
+    path = tmp_path / 'report.xlsx'
+    write_file(path, b'part')
+    watcher.scan()
+    assert watcher._ready_files() == []
+    time.sleep(0.1)
+    write_file(path, b'part and more')
+    watcher.scan()
+    time.sleep(0.15)
+    # 第二次写入重新开始计时
+    assert watcher._ready_files() == []
+    time.sleep(0.1)
+    assert watcher._ready_files() == [str(path)]
+    # 未变化的文件不再交给 handler
+    watcher.scan()
+    time.sleep(0.25)
+    assert watcher._ready_files() == []
+
+
+def test_lock_hidden_and_translated_files_are_ignored(tmp_path):
+    for name in ('~$report.xlsx', '.report.xlsx.partial.xlsx', 'report_translated.xlsx', 'notes.txt'):
+        write_file(tmp_path / name)
+    watcher = FolderWatcher(str(tmp_path), lambda path: None, debounce_seconds=0, use_events=False)
+    watcher.scan()
+    assert watcher.pending == {}
+
+
+def test_deleted_file_is_dropped(tmp_path):
+    path = tmp_path / 'report.xlsx'
+    write_file(path)
+    watcher = FolderWatcher(str(tmp_path), lambda path: None, debounce_seconds=10, use_events=False)
+    watcher.scan()
+    assert str(path) in watcher.pending
+    os.remove(path)
+    watcher.scan()
+    assert watcher.pending == {}
+
+
+class BlockingSession(FakeSession):
+    """第一次翻译等待 release 后才完成"""
+
+    def __init__(self, release):
+        super().__init__(['completed'])
+        self.release = release
+
+    def translate_file(self, input_file, output_file):
+        if not self.calls:
+            self.release.wait(5)
+        return super().translate_file(input_file, output_file)
+
+
+def test_file_changed_during_translation_is_translated_again(tmp_path):
+    path = tmp_path / 'report.xlsx'
+    write_file(path)
+    release = threading.Event()
+    session = BlockingSession(release)
+    daemon, stop_event, thread = run_daemon(session, tmp_path)
+    try:
+        assert wait_until(lambda: str(path) in daemon.active)
+        write_file(path, b'workbook v2')
+        assert wait_until(lambda: daemon.active.get(str(path)) is True)
+        release.set()
+        # 译文比修改后的输入文件新，仍然重新翻译
+        assert wait_until(lambda: daemon.counts['completed'] == 2)
+        assert session.calls == [str(path)] * 2
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def test_output_path_keeps_the_input_subdirectories(tmp_path):
+    inputs, outputs = tmp_path / 'inputs', tmp_path / 'outputs'
+    daemon = TranslationDaemon(FakeSession(['completed']), str(inputs), str(outputs), recursive=True)
+    try:
+        assert daemon.output_path(str(inputs / 'q1' / 'report.xlsx')) == str(outputs / 'q1' / 'report_translated.xlsx')
+        # 未指定输出目录时与输入文件放在一起
+        daemon.output_dir = None
+        assert daemon.output_path(str(inputs / 'q1' / 'report.xlsx')) == str(inputs / 'q1' / 'report_translated.xlsx')
+    finally:
+        daemon.executor.shutdown()
+
+
+class UntilCancelledSession(FakeSession):
+    """翻译一直进行到会话被取消"""
+
+    def __init__(self):
+        super().__init__(['completed'])
+
+    def translate_file(self, input_file, output_file):
+        self.calls.append(input_file)
+        self.cancel_event.wait(10)
+        return {'file': input_file, 'output': output_file, 'status': 'cancelled'}
+
+
+def test_stopping_cancels_files_in_flight(tmp_path):
+    path = tmp_path / 'report.xlsx'
+    write_file(path)
+    session = UntilCancelledSession()
+    daemon, stop_event, thread = run_daemon(session, tmp_path)
+    assert wait_until(lambda: session.calls)
+    started = time.monotonic()
+    stop_event.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 5
+    assert daemon.counts['cancelled'] == 1
+    # 取消不算失败，不会安排重试
+    assert str(path) not in daemon.failures
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视目录
+持续监视输入目录，翻译新增或修改的 Excel 文件：安装了 watchdog 时接收系统文件事件（Linux 上为 inotify），
+否则定时扫描目录；文件在防抖时间内不再变化后才翻译，避免读到仍在复制中的文件
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from excel_translator import (CliSession, is_cli_input_file, output_is_current, translated_output_path,
+                              print_cli_result, EXIT_OK, WATCH_MEMORY_ENTRIES)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # 未安装 watchdog 时只定时扫描目录
+    Observer = None
+
+# 接收文件事件时，兜底全量扫描目录的间隔（秒），补上丢失的事件
+EVENT_RESCAN_SECONDS = 60
+
+# 翻译失败或只部分完成的文件重试的等待时间（秒）：每次失败翻倍，不超过上限
+RETRY_INITIAL_SECONDS = 30
+RETRY_MAX_SECONDS = 600
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """文件的 (大小, 修改时间)，文件不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _EventHandler:
+    """把 watchdog 的文件事件转交给 FolderWatcher"""
+
+    def __init__(self, watcher: 'FolderWatcher'):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        self.watcher.notify(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.watcher.notify(dest_path)
+
+
+class FolderWatcher:
+    """
+    目录监视器：文件新增或修改后，大小和修改时间在 debounce_seconds 内保持不变时调用 handler；
+    启动时目录中已有的文件也视为新文件。handler 在监视线程中调用，应尽快返回（如提交到线程池）；
+    处理失败的文件可通过 retry 稍后再次交给 handler
+    """
+
+    def __init__(self, directory: str, handler: Callable[[str], None], recursive: bool = False,
+                 debounce_seconds: float = 2.0, poll_interval: float = 1.0,
+                 accept: Callable[[str], bool] = is_cli_input_file, use_events: bool = True):
+        """
+        Args:
+            directory: 监视的目录
+            handler: 文件就绪时以文件路径调用
+            recursive: 是否包含子目录
+            debounce_seconds: 文件停止变化多久后才视为就绪（秒）
+            poll_interval: 检查就绪文件和扫描目录的间隔（秒）
+            accept: 过滤要监视的文件
+            use_events: 安装了 watchdog 时是否使用文件事件；否则每个 poll_interval 扫描一次目录
+        """
+        self.directory = directory
+        self.handler = handler
+        self.recursive = recursive
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.accept = accept
+        self.use_events = use_events and Observer is not None
+        self.seen = {}  # 已交给 handler 的文件 -> 当时的签名
+        self.pending = {}  # 等待就绪的文件 -> (签名, 最早交给 handler 的时间)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.thread = None
+
+    def start(self):
+        """开始监视"""
+        if self.use_events:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), self.directory, recursive=self.recursive)
+            self.observer.start()
+        self.thread = threading.Thread(target=self._run, name='folder-watcher', daemon=True)
+        self.thread.start()
+        logger.info(f"开始监视目录: {self.directory}（{'文件事件' if self.use_events else '定时扫描'}）")
+
+    def stop(self):
+        """停止监视，等待监视线程退出"""
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.thread is not None:
+            self.thread.join()
+
+    def notify(self, path: str):
+        """记录文件可能发生的变化（文件事件和目录扫描都经由这里）"""
+        if not self.accept(path):
+            return
+        signature = file_signature(path)
+        ready_at = time.monotonic() + self.debounce_seconds
+        with self.lock:
+            if signature is None:
+                # 文件已删除或移走
+                self.pending.pop(path, None)
+                self.seen.pop(path, None)
+            elif path in self.pending:
+                if self.pending[path][0] != signature:
+                    self.pending[path] = (signature, ready_at)
+            elif self.seen.get(path) != signature:
+                self.pending[path] = (signature, ready_at)
+
+    def retry(self, path: str, delay: float):
+        """
+        delay 秒后再次把文件交给 handler（文件在此期间变化时按变化处理，防抖后即交给 handler）
+
+        Args:
+            path: 文件路径
+            delay: 等待时间（秒）
+        """
+        signature = file_signature(path)
+        with self.lock:
+            self.seen.pop(path, None)
+            if signature is not None and path not in self.pending:
+                self.pending[path] = (signature, time.monotonic() + delay)
+
+    def scan(self):
+        """扫描目录中的所有文件"""
+        if self.recursive:
+            paths = [os.path.join(directory, name) for directory, _, names in os.walk(self.directory)
+                     for name in names]
+        else:
+            paths = [entry.path for entry in os.scandir(self.directory) if entry.is_file()]
+        for path in paths:
+            self.notify(path)
+        # 扫描时已不存在的文件不再跟踪
+        existing = set(paths)
+        with self.lock:
+            missing = [path for path in list(self.seen) + list(self.pending) if path not in existing]
+        for path in missing:
+            self.notify(path)
+
+    def _ready_files(self):
+        """取出已停止变化的文件"""
+        now = time.monotonic()
+        ready = []
+        with self.lock:
+            for path, (signature, ready_at) in list(self.pending.items()):
+                if now < ready_at:
+                    continue
+                current = file_signature(path)
+                if current is None:
+                    del self.pending[path]
+                elif current != signature:
+                    self.pending[path] = (current, now + self.debounce_seconds)
+                else:
+                    del self.pending[path]
+                    self.seen[path] = signature
+                    ready.append(path)
+        return ready
+
+    def _run(self):
+        last_scan = None
+        while not self.stop_event.is_set():
+            if not self.use_events or last_scan is None or time.monotonic() - last_scan >= EVENT_RESCAN_SECONDS:
+                try:
+                    self.scan()
+                except OSError as e:
+                    logger.warning(f"扫描监视目录失败: {str(e)}")
+                last_scan = time.monotonic()
+            for path in self._ready_files():
+                try:
+                    self.handler(path)
+                except Exception as e:
+                    logger.error(f"处理文件 {path} 时出错: {str(e)}")
+            self.stop_event.wait(self.poll_interval)
+
+
+class TranslationDaemon:
+    """
+    监视模式：FolderWatcher 发现的文件交给线程池翻译，所有文件共享同一 CliSession
+    （客户端、限流状态、译文缓存、术语库和进程池在文件之间保持）；
+    正在翻译的文件再次变化时，当前翻译结束后重新翻译；翻译失败或只部分完成的文件（如接口故障、
+    超时）按指数退避重试，直到完整翻译
+    """
+
+    def __init__(self, session: CliSession, input_dir: str, output_dir: Optional[str] = None,
+                 recursive: bool = False, debounce_seconds: float = 2.0, poll_interval: float = 1.0,
+                 retry_seconds: float = RETRY_INITIAL_SECONDS, max_retry_seconds: float = RETRY_MAX_SECONDS):
+        """
+        Args:
+            session: 共享状态
+            input_dir: 监视的输入目录
+            output_dir: 输出目录，保留输入目录的子目录结构；None 表示译文与输入文件放在一起
+            recursive: 是否监视子目录
+            debounce_seconds: 文件停止变化多久后才翻译（秒）
+            poll_interval: 检查就绪文件和扫描目录的间隔（秒）
+            retry_seconds: 第一次重试前的等待时间（秒），之后每次翻倍
+            max_retry_seconds: 重试等待时间的上限（秒）
+        """
+        self.session = session
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=session.file_workers, thread_name_prefix='watch-file')
+        self.watcher = FolderWatcher(input_dir, self.enqueue, recursive=recursive,
+                                     debounce_seconds=debounce_seconds, poll_interval=poll_interval)
+        self.lock = threading.Lock()
+        self.active = {}  # 正在翻译的文件 -> 翻译期间是否再次变化
+        self.failures = {}  # 未能完整翻译的文件 -> 连续失败次数
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.counts = dict.fromkeys(('completed', 'partial', 'failed', 'skipped', 'cancelled'), 0)
+
+    def output_path(self, input_file: str) -> str:
+        """输入文件的译文路径"""
+        relative_path = os.path.relpath(input_file, self.input_dir) if self.output_dir else None
+        return translated_output_path(input_file, self.output_dir, relative_path)
+
+    def enqueue(self, input_file: str, force: bool = False):
+        """
+        提交翻译；文件正在翻译时记下，结束后重新翻译
+
+        Args:
+            input_file: 输入文件
+            force: 即使译文比输入文件新也重新翻译（翻译期间输入文件再次变化时）
+        """
+        with self.lock:
+            if input_file in self.active:
+                self.active[input_file] = True
+                return
+            self.active[input_file] = False
+        self.executor.submit(self._translate, input_file, force)
+
+    def _translate(self, input_file: str, force: bool):
+        output_file = self.output_path(input_file)
+        with self.lock:
+            # 部分翻译的译文比输入文件新，重试时不能跳过
+            force = force or input_file in self.failures
+        try:
+            if not force and output_is_current(input_file, output_file):
+                result = {'file': input_file, 'output': output_file, 'status': 'skipped'}
+            else:
+                result = self.session.translate_file(input_file, output_file)
+        except Exception as e:
+            result = {'file': input_file, 'output': output_file, 'status': 'failed', 'error': str(e)}
+        with self.lock:
+            self.counts[result['status']] += 1
+            changed = self.active.pop(input_file)
+            # 停止时取消的文件不算失败，下次启动时从任务日志继续
+            if result['status'] in ('failed', 'partial'):
+                attempts = self.failures[input_file] = self.failures.get(input_file, 0) + 1
+            else:
+                self.failures.pop(input_file, None)
+                attempts = 0
+        if result['status'] != 'skipped':
+            print_cli_result(result)
+        if self.watcher.stop_event.is_set():
+            return
+        if changed:
+            self.enqueue(input_file, force=True)
+        elif attempts:
+            delay = min(self.retry_seconds * 2 ** (attempts - 1), self.max_retry_seconds)
+            logger.warning(f"{input_file} 未能完整翻译（第 {attempts} 次），{delay:g} 秒后重试")
+            self.watcher.retry(input_file, delay)
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> Dict:
+        """
+        监视并翻译，直到 stop_event 被设置（或 Ctrl+C）；停止时取消正在翻译的文件（当前块完成后停止，
+        已完成的块保存在任务日志中，下次启动时继续），等待它们退出
+
+        Returns:
+            Dict: 各状态的文件数
+        """
+        stop_event = stop_event or threading.Event()
+        self.session.warm_up()
+        self.watcher.start()
+        try:
+            while not stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info("正在停止监视，取消正在翻译的文件")
+            self.watcher.stop()
+            self.session.cancel()
+            self.executor.shutdown(wait=True)
+            self.session.close()
+        return dict(self.counts)
+
+
+def run_watch(args: argparse.Namespace) -> int:
+    """
+    命令行监视模式的入口（excel_translator.py --watch），SIGTERM 时正常停止
+
+    Returns:
+        int: 退出码
+    """
+    session = CliSession(args, max(1, args.file_workers), file_time_limit=args.time_limit,
+                         memory_entries=WATCH_MEMORY_ENTRIES)
+    daemon = TranslationDaemon(session, args.inputs[0], args.output_dir, recursive=args.recursive,
+                               debounce_seconds=args.debounce, poll_interval=args.poll_interval)
+    stop_event = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    print(f"正在监视 {args.inputs[0]}，按 Ctrl+C 停止", flush=True)
+    counts = daemon.run(stop_event)
+    print(f"已停止：完成 {counts['completed']}，部分 {counts['partial']}，失败 {counts['failed']}，"
+          f"跳过 {counts['skipped']}，取消 {counts['cancelled']}", file=sys.stderr)
+    return EXIT_OK